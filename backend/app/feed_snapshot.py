@@ -0,0 +1,139 @@
+"""
+In-memory hot feed snapshot for anonymous traffic
+Each worker keeps an immutable snapshot of the first pages of the public feed,
+already encoded as JSON bytes. A background task rebuilds it and swaps the
+reference in one assignment (copy-on-write), so readers never see a partial
+snapshot and serving a page needs no Redis or database I/O.
+"""
+import asyncio
+import json
+import os
+import time
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple, Mapping
+
+from fastapi.encoders import jsonable_encoder
+
+from .db import db
+from .models import VideoMetadata
+
+# Number of pages (of SNAPSHOT_PAGE_SIZE videos) kept per worker
+SNAPSHOT_PAGES = int(os.getenv("FEED_SNAPSHOT_PAGES", "5"))
+SNAPSHOT_PAGE_SIZE = int(os.getenv("FEED_SNAPSHOT_PAGE_SIZE", "20"))
+
+# How often the snapshot is rebuilt, and how old it may get before requests
+# stop using it (e.g. if the database is down and refreshes keep failing)
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("FEED_SNAPSHOT_REFRESH_SECONDS", "15"))
+SNAPSHOT_MAX_STALENESS = float(os.getenv("FEED_SNAPSHOT_MAX_STALENESS", "60"))
+
+
+class Snapshot:
+    """One immutable generation of the public feed"""
+    __slots__ = ("built_at", "pages", "videos")
+
+    def __init__(self, built_at: float, pages: Mapping[Tuple[int, int], bytes], videos: Tuple[bytes, ...]):
+        self.built_at = built_at
+        self.pages = pages      # (limit, offset) -> encoded page
+        self.videos = videos    # encoded single videos, feed order
+
+
+EMPTY_SNAPSHOT = Snapshot(0.0, MappingProxyType({}), ())
+
+
+def _to_metadata(video: Dict) -> VideoMetadata:
+    user_data = video.get("users") or {}
+    return VideoMetadata(
+        id=video["id"],
+        user_id=video["user_id"],
+        title=video["title"],
+        description=video.get("description"),
+        video_url=video["video_url"],
+        thumbnail_url=video.get("thumbnail_url"),
+        hashtags=video.get("hashtags", []),
+        views_count=video.get("views_count", 0),
+        likes_count=video.get("likes_count", 0),
+        comments_count=video.get("comments_count", 0),
+        shares_count=video.get("shares_count", 0),
+        created_at=video["created_at"],
+        username=user_data.get("username"),
+        avatar_url=user_data.get("avatar_url")
+    )
+
+
+def build_snapshot(videos: List[Dict], page_size: int = SNAPSHOT_PAGE_SIZE) -> Snapshot:
+    """Encode feed rows into a new snapshot (one JSON fragment per video, joined per page)"""
+    encoded = tuple(
+        json.dumps(jsonable_encoder(_to_metadata(video)), separators=(",", ":")).encode()
+        for video in videos
+    )
+    pages = {
+        (page_size, offset): b"[" + b",".join(encoded[offset:offset + page_size]) + b"]"
+        for offset in range(0, len(encoded), page_size)
+    }
+    return Snapshot(time.monotonic(), MappingProxyType(pages), encoded)
+
+
+class FeedSnapshot:
+    def __init__(self):
+        self.snapshot = EMPTY_SNAPSHOT
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def get(self, limit: int, offset: int) -> Optional[bytes]:
+        """
+        Get an encoded public feed page, or None if it isn't in the snapshot
+        (too deep, or the snapshot is older than SNAPSHOT_MAX_STALENESS)
+        """
+        snapshot = self.snapshot  # single read; a concurrent swap can't tear it
+        if time.monotonic() - snapshot.built_at > SNAPSHOT_MAX_STALENESS:
+            self.stats["misses"] += 1
+            return None
+
+        page = snapshot.pages.get((limit, offset))
+        if page is None:
+            # Other page sizes: join pre-encoded videos if the window is fully covered
+            if offset + limit > len(snapshot.videos) or limit <= 0 or offset < 0:
+                self.stats["misses"] += 1
+                return None
+            page = b"[" + b",".join(snapshot.videos[offset:offset + limit]) + b"]"
+
+        self.stats["hits"] += 1
+        return page
+
+    async def refresh(self):
+        """Rebuild the snapshot from the database and swap it in"""
+        videos = await asyncio.to_thread(db.get_videos_feed, SNAPSHOT_PAGES * SNAPSHOT_PAGE_SIZE, 0)
+        if not videos:
+            return  # Keep serving the previous generation until it goes stale
+        self.snapshot = build_snapshot(videos)
+        self.stats["refreshes"] += 1
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                print(f"⚠️  Feed snapshot refresh failed: {e}")
+            await asyncio.sleep(SNAPSHOT_REFRESH_SECONDS)
+
+    def start(self):
+        """Start background refreshes"""
+        if self.refresh_task is None:
+            self.refresh_task = asyncio.create_task(self._refresh_loop())
+            print(f"📸 Feed snapshot started ({SNAPSHOT_PAGES} pages, refresh every {SNAPSHOT_REFRESH_SECONDS:g}s)")
+
+    async def stop(self):
+        """Stop background refreshes"""
+        if self.refresh_task:
+            self.refresh_task.cancel()
+            try:
+                await self.refresh_task
+            except asyncio.CancelledError:
+                pass
+            self.refresh_task = None
+            print("📸 Feed snapshot stopped")
+
+
+# Global instance (one per worker process)
+feed_snapshot = FeedSnapshot()
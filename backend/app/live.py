@@ -10,6 +10,8 @@ from .models import (
 )
 from .db import db, supabase
 from .auth import get_current_user
+from .websocket_manager import live_manager
+from .live_counters import SessionFull, live_counters
 
 router = APIRouter(prefix="/live", tags=["Live Streaming"])
 
@@ -50,6 +52,7 @@ async def start_live_session(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create live session"
             )
+        await live_counters.set_capacity(session_id, session_data.max_participants)
         
         return LiveSession(
             id=created_session["id"],
@@ -103,21 +106,16 @@ async def join_live_session(
                 detail="Live session is not active"
             )
         
-        # Check participant limit
-        current_viewers = session_data.get("viewer_count", 0)
+        # Check participant limit (counted on the WebSocket join, see live_counters)
         max_participants = session_data.get("max_participants", 50)
-        
-        if current_viewers >= max_participants:
+        try:
+            current_viewers = await live_counters.check_capacity(join_request.session_id, max_participants)
+        except SessionFull:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Live session is at maximum capacity"
             )
         
-        # Increment viewer count
-        supabase.table("live_sessions").update({
-            "viewer_count": current_viewers + 1
-        }).eq("id", join_request.session_id).execute()
-        
         # Generate WebRTC configuration
         # TODO: Integrate with LiveKit/Janus for actual WebRTC config
         webrtc_config = {
@@ -190,6 +188,9 @@ async def end_live_session(
             "ended_at": datetime.utcnow().isoformat()
         })
         
+        # Write buffered chat, disconnect participants on every node and write final viewer counts
+        await live_manager.handle_session_ended(session_id)
+        
         return {"message": "Live session ended successfully"}
     
     except HTTPException:
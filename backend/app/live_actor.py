@@ -0,0 +1,109 @@
+"""
+One actor per active live session
+Every mutation of a session's state (participants, roles, slow mode, batchers)
+runs as a command on that session's actor: a single task draining an inbox
+queue, so a multi-step handler such as a kick or a guest approval is never
+interleaved with another command for the same session. Batch timers (chat,
+reactions, ICE candidates) are scheduled through the actor too, so flushes are
+ordered with the commands around them and go away with the session.
+
+Commands issued from inside the actor (e.g. handle_session_ended leaving each
+participant) run inline. Sync commands run inline when nothing is in flight,
+since they cannot yield; otherwise they are queued behind the current command.
+"""
+import asyncio
+import inspect
+from typing import Any, Callable, Optional
+
+
+class SessionActor:
+    """Runs one session's commands in order on a single task"""
+
+    def __init__(self, session_id: str, on_idle: Optional[Callable[[], None]] = None):
+        self.session_id = session_id
+        self.on_idle = on_idle  # Called whenever a command finishes with nothing queued
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.current: Optional[Callable] = None  # Command being run, if any
+        self.closed = False
+        self.stats = {"commands": 0, "inline": 0, "errors": 0}
+        self.task = asyncio.create_task(self._run())
+
+    def _in_actor(self) -> bool:
+        return asyncio.current_task() is self.task
+
+    def idle(self) -> bool:
+        """Nothing running and nothing queued"""
+        return self.current is None and self.inbox.empty()
+
+    async def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a command in order and return its result (inline if already on the actor)"""
+        if self._in_actor() or self.task.done():
+            result = fn(*args, **kwargs)
+            return await result if inspect.isawaitable(result) else result
+
+        future = asyncio.get_running_loop().create_future()
+        self.inbox.put_nowait((fn, args, kwargs, future))
+        return await future
+
+    def submit(self, fn: Callable, *args):
+        """Run a sync command now if that keeps the order, otherwise queue it"""
+        if self._in_actor() or self.idle():
+            self.stats["inline"] += 1
+            fn(*args)
+        else:
+            self.inbox.put_nowait((fn, args, {}, None))
+
+    def call_later(self, delay: float, fn: Callable, *args) -> asyncio.TimerHandle:
+        """Timer whose callback runs as a command (cancel with the returned handle)"""
+        return asyncio.get_running_loop().call_later(delay, self.submit, fn, *args)
+
+    async def _run(self):
+        while not (self.closed and self.inbox.empty()):
+            command = await self.inbox.get()
+            if command is None:
+                continue  # Wake-up from close()
+            fn, args, kwargs, future = command
+            if future is not None and future.cancelled():
+                continue  # Caller went away (e.g. its socket handler was cancelled)
+
+            self.current = fn
+            self.stats["commands"] += 1
+            try:
+                result = fn(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+                if future is not None and not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                if future is not None and not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                if future is not None and not future.done():
+                    future.set_exception(e)
+                else:
+                    print(f"⚠️ Live session {self.session_id} command {getattr(fn, '__name__', fn)} failed: {e}")
+            finally:
+                self.current = None
+            if self.on_idle and self.inbox.empty():
+                self.on_idle()
+
+    def close(self):
+        """Finish what is queued, then stop (the session has emptied)"""
+        self.closed = True
+        if not self._in_actor():
+            self.inbox.put_nowait(None)
+
+    async def stop(self):
+        """Cancel the actor outright (app shutdown); queued callers are cancelled"""
+        self.closed = True
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        while not self.inbox.empty():
+            command = self.inbox.get_nowait()
+            if command is not None and command[3] is not None:
+                command[3].cancel()
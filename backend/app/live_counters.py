@@ -0,0 +1,307 @@
+"""
+Live viewer and guest counters, kept in Redis instead of live_sessions
+The REST joins used to read viewer_count, add one and write it back (racing
+with each other and never decremented), with a trigger recomputing
+peak_viewers on every update. Counts now follow the WebSocket sessions:
+- a WebSocket join runs the capacity check, the increment and the peak update
+  as one Redis script, so concurrent joins can't overshoot max_participants
+- leaving (and guest promotions) adjust the counters from a background worker;
+  when its queue is full the change is applied right away instead, never dropped
+- live_sessions gets viewer_count / guest_count / peak_viewers every
+  LIVE_COUNTER_FLUSH_SECONDS for sessions that changed, and once more at the end
+- each node's share of a session's counts is kept in a key it refreshes while
+  it has participants there; a node that crashes stops refreshing it, and its
+  viewers are dropped on the next reconcile (or when they would fill the session)
+- an ended session is tombstoned: late leaves and flushes skip it instead of
+  recreating its counters and writing zeros over the final counts
+
+Without Redis the counters are kept per process.
+"""
+import asyncio
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Set
+
+from .db import supabase
+
+try:
+    from .redis_cache import cache
+    HAS_REDIS_CACHE = True
+except ImportError:
+    HAS_REDIS_CACHE = False
+
+# Changed sessions are written to live_sessions this often
+LIVE_COUNTER_FLUSH_SECONDS = float(os.getenv("LIVE_COUNTER_FLUSH_SECONDS", "5"))
+
+# Counters of sessions nobody ended expire after this long without a join/leave
+LIVE_COUNTER_TTL = int(os.getenv("LIVE_COUNTER_TTL_SECONDS", "86400"))
+
+# A node's share of the counts is dropped when it hasn't refreshed it for this long
+LIVE_COUNTER_NODE_TTL = int(os.getenv("LIVE_COUNTER_NODE_TTL_SECONDS", "60"))
+
+LIVE_COUNTER_QUEUE_SIZE = int(os.getenv("LIVE_COUNTER_QUEUE_SIZE", "10000"))
+
+# Counted in guest_count (same roles as the update_guest_count trigger)
+GUEST_ROLES = {"guest", "cohost"}
+
+
+class SessionFull(Exception):
+    """The session is at max_participants"""
+
+
+class LiveCounters:
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self.local: Dict[str, Dict[str, int]] = {}  # Counters without Redis
+        self.joined: Dict[str, int] = {}  # Viewers this node counted per session (its share to refresh)
+        self.ended: Dict[str, float] = {}  # Ended sessions (monotonic end time), never counted again
+        self.events: asyncio.Queue = asyncio.Queue(maxsize=LIVE_COUNTER_QUEUE_SIZE)
+        self.dirty: Set[str] = set()
+        self.worker_task: Optional[asyncio.Task] = None
+        # Changes that didn't fit in the queue, being applied directly
+        self.overflow: Set[asyncio.Task] = set()
+        # Held while applying changes, so end_session's final drain doesn't interleave with the worker
+        self.lock = asyncio.Lock()
+        self.stats = {"joins": 0, "rejected_full": 0, "leaves": 0, "rows_written": 0, "overflowed": 0,
+                      "reconciled": 0}
+
+    @property
+    def redis_enabled(self) -> bool:
+        return HAS_REDIS_CACHE and cache.enabled
+
+    def _counts(self, session_id: str) -> Dict[str, int]:
+        counts = self.local.get(session_id)
+        if counts is None:
+            counts = self.local[session_id] = {"viewers": 0, "guests": 0, "peak": 0, "capacity": 0}
+        return counts
+
+    def _adjust_local(self, session_id: str, field: str, delta: int):
+        counts = self._counts(session_id)
+        counts[field] = max(0, counts[field] + delta)
+
+    # === Called on join / leave ===
+
+    async def set_capacity(self, session_id: str, capacity: int):
+        """Record max_participants for the atomic join check"""
+        self._counts(session_id)["capacity"] = capacity or 0
+        if self.redis_enabled:
+            await cache.live_counter_set_capacity(session_id, capacity or 0, LIVE_COUNTER_TTL)
+
+    async def try_join(self, session_id: str, guest: bool = False) -> int:
+        """Count a WebSocket join; raises SessionFull if the session is at capacity (0: ended, not counted)"""
+        if session_id in self.ended:
+            return 0
+
+        viewers = None
+        if self.redis_enabled:
+            viewers = await cache.live_counter_join(
+                session_id, guest, self.node_id, LIVE_COUNTER_TTL, LIVE_COUNTER_NODE_TTL
+            )
+            if viewers == -2:
+                return 0  # Ended on another node
+
+        if viewers is None:
+            counts = self._counts(session_id)
+            if counts["capacity"] and counts["viewers"] >= counts["capacity"]:
+                viewers = -1
+            else:
+                counts["viewers"] += 1
+                counts["guests"] += 1 if guest else 0
+                counts["peak"] = max(counts["peak"], counts["viewers"])
+                viewers = counts["viewers"]
+
+        if viewers < 0:
+            self.stats["rejected_full"] += 1
+            raise SessionFull(session_id)
+
+        self.stats["joins"] += 1
+        self.joined[session_id] = self.joined.get(session_id, 0) + 1
+        self.dirty.add(session_id)
+        return viewers
+
+    def _put(self, session_id: str, field: str, delta: int):
+        if session_id in self.ended:
+            return
+        self.dirty.add(session_id)
+        if not self.redis_enabled:
+            self._adjust_local(session_id, field, delta)
+            return
+        try:
+            self.events.put_nowait((session_id, field, delta))
+        except asyncio.QueueFull:
+            # Dropping a decrement would leave the counters high for good
+            self.stats["overflowed"] += 1
+            task = asyncio.create_task(self._apply_locked(session_id, field, delta))
+            self.overflow.add(task)
+            task.add_done_callback(self.overflow.discard)
+
+    def leave(self, session_id: str, guest: bool = False):
+        """A WebSocket participant left (never blocks)"""
+        self.stats["leaves"] += 1
+        joined = self.joined.get(session_id, 0) - 1
+        if joined > 0:
+            self.joined[session_id] = joined
+        else:
+            self.joined.pop(session_id, None)
+        self._put(session_id, "viewers", -1)
+        if guest:
+            self._put(session_id, "guests", -1)
+
+    def guest_changed(self, session_id: str, delta: int):
+        """A participant became (+1) or stopped being (-1) a guest/cohost"""
+        self._put(session_id, "guests", delta)
+
+    # === Reads ===
+
+    async def get(self, session_id: str) -> Dict[str, int]:
+        return (await self.get_many([session_id]))[session_id]
+
+    async def _raw_counts(self, session_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Stored counters per session ({} for sessions never counted)"""
+        counts = None
+        if self.redis_enabled and session_ids:
+            counts = await cache.live_counters_get(session_ids)
+        if counts is None:
+            counts = {session_id: dict(self.local.get(session_id, {})) for session_id in session_ids}
+        return counts
+
+    async def get_many(self, session_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        counts = await self._raw_counts(session_ids)
+        return {
+            session_id: {field: counts[session_id].get(field, 0) for field in ("viewers", "guests", "peak", "capacity")}
+            for session_id in session_ids
+        }
+
+    async def check_capacity(self, session_id: str, capacity: int) -> int:
+        """REST pre-check: current viewers, or SessionFull (the WebSocket join is the atomic one)"""
+        counts = await self.get(session_id)
+        if capacity and not counts["capacity"]:
+            # Set when the session started; only missing for counters that expired or predate it
+            await self.set_capacity(session_id, capacity)
+        viewers = counts["viewers"]
+        if capacity and viewers >= capacity:
+            self.stats["rejected_full"] += 1
+            raise SessionFull(session_id)
+        return viewers
+
+    # === Background writer ===
+
+    async def _apply(self, session_id: str, field: str, delta: int):
+        adjusted = await cache.live_counter_adjust(
+            session_id, field, delta, self.node_id, LIVE_COUNTER_TTL, LIVE_COUNTER_NODE_TTL
+        )
+        if adjusted is None:
+            self._adjust_local(session_id, field, delta)
+
+    async def _apply_locked(self, session_id: str, field: str, delta: int):
+        try:
+            async with self.lock:
+                await self._apply(session_id, field, delta)
+        except Exception as e:
+            print(f"⚠️  Live counter update failed: {e}")
+
+    async def _apply_pending(self):
+        async with self.lock:
+            while not self.events.empty():
+                await self._apply(*self.events.get_nowait())
+
+    async def flush(self, session_ids: Optional[List[str]] = None):
+        """Write counters of changed sessions to live_sessions"""
+        if session_ids is None:
+            session_ids, self.dirty = [s for s in self.dirty if s not in self.ended], set()
+        else:
+            self.dirty.difference_update(session_ids)
+        if not session_ids:
+            return
+
+        for session_id, counts in (await self._raw_counts(session_ids)).items():
+            if "viewers" not in counts:
+                continue  # Never joined over WebSocket here: leave the row as it is
+            try:
+                await asyncio.to_thread(self._write_counts, session_id, counts)
+                self.stats["rows_written"] += 1
+            except Exception as e:
+                print(f"⚠️  Live counter write failed for {session_id}: {e}")
+
+    async def end_session(self, session_id: str):
+        """Final write for an ended session, then forget its counters and tombstone it"""
+        if session_id in self.ended:
+            return
+        if self.overflow:
+            await asyncio.gather(*self.overflow)
+        await self._apply_pending()
+        await self.flush([session_id])
+
+        now = time.monotonic()
+        for ended_id in [s for s, ended_at in self.ended.items() if now - ended_at > LIVE_COUNTER_TTL]:
+            del self.ended[ended_id]
+        self.ended[session_id] = now
+        self.local.pop(session_id, None)
+        self.joined.pop(session_id, None)
+        if self.redis_enabled:
+            await cache.live_counter_end(session_id, self.node_id, LIVE_COUNTER_TTL)
+
+    async def reconcile(self):
+        """Refresh this node's share of its sessions' counts and drop the shares of nodes that went away"""
+        if not self.redis_enabled or not self.joined:
+            return
+        dropped = await cache.live_counters_reconcile(list(self.joined), self.node_id, LIVE_COUNTER_NODE_TTL)
+        for session_id, viewers in (dropped or {}).items():
+            if viewers:
+                self.stats["reconciled"] += viewers
+                self.dirty.add(session_id)
+
+    async def _worker(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                try:
+                    event = await asyncio.wait_for(self.events.get(), LIVE_COUNTER_FLUSH_SECONDS)
+                    async with self.lock:
+                        await self._apply(*event)
+                except asyncio.TimeoutError:
+                    pass
+
+                if time.monotonic() - last_flush >= LIVE_COUNTER_FLUSH_SECONDS:
+                    last_flush = time.monotonic()
+                    await self.reconcile()
+                    await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Live counter update failed: {e}")
+
+    def start(self):
+        """Start the background counter writer"""
+        if self.worker_task is None:
+            self.worker_task = asyncio.create_task(self._worker())
+            print(f"🔢 Live counters started ({'Redis' if self.redis_enabled else 'local only'})")
+
+    async def stop(self):
+        """Apply pending changes, write changed sessions and stop the writer"""
+        if self.worker_task:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+        if self.overflow:
+            await asyncio.gather(*self.overflow)
+        if self.redis_enabled:
+            await self._apply_pending()
+        await self.flush()
+
+    # === Database helpers (blocking, run in a thread) ===
+
+    @staticmethod
+    def _write_counts(session_id: str, counts: Dict[str, int]):
+        values = {"viewer_count": counts.get("viewers", 0), "guest_count": counts.get("guests", 0)}
+        if "peak" in counts:
+            values["peak_viewers"] = counts["peak"]  # Only set by joins: a hash without it never saw one
+        supabase.table("live_sessions").update(values).eq("id", session_id).execute()
+
+
+# Global instance (one per worker process)
+live_counters = LiveCounters()
@@ -20,6 +20,9 @@ import json
 from .models import *
 from .db import supabase
 from .auth import get_current_user
+from .websocket_manager import live_manager
+from .live_events import chat_store, CHAT_MESSAGE_TYPES
+from .live_counters import SessionFull, live_counters
 
 router = APIRouter(prefix="/live", tags=["Live Streaming - Multi-Guest"])
 
@@ -81,6 +84,7 @@ async def start_live_session(
             raise HTTPException(status_code=500, detail="Failed to create session")
         
         session = session_result.data[0]
+        await live_counters.set_capacity(session_id, session_data.max_participants)
         
         # Create session settings
         supabase.table("live_session_settings").insert({
@@ -150,16 +154,12 @@ async def join_live_session(
         if session["status"] != "active":
             raise HTTPException(status_code=400, detail="Session is not active")
         
-        # Check capacity
-        if session["viewer_count"] >= session["max_participants"]:
+        # Check capacity (viewers are counted on the WebSocket join, see live_counters)
+        try:
+            await live_counters.check_capacity(join_request.session_id, session["max_participants"])
+        except SessionFull:
             raise HTTPException(status_code=400, detail="Session is full")
         
-        # Update viewer count
-        new_count = session["viewer_count"] + 1
-        supabase.table("live_sessions").update({
-            "viewer_count": new_count
-        }).eq("id", join_request.session_id).execute()
-        
         # Add as participant (viewer)
         supabase.table("live_participants").insert({
             "session_id": join_request.session_id,
@@ -225,6 +225,9 @@ async def end_live_session(
             "left_at": datetime.utcnow().isoformat()
         }).eq("session_id", session_id).execute()
         
+        # Write buffered chat, disconnect participants on every node and write final viewer counts
+        await live_manager.handle_session_ended(session_id)
+        
         print(f"🛑 Live session ended: {session_id}")
         
         return {
@@ -516,20 +519,24 @@ async def send_chat_message(
     message_data: ChatMessage,
     current_user: dict = Depends(get_current_user)
 ):
-    """Send a chat message in live session"""
+    """Send a chat message in live session (persisted in the next bulk insert)"""
+    # Checked here: a bad row would fail the whole session's bulk insert
+    if (message_data.message_type or "text") not in CHAT_MESSAGE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid message_type: {message_data.message_type}")
+    
     try:
-        result = supabase.table("live_chat_messages").insert({
-            "session_id": message_data.session_id,
-            "user_id": current_user["id"],
-            "message": message_data.message,
-            "message_type": message_data.message_type or "text",
-            "metadata": message_data.metadata
-        }).execute()
+        row = chat_store.record(
+            message_data.session_id,
+            current_user["id"],
+            message_data.message,
+            message_data.message_type or "text",
+            message_data.metadata
+        )
         
         return {
-            "id": result.data[0]["id"],
+            "id": row["id"],
             "message": "Message sent",
-            "created_at": result.data[0]["created_at"]
+            "created_at": row["created_at"]
         }
         
     except Exception as e:
@@ -677,11 +684,9 @@ async def send_reaction(
 ):
     """Send a reaction (heart, emoji) during live"""
     try:
-        supabase.table("live_reactions").insert({
-            "session_id": reaction_data.session_id,
-            "user_id": current_user["id"],
-            "reaction_type": reaction_data.reaction_type
-        }).execute()
+        # Counted into the session's reaction_summary and per-minute totals
+        # (no row per tap; see migrations/004_live_reaction_counts.sql)
+        live_manager.record_reaction(reaction_data.session_id, reaction_data.reaction_type)
         
         return {"message": "Reaction sent", "reaction_type": reaction_data.reaction_type}
         
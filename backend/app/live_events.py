@@ -0,0 +1,536 @@
+"""
+High-frequency live session events, batched before fan-out
+Chat in a busy session arrives faster than viewers can read or render it, so
+messages are collected per session and sent as one chat_batch frame per short
+window instead of one frame per message. Reactions are only counted: viewers
+get periodic reaction_summary frames, and the database gets per-minute totals
+instead of one row per tap. Chat is persisted write-behind: rows are buffered
+per session and bulk-inserted into live_chat_messages. The last few chat
+batches are also kept in memory per session (SessionHistory) so joining and
+reconnecting viewers get recent chat with their snapshot instead of querying
+the database.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .db import supabase
+from .ws_connection import Frame
+
+# A batch is sent after this window, or as soon as it holds CHAT_BATCH_MAX_MESSAGES
+CHAT_BATCH_WINDOW_MS = int(os.getenv("LIVE_CHAT_BATCH_WINDOW_MS", "100"))
+CHAT_BATCH_MAX_MESSAGES = int(os.getenv("LIVE_CHAT_BATCH_MAX_MESSAGES", "50"))
+
+# Messages per second per session a client can reasonably render. Beyond it,
+# messages are sampled (kept with CHAT_OVERFLOW_SAMPLE_RATE, 0 = drop all);
+# host/cohost messages are always kept.
+CHAT_MAX_PER_SECOND = int(os.getenv("LIVE_CHAT_MAX_PER_SECOND", "60"))
+CHAT_OVERFLOW_SAMPLE_RATE = float(os.getenv("LIVE_CHAT_OVERFLOW_SAMPLE_RATE", "0.1"))
+
+# Reaction counts are sent to viewers at most this often per session
+REACTION_SUMMARY_INTERVAL_MS = int(os.getenv("LIVE_REACTION_SUMMARY_INTERVAL_MS", "500"))
+
+# Per-minute reaction totals are written to the database this often
+REACTION_PERSIST_SECONDS = float(os.getenv("LIVE_REACTION_PERSIST_SECONDS", "30"))
+
+# Pending per-minute rows kept if the database is unreachable (oldest dropped first)
+REACTION_MAX_PENDING_ROWS = int(os.getenv("LIVE_REACTION_MAX_PENDING_ROWS", "50000"))
+
+# A session whose totals fail to write this many flushes in a row is given up on
+REACTION_MAX_FLUSH_ATTEMPTS = int(os.getenv("LIVE_REACTION_MAX_FLUSH_ATTEMPTS", "5"))
+
+MAX_REACTION_LENGTH = 50  # live_reaction_counts.reaction_type is VARCHAR(50)
+
+# Trickle ICE candidates between one pair of peers are sent together after this window
+ICE_BATCH_WINDOW_MS = int(os.getenv("LIVE_ICE_BATCH_WINDOW_MS", "50"))
+
+# Session broadcasts kept per session for join snapshots and resume
+HISTORY_SIZE = int(os.getenv("LIVE_HISTORY_SIZE", "50"))
+
+# Broadcast types worth replaying; participant state comes with the snapshot instead
+HISTORY_TYPES = {"chat_batch"}
+
+# live_chat_messages.message_type CHECK constraint
+CHAT_MESSAGE_TYPES = {"text", "gift", "system", "sticker"}
+
+# Buffered chat rows are inserted every CHAT_PERSIST_SECONDS, or as soon as a
+# session has CHAT_PERSIST_BATCH_SIZE of them
+CHAT_PERSIST_SECONDS = float(os.getenv("LIVE_CHAT_PERSIST_SECONDS", "2"))
+CHAT_PERSIST_BATCH_SIZE = int(os.getenv("LIVE_CHAT_PERSIST_BATCH_SIZE", "200"))
+
+# Chat rows kept in memory across all sessions (oldest of the session dropped first)
+CHAT_MAX_PENDING_ROWS = int(os.getenv("LIVE_CHAT_MAX_PENDING_ROWS", "20000"))
+
+# A failed session insert is retried with exponential backoff (capped at this) until it
+# succeeds, fails with a permanent error or has failed CHAT_MAX_FLUSH_ATTEMPTS times
+# (about a quarter of an hour at the defaults); the buffer cap above bounds what waits
+CHAT_RETRY_MAX_SECONDS = float(os.getenv("LIVE_CHAT_RETRY_MAX_SECONDS", "60"))
+CHAT_MAX_FLUSH_ATTEMPTS = int(os.getenv("LIVE_CHAT_MAX_FLUSH_ATTEMPTS", "20"))
+
+# Postgres errors a retry can't fix: bad input (e.g. a non-UUID session id, a NUL in
+# text or JSON, invalid UTF-8), a missing referenced row (deleted session or user),
+# NOT NULL / length violations, and a duplicate id (an earlier attempt that timed out
+# had been written after all)
+PERMANENT_DB_ERRORS = {"22P02", "22P05", "22021", "22001", "23502", "23503", "23505"}
+
+
+class ChatBatcher:
+    """Collects one session's chat messages and emits them as chat_batch frames"""
+
+    def __init__(self, session_id: str, emit: Callable[[dict], None], call_later: Optional[Callable] = None):
+        self.session_id = session_id
+        self.emit = emit
+        self.call_later = call_later  # Timer source (the session actor's), default the loop's
+        self.pending: List[dict] = []
+        self.dropped_since_flush = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.window_started = time.monotonic()
+        self.window_count = 0
+        self.stats = {"received": 0, "delivered": 0, "dropped": 0, "batches": 0}
+
+    def add(self, message: dict, priority: bool = False) -> bool:
+        """Queue a chat message for the next batch. Returns False if it was rate-limited away."""
+        self.stats["received"] += 1
+
+        now = time.monotonic()
+        if now - self.window_started >= 1.0:
+            self.window_started = now
+            self.window_count = 0
+
+        if self.window_count >= CHAT_MAX_PER_SECOND and not priority:
+            if random.random() >= CHAT_OVERFLOW_SAMPLE_RATE:
+                self.stats["dropped"] += 1
+                self.dropped_since_flush += 1
+                return False
+
+        self.window_count += 1
+        self.pending.append(message)
+
+        if len(self.pending) >= CHAT_BATCH_MAX_MESSAGES:
+            self.flush()
+        elif self.timer is None:
+            call_later = self.call_later or asyncio.get_running_loop().call_later
+            self.timer = call_later(CHAT_BATCH_WINDOW_MS / 1000, self.flush)
+        return True
+
+    def flush(self):
+        """Emit pending messages as one chat_batch frame"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+
+        messages, self.pending = self.pending, []
+        dropped, self.dropped_since_flush = self.dropped_since_flush, 0
+        self.stats["delivered"] += len(messages)
+        self.stats["batches"] += 1
+        self.emit({
+            "type": "chat_batch",
+            "session_id": self.session_id,
+            "messages": messages,
+            "dropped": dropped,  # Messages skipped by the rate cap since the last batch
+            "timestamp": datetime.now().isoformat()
+        })
+
+    def close(self):
+        """Send whatever is pending and stop the timer"""
+        self.flush()
+
+
+class ReactionAggregator:
+    """Counts one session's reactions by type and emits them as reaction_summary frames"""
+
+    def __init__(self, session_id: str, emit: Callable[[dict], None], call_later: Optional[Callable] = None):
+        self.session_id = session_id
+        self.emit = emit
+        self.call_later = call_later  # Timer source (the session actor's), default the loop's
+        self.counts: Dict[str, int] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"received": 0, "summaries": 0}
+
+    def add(self, reaction: str, count: int = 1):
+        """Count reactions towards the next summary"""
+        self.stats["received"] += count
+        self.counts[reaction] = self.counts.get(reaction, 0) + count
+        if self.timer is None:
+            call_later = self.call_later or asyncio.get_running_loop().call_later
+            self.timer = call_later(REACTION_SUMMARY_INTERVAL_MS / 1000, self.flush)
+
+    def flush(self):
+        """Emit counts since the last summary"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.counts:
+            return
+
+        counts, self.counts = self.counts, {}
+        self.stats["summaries"] += 1
+        self.emit({
+            "type": "reaction_summary",
+            "session_id": self.session_id,
+            "counts": counts,
+            "total": sum(counts.values()),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    def close(self):
+        self.flush()
+
+
+class IceCandidateBatcher:
+    """
+    Collects one session's trickle ICE candidates per (from, to) pair and emits
+    each pair's candidates as one signal after a short window
+    """
+
+    def __init__(self, session_id: str, emit: Callable[[str, str, List[dict]], None],
+                 call_later: Optional[Callable] = None):
+        self.session_id = session_id
+        self.emit = emit  # emit(from_user_id, to_user_id, candidates)
+        self.call_later = call_later  # Timer source (the session actor's), default the loop's
+        self.pending: Dict[Tuple[str, str], List[dict]] = {}
+        self.timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self.stats = {"candidates": 0, "batches": 0}
+
+    def add(self, from_user_id: str, to_user_id: str, candidate: dict):
+        key = (from_user_id, to_user_id)
+        self.stats["candidates"] += 1
+        self.pending.setdefault(key, []).append(candidate)
+        if key not in self.timers:
+            call_later = self.call_later or asyncio.get_running_loop().call_later
+            self.timers[key] = call_later(ICE_BATCH_WINDOW_MS / 1000, self.flush, key)
+
+    def flush(self, key: Tuple[str, str]):
+        """Emit one pair's pending candidates"""
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        candidates = self.pending.pop(key, None)
+        if candidates:
+            self.stats["batches"] += 1
+            self.emit(key[0], key[1], candidates)
+
+    def close(self):
+        """Send whatever is pending and stop the timers"""
+        for key in list(self.pending):
+            self.flush(key)
+
+
+class SessionHistory:
+    """
+    Ring buffer of one session's recent broadcasts, numbered with "seq".
+    Entries are the Frames that were sent, so replaying them to any number of
+    joiners reuses the encoded bytes. Resume tokens are "{epoch}.{seq}"; the
+    epoch changes whenever the buffer is recreated (new session on this node,
+    other node), which makes older tokens fall back to a full replay.
+    """
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.frames: Deque[Tuple[int, Frame]] = deque(maxlen=size)
+
+    def record(self, message: dict) -> Frame:
+        """Number a broadcast and keep it; returns the Frame to send"""
+        self.seq += 1
+        frame = Frame(dict(message, seq=self.seq))
+        self.frames.append((self.seq, frame))
+        return frame
+
+    def since(self, resume: Optional[str]) -> Tuple[List[Frame], bool]:
+        """
+        Frames to replay for a resume token: (frames, resumed). Without a usable
+        token (none, other epoch, too old) everything buffered is replayed.
+        """
+        everything = [frame for _, frame in self.frames]
+        if not resume:
+            return everything, False
+
+        epoch, _, seq_text = resume.partition(".")
+        try:
+            seq = int(seq_text)
+        except ValueError:
+            return everything, False
+
+        oldest = self.frames[0][0] if self.frames else self.seq + 1
+        if epoch != self.epoch or seq > self.seq or seq < oldest - 1:
+            return everything, False
+        return [frame for frame_seq, frame in self.frames if frame_seq > seq], True
+
+
+def is_permanent_db_error(error: Exception) -> bool:
+    """True for PostgREST errors that fail the same way on every retry"""
+    return getattr(error, "code", None) in PERMANENT_DB_ERRORS
+
+
+def strip_nul(value: Any) -> Any:
+    """Remove NUL characters, which Postgres rejects in text and JSON, from strings at any depth"""
+    if isinstance(value, str):
+        return value.replace("\x00", "")
+    if isinstance(value, dict):
+        return {strip_nul(key): strip_nul(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [strip_nul(item) for item in value]
+    return value
+
+
+def is_uuid(value: str) -> bool:
+    """live_sessions ids are UUIDs; /ws/live/{session_id} accepts anything"""
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+class ReactionStore:
+    """
+    Per-minute reaction totals, buffered in memory and upserted in bulk through
+    the add_live_reaction_counts RPC (see migrations/004_live_reaction_counts.sql),
+    one call per session so a bad session can't block the others
+    """
+
+    def __init__(self):
+        # session_id -> {(minute ISO, reaction_type): count}
+        self.pending: Dict[str, Dict[Tuple[str, str], int]] = {}
+        self.pending_rows = 0
+        self.failed_attempts: Dict[str, int] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        self.stats = {"recorded": 0, "rows_written": 0, "flush_errors": 0, "rows_dropped": 0}
+
+    def record(self, session_id: str, reaction: str, count: int = 1):
+        """Add reactions to the current minute's total"""
+        minute = datetime.now(timezone.utc).replace(second=0, microsecond=0).isoformat()
+        counts = self.pending.setdefault(session_id, {})
+        key = (minute, reaction)
+        if key not in counts:
+            self.pending_rows += 1
+        counts[key] = counts.get(key, 0) + count
+        self.stats["recorded"] += count
+
+    def _drop(self, session_id: str, counts: Dict[Tuple[str, str], int], reason: str):
+        print(f"❌ Dropping {len(counts)} reaction totals for session {session_id}: {reason}")
+        self.failed_attempts.pop(session_id, None)
+        self.stats["rows_dropped"] += len(counts)
+
+    async def flush(self):
+        """Write pending totals, one RPC per session; failed ones are kept (bounded) for the next flush"""
+        for session_id in list(self.pending):
+            counts = self.pending.pop(session_id)
+            self.pending_rows -= len(counts)
+            if not is_uuid(session_id):
+                self._drop(session_id, counts, "not a session id")
+                continue
+
+            rows = [
+                {"session_id": session_id, "minute": minute, "reaction_type": reaction, "count": count}
+                for (minute, reaction), count in counts.items()
+            ]
+            try:
+                await asyncio.to_thread(
+                    lambda: supabase.rpc("add_live_reaction_counts", {"counts": rows}).execute()
+                )
+                self.stats["rows_written"] += len(rows)
+                self.failed_attempts.pop(session_id, None)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                attempts = self.failed_attempts.get(session_id, 0) + 1
+                if attempts >= REACTION_MAX_FLUSH_ATTEMPTS or is_permanent_db_error(e):
+                    self._drop(session_id, counts, str(e))
+                    continue
+
+                print(f"⚠️  Failed to persist reaction counts for session {session_id} ({len(rows)} rows): {e}")
+                self.failed_attempts[session_id] = attempts
+                # Put them back ahead of anything recorded meanwhile
+                newer = self.pending.get(session_id, {})
+                self.pending_rows -= len(newer)
+                for key, count in newer.items():
+                    counts[key] = counts.get(key, 0) + count
+
+                # Over the cap: drop this session's oldest minutes
+                dropped = list(counts)[:max(0, self.pending_rows + len(counts) - REACTION_MAX_PENDING_ROWS)]
+                for key in dropped:
+                    del counts[key]
+                self.stats["rows_dropped"] += len(dropped)
+                if counts:
+                    self.pending[session_id] = counts
+                    self.pending_rows += len(counts)
+                else:
+                    self.pending.pop(session_id, None)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(REACTION_PERSIST_SECONDS)
+            await self.flush()
+
+    def start(self):
+        """Start periodic persistence"""
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop periodic persistence and write what is left"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+
+
+class ChatStore:
+    """
+    Write-behind persistence for live chat (WebSocket and REST). Each message
+    gets its id and created_at up front, so senders get them without waiting
+    for the insert; rows reach get_chat_messages within CHAT_PERSIST_SECONDS.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, Deque[Dict[str, Any]]] = {}
+        self.pending_rows = 0
+        self.failed_attempts: Dict[str, int] = {}
+        self.retry_at: Dict[str, float] = {}  # Backoff deadline (monotonic) of failing sessions
+        self.wakeup = asyncio.Event()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.stats = {"recorded": 0, "rows_written": 0, "inserts": 0, "flush_errors": 0, "rows_dropped": 0}
+
+    def record(self, session_id: str, user_id: str, message: str,
+               message_type: str = "text", metadata: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        Buffer a chat message for insert; returns the row (with id and created_at)
+        Raises ValueError if message is not a string. NULs are stripped here, since
+        one would fail the session's whole bulk insert.
+        """
+        if not isinstance(message, str):
+            raise ValueError("Chat message must be a string")
+        row = {
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "user_id": user_id,
+            "message": strip_nul(message),
+            "message_type": message_type,
+            "metadata": strip_nul(metadata),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        rows = self.pending.setdefault(session_id, deque())
+        rows.append(row)
+        self.pending_rows += 1
+        self.stats["recorded"] += 1
+
+        if self.pending_rows > CHAT_MAX_PENDING_ROWS:
+            rows.popleft()
+            self.pending_rows -= 1
+            self.stats["rows_dropped"] += 1
+
+        if len(rows) >= CHAT_PERSIST_BATCH_SIZE:
+            self.wakeup.set()
+        return row
+
+    async def flush(self, session_id: Optional[str] = None, force: bool = False):
+        """
+        Insert pending rows, one bulk insert per session (all sessions if none given)
+        Sessions backing off after a failed insert are skipped unless named or forced.
+        A permanent error only drops the rows that cause it (see _insert).
+        """
+        if session_id is not None:
+            session_ids = [session_id]
+        else:
+            now = time.monotonic()
+            session_ids = [sid for sid in self.pending if force or self.retry_at.get(sid, 0) <= now]
+
+        for sid in session_ids:
+            rows = self.pending.pop(sid, None)
+            if not rows:
+                continue
+            self.pending_rows -= len(rows)
+            unwritten, error = await self._insert(sid, list(rows))
+            if error is None:
+                self.failed_attempts.pop(sid, None)
+                self.retry_at.pop(sid, None)
+                continue
+
+            attempts = self.failed_attempts[sid] = self.failed_attempts.get(sid, 0) + 1
+            if attempts >= CHAT_MAX_FLUSH_ATTEMPTS:
+                print(f"❌ Giving up on {len(unwritten)} chat messages for session {sid} "
+                      f"after {attempts} attempts: {error}")
+                self.failed_attempts.pop(sid, None)
+                self.retry_at.pop(sid, None)
+                self.stats["rows_dropped"] += len(unwritten)
+                continue
+
+            delay = min(CHAT_RETRY_MAX_SECONDS, CHAT_PERSIST_SECONDS * 2 ** (attempts - 1))
+            self.retry_at[sid] = time.monotonic() + delay
+            print(f"⚠️  Failed to persist chat for session {sid} ({len(unwritten)} rows, "
+                  f"attempt {attempts}, retrying in {delay:.0f}s): {error}")
+            # Put them back ahead of anything recorded meanwhile
+            retry = deque(unwritten)
+            retry.extend(self.pending.get(sid, ()))
+            self.pending[sid] = retry
+            self.pending_rows += len(unwritten)
+
+    async def _insert(self, session_id: str, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Exception]]:
+        """
+        Bulk insert rows. On a permanent error the batch is split in halves and
+        each retried, so only the rows that fail on their own are dropped.
+        Returns the rows left unwritten by a transient error, and that error.
+        """
+        try:
+            await asyncio.to_thread(
+                lambda: supabase.table("live_chat_messages").insert(rows).execute()
+            )
+            self.stats["rows_written"] += len(rows)
+            self.stats["inserts"] += 1
+            return [], None
+        except Exception as e:
+            self.stats["flush_errors"] += 1
+            if not is_permanent_db_error(e):
+                return rows, e
+            if len(rows) == 1:
+                print(f"❌ Dropping chat message {rows[0]['id']} for session {session_id}: {e}")
+                self.stats["rows_dropped"] += 1
+                return [], None
+
+        middle = len(rows) // 2
+        unwritten, error = await self._insert(session_id, rows[:middle])
+        if error is not None:
+            return unwritten + rows[middle:], error
+        return await self._insert(session_id, rows[middle:])
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), CHAT_PERSIST_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Start periodic persistence"""
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop periodic persistence and write what is left"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush(force=True)
+
+
+# Global instances (one per worker process)
+reaction_store = ReactionStore()
+chat_store = ChatStore()
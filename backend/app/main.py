@@ -13,7 +13,14 @@ from .notifications import router as notifications_router
 from .payments import router as payments_router
 from .cache_test import router as cache_router
 from .websocket_routes import router as websocket_router
+from .websocket_manager import live_manager, ws_manager
+from .ws_broker import create_broker
+from .live_events import chat_store, reaction_store
+from .presence import presence_service
+from .live_counters import live_counters
+from .upload_notify import upload_notifier
 from .social import router as social_router
+from .feed_snapshot import feed_snapshot
 
 # Try to import extended auth router (optional features)
 try:
@@ -39,6 +46,13 @@ except ImportError:
     HAS_REDIS_CACHE = False
     print("ℹ️  Redis cache not available. Install: pip install redis")
 
+# Try to import follower timelines (optional feature, needs Redis)
+try:
+    from .timeline import timeline_service
+    HAS_TIMELINES = True
+except ImportError:
+    HAS_TIMELINES = False
+
 
 # Load .env for local development only
 if os.environ.get("ENV", "development") == "development":
@@ -110,6 +124,31 @@ async def startup_event():
     else:
         print("ℹ️  Redis cache disabled (install redis to enable)")
     
+    # Start cross-worker WebSocket pub/sub (in-memory if Redis is unavailable)
+    # and the tick that flushes coalesced viewer counts
+    await ws_manager.start_broker(create_broker())
+    ws_manager.start_ticker()
+    
+    # Start per-minute live reaction persistence and write-behind live chat
+    reaction_store.start()
+    chat_store.start()
+    
+    # Start live viewer/guest counter writes (Redis → live_sessions)
+    live_counters.start()
+    
+    # Start the presence writer (heartbeat buckets in Redis)
+    presence_service.start()
+    
+    # Start new-upload notifications for online followers
+    upload_notifier.start()
+    
+    # Start in-memory public feed snapshot refreshes
+    feed_snapshot.start()
+    
+    # Start follower timeline fan-out worker
+    if HAS_TIMELINES:
+        timeline_service.start()
+    
     # Start trending scheduler
     if HAS_TRENDING_SCHEDULER:
         trending_scheduler.start()
@@ -127,15 +166,34 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Stop background tasks on app shutdown"""
+    # Stop public feed snapshot refreshes
+    await feed_snapshot.stop()
+    
+    # Stop follower timeline fan-out worker
+    if HAS_TIMELINES:
+        await timeline_service.stop()
+    
+    # Stop live session actors, then write remaining reaction totals and buffered chat
+    await live_manager.stop_actors()
+    await reaction_store.stop()
+    await chat_store.stop()
+    await live_counters.stop()
+    await presence_service.stop()
+    await upload_notifier.stop()
+    
+    # Stop coalesced WebSocket updates and cross-worker pub/sub
+    await ws_manager.stop_ticker()
+    await ws_manager.stop_broker()
+    
+    # Stop trending scheduler (releases the leader lock, so before Redis goes away)
+    if HAS_TRENDING_SCHEDULER:
+        await trending_scheduler.stop()
+        print("🛑 Trending scheduler stopped")
+    
     # Disconnect from Redis
     if HAS_REDIS_CACHE:
         await cache.disconnect()
         print("🛑 Redis cache disconnected")
-    
-    # Stop trending scheduler
-    if HAS_TRENDING_SCHEDULER:
-        trending_scheduler.stop()
-        print("🛑 Trending scheduler stopped")
 
 
 @app.get("/")
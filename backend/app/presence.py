@@ -0,0 +1,194 @@
+"""
+Presence: who is online, across every worker and instance
+Connections and heartbeats (the existing "ping" action) are written to Redis:
+- presence:{bucket} sets hold users seen in each PRESENCE_BUCKET_SECONDS window
+  and expire on their own, so half-open connections age out without cleanup
+- presence:conns:{user} counts open connections on all nodes, so going offline
+  is detected when the last one closes, wherever it was
+
+A user is online if they're in the current or previous bucket. Online/offline
+changes are broadcast to the presence:{user_id} room, which only clients that
+asked to watch that user join (and only nodes with such watchers subscribe to).
+Without Redis, presence falls back to this process's connections.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from .websocket_manager import ws_manager
+
+try:
+    from .redis_cache import cache
+    HAS_REDIS_CACHE = True
+except ImportError:
+    HAS_REDIS_CACHE = False
+
+# Heartbeat window; clients ping more often than this (frontend: every 25s)
+PRESENCE_BUCKET_SECONDS = int(os.getenv("PRESENCE_BUCKET_SECONDS", "30"))
+PRESENCE_TTL = PRESENCE_BUCKET_SECONDS * 3
+
+# Heartbeats are written in batches at most this often
+PRESENCE_FLUSH_SECONDS = float(os.getenv("PRESENCE_FLUSH_SECONDS", "1"))
+
+PRESENCE_QUEUE_SIZE = int(os.getenv("PRESENCE_QUEUE_SIZE", "10000"))
+
+# Max user ids per lookup / watch request
+PRESENCE_MAX_BATCH = 500
+
+
+def presence_room(user_id: str) -> str:
+    """WebSocket room whose members are told when user_id goes online/offline"""
+    return f"presence:{user_id}"
+
+
+def bucket_key(bucket: int) -> str:
+    return f"presence:{bucket}"
+
+
+def current_bucket(now: Optional[float] = None) -> int:
+    return int((now if now is not None else time.time()) // PRESENCE_BUCKET_SECONDS)
+
+
+class PresenceService:
+    def __init__(self):
+        self.local_connections: Dict[str, int] = {}   # open connections on this node
+        self.heartbeat_buckets: Dict[str, int] = {}   # last bucket written per user
+        self.pending_heartbeats: Set[str] = set()
+        self.events: asyncio.Queue = asyncio.Queue(maxsize=PRESENCE_QUEUE_SIZE)
+        self.worker_task: Optional[asyncio.Task] = None
+        self.stats = {"connects": 0, "disconnects": 0, "heartbeats_written": 0, "changes_published": 0, "dropped": 0}
+
+    @property
+    def redis_enabled(self) -> bool:
+        return HAS_REDIS_CACHE and cache.enabled
+
+    # === Called from the WebSocket routes (never block) ===
+
+    def _put(self, event: Tuple[str, str, int]):
+        try:
+            self.events.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    def user_connected(self, user_id: str):
+        """A socket for user_id was accepted on this node"""
+        self.local_connections[user_id] = self.local_connections.get(user_id, 0) + 1
+        self.heartbeat_buckets[user_id] = current_bucket()
+        self._put(("connect", user_id, self.local_connections[user_id]))
+
+    def user_disconnected(self, user_id: str):
+        """A socket for user_id closed on this node"""
+        remaining = self.local_connections.get(user_id, 0) - 1
+        if remaining > 0:
+            self.local_connections[user_id] = remaining
+        else:
+            self.local_connections.pop(user_id, None)
+            self.heartbeat_buckets.pop(user_id, None)
+            self.pending_heartbeats.discard(user_id)
+        self._put(("disconnect", user_id, max(remaining, 0)))
+
+    def heartbeat(self, user_id: str):
+        """Client pinged; written at most once per user per bucket"""
+        bucket = current_bucket()
+        if self.heartbeat_buckets.get(user_id) != bucket:
+            self.heartbeat_buckets[user_id] = bucket
+            self.pending_heartbeats.add(user_id)
+
+    # === Lookups ===
+
+    async def is_online(self, user_ids: List[str]) -> Dict[str, bool]:
+        """Batch online check for up to PRESENCE_MAX_BATCH users"""
+        user_ids = list(dict.fromkeys(user_ids))[:PRESENCE_MAX_BATCH]
+        if not user_ids:
+            return {}
+
+        if self.redis_enabled:
+            bucket = current_bucket()
+            members = await cache.presence_members(user_ids, [bucket_key(bucket), bucket_key(bucket - 1)])
+            if members is not None:
+                return dict(zip(user_ids, members))
+
+        return {user_id: user_id in self.local_connections for user_id in user_ids}
+
+    # === Background writer ===
+
+    async def _apply(self, event: str, user_id: str, local_count: int):
+        """Write a connect/disconnect; local_count is this node's count right after it"""
+        bucket = current_bucket()
+        if event == "connect":
+            self.stats["connects"] += 1
+            if self.redis_enabled:
+                connections = await cache.presence_connect(user_id, bucket_key(bucket), PRESENCE_TTL)
+            else:
+                connections = local_count
+            if connections == 1:
+                await self._publish_change(user_id, True)
+        else:
+            self.stats["disconnects"] += 1
+            if self.redis_enabled:
+                connections = await cache.presence_disconnect(
+                    user_id, [bucket_key(bucket), bucket_key(bucket - 1)]
+                )
+            else:
+                connections = local_count
+            if connections == 0:
+                await self._publish_change(user_id, False)
+
+    async def _publish_change(self, user_id: str, online: bool):
+        """Tell watchers of user_id (on any node) about the change"""
+        self.stats["changes_published"] += 1
+        await ws_manager.broadcast_to_room(presence_room(user_id), {
+            "type": "presence",
+            "user_id": user_id,
+            "online": online,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    async def flush_heartbeats(self):
+        if not self.pending_heartbeats:
+            return
+        user_ids, self.pending_heartbeats = list(self.pending_heartbeats), set()
+        if self.redis_enabled:
+            await cache.presence_heartbeat(user_ids, bucket_key(current_bucket()), PRESENCE_TTL)
+        self.stats["heartbeats_written"] += len(user_ids)
+
+    async def _worker(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                try:
+                    event = await asyncio.wait_for(self.events.get(), PRESENCE_FLUSH_SECONDS)
+                    await self._apply(*event)
+                except asyncio.TimeoutError:
+                    pass
+
+                if time.monotonic() - last_flush >= PRESENCE_FLUSH_SECONDS:
+                    last_flush = time.monotonic()
+                    await self.flush_heartbeats()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Presence update failed: {e}")
+
+    def start(self):
+        """Start the background presence writer"""
+        if self.worker_task is None:
+            self.worker_task = asyncio.create_task(self._worker())
+            print(f"🟢 Presence service started ({'Redis' if self.redis_enabled else 'local only'}, "
+                  f"{PRESENCE_BUCKET_SECONDS}s buckets)")
+
+    async def stop(self):
+        """Stop the writer (connection counts of this node expire with their TTL)"""
+        if self.worker_task:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+
+
+# Global instance (one per worker process)
+presence_service = PresenceService()
@@ -0,0 +1,279 @@
+"""
+Personalized "For You" feed ranking
+Pipeline: candidate generation -> scoring -> diversity re-ranking -> seen-filter
+
+Candidates come from trending, followed creators, the viewer's engaged hashtags
+and fresh uploads. The whole pipeline runs under a time budget; if it is over
+budget or fails, callers fall back to the canonical (newest first) feed. A run
+that goes over budget is not thrown away: it finishes in the background and
+caches its list for the user's next request.
+"""
+import asyncio
+import hashlib
+import heapq
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from .db import db, supabase
+from .redis_cache import cache
+
+# Whole-pipeline latency budget
+RANKING_BUDGET_MS = int(os.getenv("FEED_RANKING_BUDGET_MS", "150"))
+
+# Candidates pulled from each source
+CANDIDATES_PER_SOURCE = int(os.getenv("FEED_CANDIDATES_PER_SOURCE", "100"))
+
+# Engagement signals: how many recent likes to mine for hashtags, and how many tags to keep
+ENGAGEMENT_LOOKBACK = 50
+TOP_HASHTAGS = 5
+
+# Scoring weights (engagement weights match the trending formula)
+RECENCY_HALF_LIFE_HOURS = float(os.getenv("FEED_RECENCY_HALF_LIFE_HOURS", "24"))
+ENGAGEMENT_WEIGHTS = (1.0, 3.0, 5.0, 2.0)  # views, likes, comments, shares
+SOURCE_BOOSTS = {"following": 2.0, "hashtag": 1.5, "trending": 1.0, "fresh": 0.5}
+RECENCY_WEIGHT = 4.0
+
+# Each extra video from the same creator on a page multiplies its score by this
+DIVERSITY_DECAY = float(os.getenv("FEED_DIVERSITY_DECAY", "0.5"))
+
+# Each ranking run produces a list this long, cached per user and paged by offset
+RANKED_FEED_SIZE = int(os.getenv("FEED_RANKED_SIZE", "200"))
+RANKED_FEED_TTL = int(os.getenv("FEED_RANKED_TTL", "300"))
+
+# Per-user Bloom filter of recently served video ids
+SEEN_FILTER_BITS = int(os.getenv("FEED_SEEN_FILTER_BITS", "65536"))
+SEEN_FILTER_HASHES = 4
+SEEN_FILTER_TTL = int(os.getenv("FEED_SEEN_FILTER_TTL", "86400"))
+
+try:
+    from .timeline import timeline_service
+    HAS_TIMELINES = True
+except ImportError:
+    HAS_TIMELINES = False
+
+
+def bloom_positions(item: str, bits: int = SEEN_FILTER_BITS, hashes: int = SEEN_FILTER_HASHES) -> List[int]:
+    """Bit offsets for an item (Kirsch-Mitzenmacher double hashing over one digest)"""
+    digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def _age_hours(created_at, now: float) -> float:
+    try:
+        ts = datetime.fromisoformat(str(created_at).replace("Z", "+00:00")).timestamp()
+    except (TypeError, ValueError):
+        return RECENCY_HALF_LIFE_HOURS
+    return max(0.0, (now - ts) / 3600)
+
+
+def score_candidates(candidates: List[Dict], now: Optional[float] = None) -> List[float]:
+    """
+    Score all candidates in one columnar pass
+    Features are extracted into flat columns first, then combined with a single
+    zip so the per-candidate work is a handful of float ops.
+    """
+    now = now or time.time()
+    views = [c.get("views_count") or 0 for c in candidates]
+    likes = [c.get("likes_count") or 0 for c in candidates]
+    comments = [c.get("comments_count") or 0 for c in candidates]
+    shares = [c.get("shares_count") or 0 for c in candidates]
+    ages = [_age_hours(c.get("created_at"), now) for c in candidates]
+    boosts = [sum(SOURCE_BOOSTS.get(s, 0.0) for s in c.get("_sources", ())) for c in candidates]
+
+    wv, wl, wc, ws = ENGAGEMENT_WEIGHTS
+    decay = math.log(2) / RECENCY_HALF_LIFE_HOURS
+    log1p, exp = math.log1p, math.exp
+    return [
+        wv * log1p(v) + wl * log1p(l) + wc * log1p(c) + ws * log1p(s)
+        + RECENCY_WEIGHT * exp(-decay * a) + b
+        for v, l, c, s, a, b in zip(views, likes, comments, shares, ages, boosts)
+    ]
+
+
+def diversify(candidates: List[Dict], scores: List[float], limit: int) -> List[Dict]:
+    """
+    Greedy diversity re-ranking
+    Picks the best remaining candidate, decaying a creator's score each time one
+    of their videos is picked (lazy re-scoring on a max-heap).
+    """
+    heap = [(-score, i, 0) for i, score in enumerate(scores)]
+    heapq.heapify(heap)
+    picked_per_creator = Counter()
+    page = []
+
+    while heap and len(page) < limit:
+        neg_score, i, seen_picks = heapq.heappop(heap)
+        creator = candidates[i].get("user_id")
+        picks = picked_per_creator[creator]
+        if picks != seen_picks:
+            # Creator got picked since this entry was scored; re-score and retry
+            heapq.heappush(heap, (-scores[i] * DIVERSITY_DECAY ** picks, i, picks))
+            continue
+        page.append(candidates[i])
+        picked_per_creator[creator] += 1
+
+    return page
+
+
+def _pg_array(values: List[str]) -> str:
+    """Format values as a PostgREST array literal"""
+    quoted = ('"' + v.replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values)
+    return "{" + ",".join(quoted) + "}"
+
+
+def _as_video_row(video: Dict) -> Dict:
+    """Normalize cached VideoMetadata dicts to the DB row shape (nested users)"""
+    if "users" not in video:
+        video = dict(video)
+        video["users"] = {"username": video.get("username"), "avatar_url": video.get("avatar_url")}
+    return video
+
+
+class FeedRanker:
+    def __init__(self):
+        self.stats = {"ranked": 0, "over_budget": 0, "failed": 0}
+        # Ranking runs per user, kept running past the budget until their list is cached
+        self.runs: Dict[str, asyncio.Task] = {}
+
+    async def rank_feed(self, user_id: str, limit: int, offset: int = 0) -> Optional[List[Dict]]:
+        """
+        Get a page of a user's ranked feed, or None to fall back to the canonical feed
+        A ranking run produces up to RANKED_FEED_SIZE videos, cached for
+        RANKED_FEED_TTL; pages are slices of that list, so an offset returns the
+        same videos while it lives. Served videos go into the seen-filter and are
+        left out of the user's next list. Offsets past the end of the list fall back.
+        """
+        if not cache.enabled:
+            return None  # No list cache or seen-filter; use canonical feed
+
+        page = await cache.get_ranked_feed(user_id, offset, offset + limit - 1)
+        if page is None:
+            run = self.runs.get(user_id)
+            if run is None:
+                run = self.runs[user_id] = asyncio.create_task(self._rank_and_cache(user_id))
+            # Not cancelled on timeout: the list it caches serves the next request
+            done, _ = await asyncio.wait({run}, timeout=RANKING_BUDGET_MS / 1000)
+            if not done:
+                self.stats["over_budget"] += 1
+                print(f"⏱️  Feed ranking over budget ({RANKING_BUDGET_MS}ms) for {user_id}, using canonical feed")
+                return None
+
+            ranked = run.result()
+            if not ranked:
+                return None
+            page = ranked[offset:offset + limit]
+
+        if not page:
+            return None
+        await cache.bloom_add(f"seen:{user_id}", [bloom_positions(v["id"]) for v in page], SEEN_FILTER_TTL)
+        return page
+
+    async def _rank_and_cache(self, user_id: str) -> Optional[List[Dict]]:
+        """One ranking run for a user; its list is cached even if the request stopped waiting"""
+        try:
+            ranked = await self._rank(user_id, RANKED_FEED_SIZE)
+            if ranked:
+                await cache.set_ranked_feed(user_id, ranked, RANKED_FEED_TTL)
+                self.stats["ranked"] += 1
+            return ranked
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"⚠️  Feed ranking failed for {user_id}: {e}")
+            return None
+        finally:
+            self.runs.pop(user_id, None)
+
+    async def _rank(self, user_id: str, limit: int) -> List[Dict]:
+        candidates = await self.generate_candidates(user_id)
+        if not candidates:
+            return []
+
+        # Seen-filter before scoring so we don't score what we won't serve
+        positions = [bloom_positions(c["id"]) for c in candidates]
+        seen = await cache.bloom_contains(f"seen:{user_id}", positions)
+        fresh = [c for c, was_seen in zip(candidates, seen) if not was_seen]
+        if not fresh:
+            return []
+
+        scores = score_candidates(fresh)
+        page = diversify(fresh, scores, limit)
+        for video in page:
+            video.pop("_sources", None)
+        return page
+
+    async def generate_candidates(self, user_id: str) -> List[Dict]:
+        """Gather candidates from all sources concurrently, de-duplicated by id"""
+        sources = await asyncio.gather(
+            self._trending_candidates(),
+            self._following_candidates(user_id),
+            self._hashtag_candidates(user_id),
+            self._fresh_candidates(),
+            return_exceptions=True
+        )
+
+        by_id: Dict[str, Dict] = {}
+        for name, videos in zip(("trending", "following", "hashtag", "fresh"), sources):
+            if isinstance(videos, Exception):
+                print(f"⚠️  Candidate source '{name}' failed: {videos}")
+                continue
+            for video in videos:
+                candidate = by_id.get(video["id"])
+                if candidate is None:
+                    candidate = by_id[video["id"]] = dict(_as_video_row(video), _sources=set())
+                candidate["_sources"].add(name)
+        return list(by_id.values())
+
+    async def _trending_candidates(self) -> List[Dict]:
+        videos = await cache.get_trending_videos()
+        if not videos:
+            try:
+                from .trending_scheduler import trending_scheduler
+                videos = trending_scheduler.get_cached_trending()
+            except ImportError:
+                videos = []
+        return (videos or [])[:CANDIDATES_PER_SOURCE]
+
+    async def _following_candidates(self, user_id: str) -> List[Dict]:
+        if not HAS_TIMELINES:
+            return []
+        video_ids = await timeline_service.get_timeline_page(user_id, CANDIDATES_PER_SOURCE, 0)
+        if not video_ids:
+            return []
+        return await timeline_service.hydrate(video_ids)
+
+    async def _hashtag_candidates(self, user_id: str) -> List[Dict]:
+        return await asyncio.to_thread(self._fetch_hashtag_candidates, user_id)
+
+    async def _fresh_candidates(self) -> List[Dict]:
+        return await asyncio.to_thread(db.get_videos_feed, CANDIDATES_PER_SOURCE, 0)
+
+    @staticmethod
+    def _fetch_hashtag_candidates(user_id: str) -> List[Dict]:
+        liked = supabase.table("video_likes").select(
+            "videos (hashtags)"
+        ).eq("user_id", user_id).order("created_at", desc=True).limit(ENGAGEMENT_LOOKBACK).execute()
+
+        tags = Counter()
+        for row in liked.data:
+            tags.update((row.get("videos") or {}).get("hashtags") or [])
+        top_tags = [tag for tag, _ in tags.most_common(TOP_HASHTAGS)]
+        if not top_tags:
+            return []
+
+        result = supabase.table("videos").select("""
+            *,
+            users!videos_user_id_fkey (username, avatar_url)
+        """).filter("hashtags", "ov", _pg_array(top_tags)).order(
+            "created_at", desc=True
+        ).limit(CANDIDATES_PER_SOURCE).execute()
+        return result.data
+
+
+# Global instance
+feed_ranker = FeedRanker()
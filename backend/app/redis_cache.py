@@ -5,7 +5,7 @@ Caches video feeds, trending videos, user data, and frequently accessed content
 import redis.asyncio as redis
 import json
 import os
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -119,6 +119,44 @@ class RedisCache:
         key = f"feed:{user_id or 'public'}:{limit}:{offset}"
         await self.set(key, videos, expire)
     
+    async def get_ranked_feed(self, user_id: str, start: int, stop: int) -> Optional[List[Dict]]:
+        """
+        Get a slice of a user's cached ranked feed
+        Returns None if no ranked list is cached ([] past its end)
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            key = f"ranked:{user_id}"
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.exists(key)
+            pipe.lrange(key, start, stop)
+            exists, rows = await pipe.execute()
+            if not exists:
+                return None
+            return [json.loads(row) for row in rows]
+        except Exception as e:
+            print(f"⚠️  Redis ranked feed GET error: {e}")
+            return None
+
+    async def set_ranked_feed(self, user_id: str, videos: List[Dict], expire: int = 300):
+        """Cache a user's ranked feed as a list, one video per element (5 minutes TTL)"""
+        if not self.enabled or not videos:
+            return False
+
+        try:
+            key = f"ranked:{user_id}"
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.rpush(key, *(json.dumps(video, default=str) for video in videos))
+            pipe.expire(key, expire)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis ranked feed SET error: {e}")
+            return False
+
     async def invalidate_video_feeds(self):
         """Invalidate all video feed caches"""
         await self.delete_pattern("feed:*")
@@ -183,6 +221,628 @@ class RedisCache:
         await self.delete_pattern(f"comments:{video_id}:*")
         print(f"🔄 Comments cache invalidated: {video_id}")
     
+    # === Follower Timelines ===
+    # timeline:{user_id}       sorted set of pushed video ids (score = upload time)
+    # timeline:pull:{user_id}  set of followed high-follower creators read at
+    #                          query time; its existence marks the timeline as built
+    # uploads:{user_id}        sorted set of a creator's recent uploads ("-" marks
+    #                          a cached list of a creator with no uploads)
+    # timeline:pulled:{user_id} set while a creator's uploads are pulled, not pushed
+
+    async def get_timeline(self, user_id: str, start: int, stop: int) -> Optional[Tuple[List[Tuple[str, float]], List[str]]]:
+        """
+        Get a range of a user's materialized timeline (newest first) and the
+        creators whose uploads must be merged in at read time.
+        Returns None if the timeline has not been built (or has expired)
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.exists(f"timeline:pull:{user_id}")
+            pipe.zrevrange(f"timeline:{user_id}", start, stop, withscores=True)
+            pipe.smembers(f"timeline:pull:{user_id}")
+            exists, entries, pull_ids = await pipe.execute()
+            if not exists:
+                return None
+            return (
+                [(video_id, float(score)) for video_id, score in entries],
+                [creator_id for creator_id in pull_ids if creator_id != "-"]
+            )
+        except Exception as e:
+            print(f"⚠️  Redis timeline GET error: {e}")
+            return None
+
+    async def store_timeline(self, user_id: str, entries: Dict[str, float], pull_ids: List[str],
+                             max_size: int = 500, expire: int = 604800):
+        """Replace a user's timeline and pull-source set (7 days TTL)"""
+        if not self.enabled:
+            return False
+
+        try:
+            key = f"timeline:{user_id}"
+            pull_key = f"timeline:pull:{user_id}"
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(key, pull_key)
+            if entries:
+                pipe.zadd(key, entries)
+                pipe.zremrangebyrank(key, 0, -(max_size + 1))
+                pipe.expire(key, expire)
+            pipe.sadd(pull_key, "-", *pull_ids)  # "-" keeps the set alive when empty
+            pipe.expire(pull_key, expire)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis timeline STORE error: {e}")
+            return False
+
+    async def timeline_exists(self, user_id: str) -> bool:
+        """Check if a user's timeline has been built"""
+        return await self.exists(f"timeline:pull:{user_id}")
+
+    async def push_to_timelines(self, user_ids: List[str], entries: Dict[str, float], max_size: int = 500,
+                                expire: int = 604800) -> int:
+        """
+        Add videos to many timelines, trimming each to max_size
+        Only timelines that already exist are touched, so inactive users
+        don't accumulate partial timelines. The TTL is set with every write
+        (an empty timeline has no key until its first push).
+        Returns number of timelines written.
+        """
+        if not self.enabled or not user_ids or not entries:
+            return 0
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.exists(f"timeline:pull:{user_id}")
+            existing = [user_id for user_id, exists in zip(user_ids, await pipe.execute()) if exists]
+
+            if existing:
+                pipe = self.redis.pipeline(transaction=False)
+                for user_id in existing:
+                    key = f"timeline:{user_id}"
+                    pipe.zadd(key, entries)
+                    pipe.zremrangebyrank(key, 0, -(max_size + 1))
+                    pipe.expire(key, expire)
+                await pipe.execute()
+            return len(existing)
+        except Exception as e:
+            print(f"⚠️  Redis timeline PUSH error: {e}")
+            return 0
+
+    async def remove_from_timeline(self, user_id: str, video_ids: List[str]):
+        """Remove videos from a user's timeline"""
+        if not self.enabled or not video_ids:
+            return False
+
+        try:
+            await self.redis.zrem(f"timeline:{user_id}", *video_ids)
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis timeline REMOVE error: {e}")
+            return False
+
+    async def add_pull_source(self, user_id: str, creator_id: str):
+        """Read a followed creator's uploads at query time instead of pushing them"""
+        if not self.enabled:
+            return False
+
+        try:
+            await self.redis.sadd(f"timeline:pull:{user_id}", creator_id)
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis timeline SADD error: {e}")
+            return False
+
+    async def add_pull_source_to_timelines(self, user_ids: List[str], creator_id: str) -> int:
+        """Add a pull source to many timelines (existing ones only); returns number updated"""
+        if not self.enabled or not user_ids:
+            return 0
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.exists(f"timeline:pull:{user_id}")
+            existing = [user_id for user_id, exists in zip(user_ids, await pipe.execute()) if exists]
+
+            if existing:
+                pipe = self.redis.pipeline(transaction=False)
+                for user_id in existing:
+                    pipe.sadd(f"timeline:pull:{user_id}", creator_id)
+                await pipe.execute()
+            return len(existing)
+        except Exception as e:
+            print(f"⚠️  Redis timeline SADD error: {e}")
+            return 0
+
+    async def mark_pulled_creator(self, creator_id: str, expire: int = 604800) -> bool:
+        """Record that a creator is pulled at read time; True if it wasn't marked yet"""
+        if not self.enabled:
+            return False
+
+        try:
+            return bool(await self.redis.set(f"timeline:pulled:{creator_id}", "1", ex=expire, nx=True))
+        except Exception as e:
+            print(f"⚠️  Redis timeline MARK error: {e}")
+            return False
+
+    async def unmark_pulled_creator(self, creator_id: str):
+        """The creator is pushed again (back under the threshold)"""
+        if not self.enabled:
+            return
+
+        try:
+            await self.redis.delete(f"timeline:pulled:{creator_id}")
+        except Exception as e:
+            print(f"⚠️  Redis timeline UNMARK error: {e}")
+
+    async def remove_pull_source(self, user_id: str, creator_id: str):
+        """Stop merging a creator's uploads into a user's timeline"""
+        if not self.enabled:
+            return False
+
+        try:
+            await self.redis.srem(f"timeline:pull:{user_id}", creator_id)
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis timeline SREM error: {e}")
+            return False
+
+    async def store_uploads(self, user_id: str, entries: Dict[str, float], max_size: int = 200, expire: int = 604800):
+        """
+        Replace a creator's recent-uploads list (7 days TTL)
+        "-" (score 0, sorts last) keeps the list cached when the creator has no uploads
+        """
+        if not self.enabled:
+            return False
+
+        try:
+            key = f"uploads:{user_id}"
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.zadd(key, {**entries, "-": 0})
+            pipe.zremrangebyrank(key, 0, -(max_size + 1))
+            pipe.expire(key, expire)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis uploads STORE error: {e}")
+            return False
+
+    async def record_uploads(self, user_id: str, entries: Dict[str, float], max_size: int = 200, expire: int = 604800):
+        """
+        Add videos to a creator's recent-uploads list if it is cached
+        A cold list is left alone (it is loaded whole from the database on read),
+        so it never ends up holding only the newest uploads.
+        """
+        if not self.enabled or not entries:
+            return False
+
+        try:
+            key = f"uploads:{user_id}"
+            if not await self.redis.exists(key):
+                return False
+
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(key, entries)
+            pipe.zremrangebyrank(key, 0, -(max_size + 1))
+            pipe.expire(key, expire)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis uploads RECORD error: {e}")
+            return False
+
+    async def get_recent_uploads(self, user_ids: List[str], count: int) -> Dict[str, Optional[List[Tuple[str, float]]]]:
+        """
+        Get the newest `count` uploads for several creators in one round trip
+        Creators without a cached list map to None
+        """
+        if not self.enabled or not user_ids:
+            return {user_id: None for user_id in user_ids}
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.exists(f"uploads:{user_id}")
+                pipe.zrevrange(f"uploads:{user_id}", 0, count - 1, withscores=True)
+            results = await pipe.execute()
+
+            uploads = {}
+            for i, user_id in enumerate(user_ids):
+                exists, entries = results[2 * i], results[2 * i + 1]
+                uploads[user_id] = [
+                    (video_id, float(score)) for video_id, score in entries if video_id != "-"
+                ] if exists else None
+            return uploads
+        except Exception as e:
+            print(f"⚠️  Redis uploads GET error: {e}")
+            return {user_id: None for user_id in user_ids}
+
+    # === Bloom Filters (bitmap per key) ===
+
+    async def bloom_contains(self, key: str, positions: List[List[int]]) -> List[bool]:
+        """
+        Check several items against a Bloom filter in one round trip
+        positions: bit offsets for each item; an item is present if all its bits are set
+        """
+        if not self.enabled or not positions:
+            return [False] * len(positions)
+
+        try:
+            # One BITFIELD_RO per item reads all of its bits
+            pipe = self.redis.pipeline(transaction=False)
+            for first, *rest in positions:
+                pipe.bitfield_ro(key, "u1", first, items=[("u1", bit) for bit in rest])
+            return [all(bits) for bits in await pipe.execute()]
+        except Exception as e:
+            print(f"⚠️  Redis bloom BITFIELD error: {e}")
+            return [False] * len(positions)
+
+    async def bloom_add(self, key: str, positions: List[List[int]], expire: int = 86400):
+        """Add items to a Bloom filter (24 hours TTL, refreshed on every add)"""
+        if not self.enabled or not positions:
+            return False
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for item_bits in positions:
+                for bit in item_bits:
+                    pipe.setbit(key, bit, 1)
+            pipe.expire(key, expire)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis bloom SETBIT error: {e}")
+            return False
+
+    # === Distributed Locks ===
+
+    # Only the current holder (matching token) may extend or release a lock
+    _RENEW_LOCK_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('pexpire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    _RELEASE_LOCK_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    async def acquire_lock(self, key: str, token: str, ttl_ms: int) -> bool:
+        """Take a lock if nobody holds it (SET NX PX)"""
+        if not self.enabled:
+            return False
+
+        try:
+            return bool(await self.redis.set(key, token, nx=True, px=ttl_ms))
+        except Exception as e:
+            print(f"⚠️  Redis lock ACQUIRE error: {e}")
+            return False
+
+    async def renew_lock(self, key: str, token: str, ttl_ms: int) -> Optional[bool]:
+        """Extend a lock we hold; False if it expired or someone else holds it, None on error"""
+        if not self.enabled:
+            return False
+
+        try:
+            return bool(await self.redis.eval(self._RENEW_LOCK_SCRIPT, 1, key, token, ttl_ms))
+        except Exception as e:
+            print(f"⚠️  Redis lock RENEW error: {e}")
+            return None
+
+    async def lock_holder(self, key: str) -> Optional[str]:
+        """Token stored in a lock (None if free or on error)"""
+        if not self.enabled:
+            return None
+
+        try:
+            return await self.redis.get(key)
+        except Exception as e:
+            print(f"⚠️  Redis lock GET error: {e}")
+            return None
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        """Release a lock we hold"""
+        if not self.enabled:
+            return False
+
+        try:
+            return bool(await self.redis.eval(self._RELEASE_LOCK_SCRIPT, 1, key, token))
+        except Exception as e:
+            print(f"⚠️  Redis lock RELEASE error: {e}")
+            return False
+
+    # === Pub/Sub ===
+
+    async def publish(self, channel: str, message: str) -> int:
+        """Publish a message; returns number of subscribers that received it"""
+        if not self.enabled:
+            return 0
+
+        try:
+            return await self.redis.publish(channel, message)
+        except Exception as e:
+            print(f"⚠️  Redis PUBLISH error: {e}")
+            return 0
+
+    def pubsub(self):
+        """New pub/sub connection, or None if Redis is disabled"""
+        if not self.enabled:
+            return None
+        return self.redis.pubsub(ignore_subscribe_messages=True)
+
+    # === Presence ===
+    # presence:{bucket}        set of user ids that heartbeated in that time bucket
+    # presence:conns:{user}    open connections across all nodes (online while > 0)
+
+    _PRESENCE_DISCONNECT_SCRIPT = """
+    local n = redis.call('decr', KEYS[1])
+    if n <= 0 then
+        redis.call('del', KEYS[1])
+        for i = 2, #KEYS do
+            redis.call('srem', KEYS[i], ARGV[1])
+        end
+        return 0
+    end
+    return n
+    """
+
+    async def presence_connect(self, user_id: str, bucket_key: str, ttl: int) -> int:
+        """Count a new connection and mark the user present; returns open connections"""
+        if not self.enabled:
+            return 0
+
+        try:
+            pipe = self.redis.pipeline()
+            conns_key = f"presence:conns:{user_id}"
+            pipe.incr(conns_key)
+            pipe.expire(conns_key, ttl)
+            pipe.sadd(bucket_key, user_id)
+            pipe.expire(bucket_key, ttl)
+            results = await pipe.execute()
+            return int(results[0])
+        except Exception as e:
+            print(f"⚠️  Redis presence CONNECT error: {e}")
+            return 0
+
+    async def presence_disconnect(self, user_id: str, bucket_keys: List[str]) -> int:
+        """Uncount a connection; at zero the user is removed from the buckets. Returns open connections."""
+        if not self.enabled:
+            return 0
+
+        try:
+            keys = [f"presence:conns:{user_id}", *bucket_keys]
+            return int(await self.redis.eval(self._PRESENCE_DISCONNECT_SCRIPT, len(keys), *keys, user_id))
+        except Exception as e:
+            print(f"⚠️  Redis presence DISCONNECT error: {e}")
+            return 0
+
+    async def presence_heartbeat(self, user_ids: List[str], bucket_key: str, ttl: int):
+        """Mark users present in the current bucket and keep their connection counts alive"""
+        if not self.enabled or not user_ids:
+            return
+
+        try:
+            pipe = self.redis.pipeline()
+            pipe.sadd(bucket_key, *user_ids)
+            pipe.expire(bucket_key, ttl)
+            for user_id in user_ids:
+                pipe.expire(f"presence:conns:{user_id}", ttl)
+            await pipe.execute()
+        except Exception as e:
+            print(f"⚠️  Redis presence HEARTBEAT error: {e}")
+
+    async def presence_members(self, user_ids: List[str], bucket_keys: List[str]) -> Optional[List[bool]]:
+        """For each user, whether they're in any of the buckets (None on error)"""
+        if not self.enabled:
+            return None
+
+        try:
+            pipe = self.redis.pipeline()
+            for bucket_key in bucket_keys:
+                pipe.smismember(bucket_key, user_ids)
+            results = await pipe.execute()
+            return [any(bool(r[i]) for r in results) for i in range(len(user_ids))]
+        except Exception as e:
+            print(f"⚠️  Redis presence LOOKUP error: {e}")
+            return None
+
+    # === Live Session Counters ===
+    # live:counts:{session}              hash: viewers, guests, peak, capacity (0 = no limit)
+    # live:counts:{session}:node:{node}  hash: viewers, guests counted by that node; expires
+    #                                    unless the node keeps refreshing it (gone after a crash)
+    # live:counts:{session}:nodes        set of nodes with a contribution
+    # live:ended:{session}               set when the session ends: counters are never recreated
+
+    # Recount viewers/guests from the contributions that are still alive; returns
+    # the viewers dropped (counted by nodes that went away without leaving)
+    _LIVE_RECONCILE_LUA = """
+    local function reconcile(prefix)
+        local viewers, guests = 0, 0
+        for _, node in ipairs(redis.call('smembers', KEYS[3])) do
+            local counts = redis.call('hmget', prefix .. node, 'viewers', 'guests')
+            if counts[1] or counts[2] then
+                viewers = viewers + tonumber(counts[1] or '0')
+                guests = guests + tonumber(counts[2] or '0')
+            else
+                redis.call('srem', KEYS[3], node)
+            end
+        end
+        local stale = tonumber(redis.call('hget', KEYS[1], 'viewers') or '0') - viewers
+        if stale > 0 or tonumber(redis.call('hget', KEYS[1], 'guests') or '0') > guests then
+            redis.call('hset', KEYS[1], 'viewers', viewers, 'guests', guests)
+        end
+        return math.max(stale, 0)
+    end
+    """
+
+    # Capacity check, join and peak in one step, so concurrent joins can't overshoot;
+    # a full session is reconciled first so viewers of a crashed node don't keep it full
+    _LIVE_JOIN_SCRIPT = _LIVE_RECONCILE_LUA + """
+    if redis.call('exists', KEYS[4]) == 1 then
+        return -2
+    end
+    local capacity = tonumber(redis.call('hget', KEYS[1], 'capacity') or '0')
+    local viewers = tonumber(redis.call('hget', KEYS[1], 'viewers') or '0')
+    if capacity > 0 and viewers >= capacity then
+        viewers = viewers - reconcile(ARGV[4])
+        if viewers >= capacity then
+            return -1
+        end
+    end
+    viewers = redis.call('hincrby', KEYS[1], 'viewers', 1)
+    redis.call('hincrby', KEYS[2], 'viewers', 1)
+    if ARGV[1] == '1' then
+        redis.call('hincrby', KEYS[1], 'guests', 1)
+        redis.call('hincrby', KEYS[2], 'guests', 1)
+    end
+    if viewers > tonumber(redis.call('hget', KEYS[1], 'peak') or '0') then
+        redis.call('hset', KEYS[1], 'peak', viewers)
+    end
+    redis.call('sadd', KEYS[3], ARGV[5])
+    redis.call('expire', KEYS[1], ARGV[2])
+    redis.call('expire', KEYS[3], ARGV[2])
+    redis.call('expire', KEYS[2], ARGV[3])
+    return viewers
+    """
+    _LIVE_ADJUST_SCRIPT = """
+    if redis.call('exists', KEYS[4]) == 1 then
+        return -2
+    end
+    local n = redis.call('hincrby', KEYS[1], ARGV[1], ARGV[2])
+    if n < 0 then
+        redis.call('hset', KEYS[1], ARGV[1], 0)
+        n = 0
+    end
+    if redis.call('hincrby', KEYS[2], ARGV[1], ARGV[2]) < 0 then
+        redis.call('hset', KEYS[2], ARGV[1], 0)
+    end
+    redis.call('sadd', KEYS[3], ARGV[5])
+    redis.call('expire', KEYS[1], ARGV[3])
+    redis.call('expire', KEYS[3], ARGV[3])
+    redis.call('expire', KEYS[2], ARGV[4])
+    return n
+    """
+    # Refresh this node's contribution and drop those of nodes that stopped refreshing
+    _LIVE_RECONCILE_SCRIPT = _LIVE_RECONCILE_LUA + """
+    if redis.call('exists', KEYS[4]) == 1 then
+        return 0
+    end
+    redis.call('expire', KEYS[2], ARGV[1])
+    return reconcile(ARGV[2])
+    """
+
+    @staticmethod
+    def _live_counter_keys(session_id: str, node_id: str) -> List[str]:
+        """KEYS for the live counter scripts: counts, this node's contribution, nodes, ended"""
+        return [
+            f"live:counts:{session_id}",
+            f"live:counts:{session_id}:node:{node_id}",
+            f"live:counts:{session_id}:nodes",
+            f"live:ended:{session_id}"
+        ]
+
+    async def live_counter_join(self, session_id: str, guest: bool, node_id: str, ttl: int,
+                                node_ttl: int) -> Optional[int]:
+        """Count a join if the session has room; returns viewers after it, -1 if full, -2 if ended, None on error"""
+        if not self.enabled:
+            return None
+
+        try:
+            return int(await self.redis.eval(
+                self._LIVE_JOIN_SCRIPT, 4, *self._live_counter_keys(session_id, node_id),
+                "1" if guest else "0", ttl, node_ttl, f"live:counts:{session_id}:node:", node_id
+            ))
+        except Exception as e:
+            print(f"⚠️  Redis live counter JOIN error: {e}")
+            return None
+
+    async def live_counter_adjust(self, session_id: str, field: str, delta: int, node_id: str, ttl: int,
+                                  node_ttl: int) -> Optional[int]:
+        """Add delta to a counter (never below zero); returns the new value, -2 if the session ended"""
+        if not self.enabled:
+            return None
+
+        try:
+            return int(await self.redis.eval(
+                self._LIVE_ADJUST_SCRIPT, 4, *self._live_counter_keys(session_id, node_id),
+                field, delta, ttl, node_ttl, node_id
+            ))
+        except Exception as e:
+            print(f"⚠️  Redis live counter ADJUST error: {e}")
+            return None
+
+    async def live_counters_reconcile(self, session_ids: List[str], node_id: str,
+                                      node_ttl: int) -> Optional[Dict[str, int]]:
+        """Refresh this node's contributions; returns viewers dropped per session (None on error)"""
+        if not self.enabled:
+            return None
+
+        try:
+            pipe = self.redis.pipeline()
+            for session_id in session_ids:
+                pipe.eval(
+                    self._LIVE_RECONCILE_SCRIPT, 4, *self._live_counter_keys(session_id, node_id),
+                    node_ttl, f"live:counts:{session_id}:node:"
+                )
+            results = await pipe.execute()
+            return {session_id: int(dropped) for session_id, dropped in zip(session_ids, results)}
+        except Exception as e:
+            print(f"⚠️  Redis live counter RECONCILE error: {e}")
+            return None
+
+    async def live_counter_set_capacity(self, session_id: str, capacity: int, ttl: int) -> bool:
+        if not self.enabled:
+            return False
+
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(f"live:counts:{session_id}", "capacity", capacity)
+            pipe.expire(f"live:counts:{session_id}", ttl)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            print(f"⚠️  Redis live counter CAPACITY error: {e}")
+            return False
+
+    async def live_counters_get(self, session_ids: List[str]) -> Optional[Dict[str, Dict[str, int]]]:
+        """Counters for several sessions in one round trip (None on error)"""
+        if not self.enabled:
+            return None
+
+        try:
+            pipe = self.redis.pipeline()
+            for session_id in session_ids:
+                pipe.hgetall(f"live:counts:{session_id}")
+            results = await pipe.execute()
+            return {
+                session_id: {field: int(value) for field, value in counts.items()}
+                for session_id, counts in zip(session_ids, results)
+            }
+        except Exception as e:
+            print(f"⚠️  Redis live counter GET error: {e}")
+            return None
+
+    async def live_counter_end(self, session_id: str, node_id: str, ttl: int):
+        """Delete an ended session's counters and tombstone it, so late joins/leaves don't recreate them"""
+        if not self.enabled:
+            return
+
+        try:
+            counts, node, nodes, ended = self._live_counter_keys(session_id, node_id)
+            pipe = self.redis.pipeline()
+            pipe.set(ended, "1", ex=ttl)
+            pipe.delete(counts, node, nodes)
+            await pipe.execute()
+        except Exception as e:
+            print(f"⚠️  Redis live counter END error: {e}")
+
     # === Analytics/Stats Caching ===
     
     async def increment_views(self, video_id: str):
@@ -10,6 +10,13 @@ from .db import supabase
 from .models import UserProfile
 from .websocket_manager import notify_new_follower
 
+# Try to import follower timelines (needs Redis)
+try:
+    from .timeline import timeline_service
+    HAS_TIMELINES = True
+except ImportError:
+    HAS_TIMELINES = False
+
 router = APIRouter(prefix="/social", tags=["Social"])
 
 
@@ -51,6 +58,13 @@ async def follow_user(
         # Increment current user's following_count
         supabase.rpc("increment_following", {"user_id": current_user["id"]}).execute()
         
+        # Backfill followed creator's uploads into the follower timeline
+        if HAS_TIMELINES:
+            try:
+                await timeline_service.on_follow(current_user["id"], user_id)
+            except Exception as e:
+                print(f"⚠️  Timeline backfill failed: {e}")
+        
         # Send WebSocket notification to followed user
         await notify_new_follower(
             user_id=user_id,
@@ -95,6 +109,13 @@ async def unfollow_user(
         supabase.rpc("decrement_followers", {"user_id": user_id}).execute()
         supabase.rpc("decrement_following", {"user_id": current_user["id"]}).execute()
         
+        # Trim unfollowed creator's uploads out of the follower timeline
+        if HAS_TIMELINES:
+            try:
+                await timeline_service.on_unfollow(current_user["id"], user_id)
+            except Exception as e:
+                print(f"⚠️  Timeline trim failed: {e}")
+        
         return {
             "message": "Successfully unfollowed user",
             "following": False
@@ -202,6 +223,13 @@ async def get_following_feed(
 ):
     """Get video feed from users you follow"""
     try:
+        # Fast path: materialized timeline read + bulk hydration
+        if HAS_TIMELINES:
+            video_ids = await timeline_service.get_timeline_page(current_user["id"], limit, offset)
+            if video_ids is not None:
+                return await timeline_service.hydrate(video_ids)
+        
+        # Fallback (Redis unavailable): pull from followed users directly
         # Get list of users current user follows
         following_result = supabase.table("follows").select(
             "following_id"
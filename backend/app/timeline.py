@@ -0,0 +1,311 @@
+"""
+Follower timelines (hybrid fan-out)
+Each user's following feed is materialized in Redis as a capped sorted set of
+video ids scored by upload time. Uploads are pushed to follower timelines by a
+background worker, so reading the following feed is a timeline read plus one
+bulk hydration query instead of an unbounded IN over the whole follow list.
+
+Creators with more than CELEBRITY_FOLLOWER_THRESHOLD followers are not fanned
+out (one upload would mean hundreds of thousands of writes). Their uploads go
+to a per-creator recent-uploads list instead, and readers who follow them merge
+those lists into their timeline at read time with a k-way heap merge. When a
+creator crosses the threshold, timelines built while they were still pushed
+get them added as a pull source (once, on their next upload).
+"""
+import asyncio
+import heapq
+import os
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Iterable
+
+from .db import supabase
+from .redis_cache import cache
+
+# Max video ids kept per timeline
+TIMELINE_MAX_SIZE = int(os.getenv("TIMELINE_MAX_SIZE", "500"))
+
+# Followers fetched (and timelines written) per fan-out round trip
+FANOUT_BATCH_SIZE = int(os.getenv("TIMELINE_FANOUT_BATCH_SIZE", "1000"))
+
+# Pending uploads waiting for fan-out; uploads beyond this are dropped
+# and picked up by timeline rebuilds instead
+FANOUT_QUEUE_SIZE = int(os.getenv("TIMELINE_FANOUT_QUEUE_SIZE", "10000"))
+
+# Creators at or above this follower count are pulled at read time, not pushed
+CELEBRITY_FOLLOWER_THRESHOLD = int(os.getenv("TIMELINE_CELEBRITY_THRESHOLD", "10000"))
+
+# Max video ids kept in each creator's recent-uploads list
+UPLOADS_MAX_SIZE = int(os.getenv("TIMELINE_UPLOADS_MAX_SIZE", "200"))
+
+# Max ids per IN (...) filter when rebuilding a cold timeline
+REBUILD_CHUNK_SIZE = 200
+
+TimelineEntry = Tuple[str, float]
+
+
+def video_score(created_at) -> float:
+    """Timeline score for a video (upload time as unix timestamp)"""
+    if isinstance(created_at, datetime):
+        return created_at.timestamp()
+    try:
+        return datetime.fromisoformat(str(created_at).replace("Z", "+00:00")).timestamp()
+    except (TypeError, ValueError):
+        return datetime.now().timestamp()
+
+
+def merge_timelines(streams: Iterable[List[TimelineEntry]], limit: int) -> List[str]:
+    """
+    K-way merge of newest-first (video_id, score) streams
+    Returns up to `limit` unique video ids, newest first. Each stream is
+    consumed lazily, so the cost is O(limit * log k) for k streams.
+    """
+    merged = []
+    seen = set()
+    for video_id, _ in heapq.merge(*streams, key=lambda entry: entry[1], reverse=True):
+        if video_id in seen:
+            continue
+        seen.add(video_id)
+        merged.append(video_id)
+        if len(merged) >= limit:
+            break
+    return merged
+
+
+class TimelineService:
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "uploads_fanned_out": 0,
+            "uploads_pulled": 0,
+            "timelines_written": 0,
+            "uploads_dropped": 0,
+            "timelines_rebuilt": 0,
+            "pull_sources_added": 0
+        }
+
+    def start(self):
+        """Start the background fan-out worker"""
+        if self.worker_task is None:
+            self.queue = asyncio.Queue(maxsize=FANOUT_QUEUE_SIZE)
+            self.worker_task = asyncio.create_task(self._worker())
+            print("🧵 Timeline fan-out worker started")
+
+    async def stop(self):
+        """Stop the background fan-out worker"""
+        if self.worker_task:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+            print("🧵 Timeline fan-out worker stopped")
+
+    def enqueue_upload(self, video: Dict):
+        """Queue a freshly uploaded video for fan-out (never blocks the request)"""
+        if self.queue is None or not cache.enabled:
+            return
+
+        try:
+            self.queue.put_nowait({
+                "id": video["id"],
+                "user_id": video["user_id"],
+                "created_at": video.get("created_at")
+            })
+        except asyncio.QueueFull:
+            self.stats["uploads_dropped"] += 1
+            print(f"⚠️  Timeline fan-out queue full, dropping {video['id']}")
+
+    async def _worker(self):
+        """Drain the fan-out queue one upload at a time"""
+        while True:
+            video = await self.queue.get()
+            try:
+                await self.fan_out(video)
+            except Exception as e:
+                print(f"❌ Timeline fan-out failed for {video['id']}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def fan_out(self, video: Dict):
+        """
+        Record a video in its author's recent uploads (if that list is cached)
+        and, unless the author is above the celebrity threshold, push it into
+        every follower's timeline
+        """
+        author_id = video["user_id"]
+        entry = {video["id"]: video_score(video.get("created_at"))}
+        await cache.record_uploads(author_id, entry, UPLOADS_MAX_SIZE)
+
+        followers_count = await asyncio.to_thread(self._fetch_followers_count, author_id)
+        if followers_count >= CELEBRITY_FOLLOWER_THRESHOLD:
+            if await cache.mark_pulled_creator(author_id):
+                # Just crossed the threshold: timelines built while this creator was
+                # pushed have to start pulling them, or they'd miss every new upload
+                async for follower_ids in self._follower_pages(author_id):
+                    self.stats["pull_sources_added"] += await cache.add_pull_source_to_timelines(
+                        follower_ids, author_id
+                    )
+            self.stats["uploads_pulled"] += 1
+            return  # Readers merge this creator's uploads at read time
+
+        await cache.unmark_pulled_creator(author_id)
+        async for follower_ids in self._follower_pages(author_id):
+            written = await cache.push_to_timelines(follower_ids, entry, TIMELINE_MAX_SIZE)
+            self.stats["timelines_written"] += written
+
+        self.stats["uploads_fanned_out"] += 1
+
+    async def _follower_pages(self, user_id: str):
+        """A creator's followers, FANOUT_BATCH_SIZE ids at a time"""
+        after = None
+        while True:
+            follower_ids = await asyncio.to_thread(
+                self._fetch_follower_page, user_id, after, FANOUT_BATCH_SIZE
+            )
+            if follower_ids:
+                yield follower_ids
+            if len(follower_ids) < FANOUT_BATCH_SIZE:
+                break
+            after = follower_ids[-1]
+
+    async def on_follow(self, follower_id: str, following_id: str):
+        """Backfill a followed creator into the follower's timeline"""
+        if not await cache.timeline_exists(follower_id):
+            return  # Built from scratch on next read
+
+        followers_count = await asyncio.to_thread(self._fetch_followers_count, following_id)
+        if followers_count >= CELEBRITY_FOLLOWER_THRESHOLD:
+            await cache.add_pull_source(follower_id, following_id)
+            return
+
+        videos = await asyncio.to_thread(self._fetch_recent_uploads, [following_id], TIMELINE_MAX_SIZE)
+        entries = {v["id"]: video_score(v["created_at"]) for v in videos}
+        await cache.push_to_timelines([follower_id], entries, TIMELINE_MAX_SIZE)
+
+    async def on_unfollow(self, follower_id: str, following_id: str):
+        """Trim an unfollowed creator out of the follower's timeline"""
+        if not await cache.timeline_exists(follower_id):
+            return
+
+        await cache.remove_pull_source(follower_id, following_id)
+        videos = await asyncio.to_thread(self._fetch_recent_uploads, [following_id], TIMELINE_MAX_SIZE)
+        await cache.remove_from_timeline(follower_id, [v["id"] for v in videos])
+
+    async def get_timeline_page(self, user_id: str, limit: int, offset: int) -> Optional[List[str]]:
+        """
+        Get video ids for a page of the following feed
+        Returns None when timelines are unavailable (Redis disabled/down)
+        """
+        if not cache.enabled:
+            return None
+
+        window = offset + limit
+        timeline = await cache.get_timeline(user_id, 0, window - 1)
+        if timeline is None:
+            timeline = await self.rebuild(user_id)
+            if timeline is None:
+                return None
+
+        entries, pull_ids = timeline
+        if not pull_ids:
+            return [video_id for video_id, _ in entries[offset:window]]
+
+        uploads = await self._get_pull_uploads(pull_ids, window)
+        return merge_timelines([entries[:window]] + uploads, window)[offset:]
+
+    async def _get_pull_uploads(self, creator_ids: List[str], count: int) -> List[List[TimelineEntry]]:
+        """Recent uploads of pulled creators, filling cold lists from the database"""
+        uploads = await cache.get_recent_uploads(creator_ids, count)
+
+        missing = [creator_id for creator_id, entries in uploads.items() if entries is None]
+        if missing:
+            # One query per creator: a shared LIMIT could starve one creator's list,
+            # which would then be cached as if it were complete
+            fetched = await asyncio.gather(*(
+                asyncio.to_thread(self._fetch_recent_uploads, [creator_id], UPLOADS_MAX_SIZE)
+                for creator_id in missing
+            ))
+            for creator_id, videos in zip(missing, fetched):
+                entries = {v["id"]: video_score(v["created_at"]) for v in videos}
+                await cache.store_uploads(creator_id, entries, UPLOADS_MAX_SIZE)
+                uploads[creator_id] = sorted(entries.items(), key=lambda e: e[1], reverse=True)[:count]
+
+        return [entries for entries in uploads.values() if entries]
+
+    async def rebuild(self, user_id: str) -> Optional[Tuple[List[TimelineEntry], List[str]]]:
+        """Build a cold timeline from the database (pull path, bounded by TIMELINE_MAX_SIZE)"""
+        following = await asyncio.to_thread(self._fetch_following, user_id)
+        push_ids = [uid for uid, count in following if count < CELEBRITY_FOLLOWER_THRESHOLD]
+        pull_ids = [uid for uid, count in following if count >= CELEBRITY_FOLLOWER_THRESHOLD]
+
+        videos = []
+        for i in range(0, len(push_ids), REBUILD_CHUNK_SIZE):
+            chunk = push_ids[i:i + REBUILD_CHUNK_SIZE]
+            videos.extend(await asyncio.to_thread(self._fetch_recent_uploads, chunk, TIMELINE_MAX_SIZE))
+
+        entries = sorted(
+            ((v["id"], video_score(v["created_at"])) for v in videos),
+            key=lambda e: e[1],
+            reverse=True
+        )[:TIMELINE_MAX_SIZE]
+
+        await cache.store_timeline(user_id, dict(entries), pull_ids, TIMELINE_MAX_SIZE)
+        self.stats["timelines_rebuilt"] += 1
+        return entries, pull_ids
+
+    async def hydrate(self, video_ids: List[str]) -> List[Dict]:
+        """Load full video rows for ids in one query, preserving timeline order"""
+        if not video_ids:
+            return []
+
+        rows = await asyncio.to_thread(self._fetch_videos, video_ids)
+        by_id = {row["id"]: row for row in rows}
+        return [by_id[video_id] for video_id in video_ids if video_id in by_id]
+
+    # === Database helpers (blocking, run in a thread) ===
+
+    @staticmethod
+    def _fetch_followers_count(user_id: str) -> int:
+        result = supabase.table("users").select("followers_count").eq("id", user_id).execute()
+        return (result.data[0].get("followers_count") or 0) if result.data else 0
+
+    @staticmethod
+    def _fetch_follower_page(user_id: str, after: Optional[str], limit: int) -> List[str]:
+        """Followers ordered by id, starting after `after` (keyset paging stays O(limit) per page)"""
+        query = supabase.table("follows").select("follower_id").eq("following_id", user_id)
+        if after is not None:
+            query = query.gt("follower_id", after)
+        result = query.order("follower_id").limit(limit).execute()
+        return [row["follower_id"] for row in result.data]
+
+    @staticmethod
+    def _fetch_following(user_id: str) -> List[Tuple[str, int]]:
+        result = supabase.table("follows").select("""
+            following_id,
+            users!follows_following_id_fkey (followers_count)
+        """).eq("follower_id", user_id).execute()
+        return [
+            (row["following_id"], (row.get("users") or {}).get("followers_count") or 0)
+            for row in result.data
+        ]
+
+    @staticmethod
+    def _fetch_recent_uploads(user_ids: List[str], limit: int) -> List[Dict]:
+        result = supabase.table("videos").select("id, user_id, created_at").in_(
+            "user_id", user_ids
+        ).order("created_at", desc=True).limit(limit).execute()
+        return result.data
+
+    @staticmethod
+    def _fetch_videos(video_ids: List[str]) -> List[Dict]:
+        result = supabase.table("videos").select("""
+            *,
+            users!videos_user_id_fkey (username, avatar_url)
+        """).in_("id", video_ids).execute()
+        return result.data
+
+
+# Global instance
+timeline_service = TimelineService()
@@ -1,13 +1,30 @@
 """
 Automated trending videos updater
 Runs periodically to calculate and cache trending videos
+
+Every uvicorn worker on every instance runs this scheduler, but only the
+leader (holder of a Redis lock with TTL, renewed in the background) computes
+trending. After writing `trending:videos` it publishes on a pub/sub channel and
+the other processes refresh their in-process copy from Redis.
 """
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional
 import asyncio
+import os
+import socket
+import time
+import uuid
 from .db import supabase
 
+# Leader lock: held for LEADER_LOCK_TTL seconds, renewed every third of that
+LEADER_LOCK_KEY = "trending:leader"
+LEADER_LOCK_TTL = int(os.getenv("TRENDING_LEADER_TTL", "60"))
+
+# Leader publishes here after each recompute
+TRENDING_UPDATED_CHANNEL = "trending:updated"
+
+
 class TrendingScheduler:
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
@@ -15,6 +32,87 @@ class TrendingScheduler:
             "trending_videos": [],
             "last_updated": None
         }
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.lock_expires_at = 0.0  # Monotonic time our lock runs out unless renewed
+        self.listener_task: Optional[asyncio.Task] = None
+    
+    async def ensure_leadership(self) -> bool:
+        """
+        Take or keep the trending leader lock
+        Without Redis there is nothing to coordinate with, so every process leads.
+        """
+        from .redis_cache import cache as redis_cache
+        if not redis_cache.enabled:
+            self.is_leader = True
+            return True
+        
+        ttl_ms = LEADER_LOCK_TTL * 1000
+        now = time.monotonic()
+        if self.is_leader:
+            renewed = await redis_cache.renew_lock(LEADER_LOCK_KEY, self.instance_id, ttl_ms)
+            if renewed is None:
+                # Redis error, not a lost lock: nobody else can take it before it expires
+                renewed = now < self.lock_expires_at
+            else:
+                self.lock_expires_at = now + LEADER_LOCK_TTL if renewed else 0.0
+            self.is_leader = renewed
+            if not self.is_leader:
+                print(f"⚠️  Lost trending leadership ({self.instance_id})")
+        
+        if not self.is_leader:
+            acquired = await redis_cache.acquire_lock(LEADER_LOCK_KEY, self.instance_id, ttl_ms)
+            if not acquired and await redis_cache.lock_holder(LEADER_LOCK_KEY) == self.instance_id:
+                # Still ours (an earlier renew failed): extend it rather than wait for it to expire
+                acquired = await redis_cache.renew_lock(LEADER_LOCK_KEY, self.instance_id, ttl_ms)
+            self.is_leader = bool(acquired)
+            if self.is_leader:
+                self.lock_expires_at = now + LEADER_LOCK_TTL
+                print(f"👑 Trending leader elected: {self.instance_id}")
+        
+        return self.is_leader
+    
+    async def run_trending_job(self):
+        """Scheduled job: the leader computes, everyone else reads the shared result"""
+        if await self.ensure_leadership():
+            await self.calculate_trending_videos()
+        else:
+            await self.refresh_from_shared_cache()
+    
+    async def refresh_from_shared_cache(self):
+        """Refresh the in-process copy from the leader's `trending:videos`"""
+        from .redis_cache import cache as redis_cache
+        videos = await redis_cache.get_trending_videos()
+        if not videos:
+            return
+        
+        # Redis holds VideoMetadata dicts; keep the DB row shape used in-process
+        self.cache["trending_videos"] = [
+            {**video, "users": {"username": video.get("username"), "avatar_url": video.get("avatar_url")}}
+            for video in videos
+        ]
+        self.cache["last_updated"] = datetime.now()
+        print(f"📥 Trending videos refreshed from leader: {len(videos)} videos")
+    
+    async def _listen_for_updates(self):
+        """Refresh whenever another process announces a new trending result"""
+        from .redis_cache import cache as redis_cache
+        while True:
+            pubsub = redis_cache.pubsub()
+            if pubsub is None:
+                return
+            try:
+                await pubsub.subscribe(TRENDING_UPDATED_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message" and message.get("data") != self.instance_id:
+                        await self.refresh_from_shared_cache()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Trending update listener error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.close()
     
     async def calculate_trending_videos(self) -> List[Dict]:
         """
@@ -87,6 +185,7 @@ class TrendingScheduler:
                             avatar_url=user_data.get("avatar_url")
                         ).dict())
                     await redis_cache.set_trending_videos(serializable_trending, expire=900)
+                    await redis_cache.publish(TRENDING_UPDATED_CHANNEL, self.instance_id)
             except Exception as cache_error:
                 print(f"⚠️  Could not update Redis cache: {cache_error}")
             
@@ -103,9 +202,9 @@ class TrendingScheduler:
     
     def start(self):
         """Start the scheduler"""
-        # Run every 15 minutes
+        # Run every 15 minutes (only the leader actually computes)
         self.scheduler.add_job(
-            self.calculate_trending_videos,
+            self.run_trending_job,
             'interval',
             minutes=15,
             id='trending_update',
@@ -114,17 +213,42 @@ class TrendingScheduler:
         
         # Also run at startup
         self.scheduler.add_job(
-            self.calculate_trending_videos,
+            self.run_trending_job,
             'date',
             run_date=datetime.now() + timedelta(seconds=5)
         )
         
+        # Keep the leader lock alive (and let a standby take over if the leader dies)
+        self.scheduler.add_job(
+            self.ensure_leadership,
+            'interval',
+            seconds=max(1, LEADER_LOCK_TTL // 3),
+            id='trending_leader_renew',
+            replace_existing=True
+        )
+        
         self.scheduler.start()
+        self.listener_task = asyncio.create_task(self._listen_for_updates())
         print("📊 Trending scheduler started (updates every 15 minutes)")
     
-    def stop(self):
-        """Stop the scheduler"""
-        self.scheduler.shutdown()
+    async def stop(self):
+        """Stop the scheduler and hand over leadership"""
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+        
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+        
+        if self.is_leader:
+            from .redis_cache import cache as redis_cache
+            await redis_cache.release_lock(LEADER_LOCK_KEY, self.instance_id)
+            self.is_leader = False
+        
         print("📊 Trending scheduler stopped")
 
 # Global instance
@@ -0,0 +1,99 @@
+"""
+New-upload notifications for online followers
+An upload used to be broadcast to every connected socket on the request path.
+Uploads are now queued, and a background worker pages through the uploader's
+followers, keeps the ones presence says are online and sends them one shared
+new_video frame. Offline followers get nothing here (the following feed and
+timelines already cover them), and the upload response never waits on it.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+from .timeline import TimelineService
+from .websocket_manager import ws_manager
+from .presence import presence_service, PRESENCE_MAX_BATCH
+
+# Pending uploads waiting for notification; uploads beyond this are not announced
+UPLOAD_NOTIFY_QUEUE_SIZE = int(os.getenv("UPLOAD_NOTIFY_QUEUE_SIZE", "1000"))
+
+# Followers fetched per query; one presence lookup per page
+FOLLOWER_PAGE_SIZE = PRESENCE_MAX_BATCH
+
+
+class UploadNotifier:
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker_task: Optional[asyncio.Task] = None
+        self.stats = {"uploads": 0, "followers_checked": 0, "notified": 0, "dropped": 0}
+
+    def start(self):
+        """Start the background notification worker"""
+        if self.worker_task is None:
+            self.queue = asyncio.Queue(maxsize=UPLOAD_NOTIFY_QUEUE_SIZE)
+            self.worker_task = asyncio.create_task(self._worker())
+            print("📣 Upload notification worker started")
+
+    async def stop(self):
+        """Stop the worker (queued announcements are dropped)"""
+        if self.worker_task:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+
+    def enqueue_upload(self, video: Dict, uploader_username: str):
+        """Queue a new video for its uploader's online followers (never blocks the request)"""
+        if self.queue is None:
+            return
+
+        try:
+            self.queue.put_nowait({
+                "type": "new_video",
+                "uploader_id": video["user_id"],
+                "uploader_username": uploader_username,
+                "video_id": video["id"],
+                "video_title": video.get("title"),
+                "thumbnail_url": video.get("thumbnail_url") or "",
+                "timestamp": datetime.now().isoformat()
+            })
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"⚠️  Upload notification queue full, not announcing {video['id']}")
+
+    async def _worker(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.notify_followers(message)
+            except Exception as e:
+                print(f"❌ Upload notification failed for {message['video_id']}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def notify_followers(self, message: Dict):
+        """Send message to the uploader's followers that are online now"""
+        uploader_id = message["uploader_id"]
+        after = None
+        while True:
+            follower_ids = await asyncio.to_thread(
+                TimelineService._fetch_follower_page, uploader_id, after, FOLLOWER_PAGE_SIZE
+            )
+            if follower_ids:
+                online = await presence_service.is_online(follower_ids)
+                recipients = [user_id for user_id, is_online in online.items() if is_online]
+                ws_manager.send_to_users(recipients, message)
+                self.stats["followers_checked"] += len(follower_ids)
+                self.stats["notified"] += len(recipients)
+            if len(follower_ids) < FOLLOWER_PAGE_SIZE:
+                break
+            after = follower_ids[-1]
+
+        self.stats["uploads"] += 1
+
+
+# Global instance (one per worker process)
+upload_notifier = UploadNotifier()
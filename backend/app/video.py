@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, status
+from fastapi.responses import Response
 from typing import Optional, List
 from datetime import datetime
 import uuid
@@ -7,6 +8,8 @@ import os
 from .models import VideoUpload, VideoMetadata, VideoComment, VideoCommentResponse
 from .db import db, supabase
 from .auth import get_current_user, get_current_user_optional
+from .feed_snapshot import feed_snapshot
+from .upload_notify import upload_notifier
 
 # Try to import video upload service
 try:
@@ -23,6 +26,20 @@ try:
 except ImportError:
     HAS_REDIS_CACHE = False
 
+# Try to import follower timelines (needs Redis)
+try:
+    from .timeline import timeline_service
+    HAS_TIMELINES = True
+except ImportError:
+    HAS_TIMELINES = False
+
+# Try to import personalized feed ranking (needs Redis)
+try:
+    from .ranking import feed_ranker
+    HAS_RANKING = True
+except ImportError:
+    HAS_RANKING = False
+
 router = APIRouter(prefix="/videos", tags=["Videos"])
 
 
@@ -106,18 +123,12 @@ async def upload_video(
                 detail="Failed to create video"
             )
         
-        # Broadcast new video upload to all connected users
-        try:
-            from .websocket_manager import broadcast_new_video
-            await broadcast_new_video(
-                uploader_id=current_user["id"],
-                uploader_username=current_user["username"],
-                video_id=created_video["id"],
-                video_title=created_video["title"],
-                thumbnail_url=created_video.get("thumbnail_url", "")
-            )
-        except Exception as e:
-            print(f"⚠️  Failed to broadcast new video: {e}")
+        # Queue fan-out into follower timelines (background worker)
+        if HAS_TIMELINES:
+            timeline_service.enqueue_upload(created_video)
+        
+        # Queue a new_video notice for the uploader's online followers (background worker)
+        upload_notifier.enqueue_upload(created_video, current_user["username"])
         
         return VideoMetadata(
             id=created_video["id"],
@@ -149,19 +160,36 @@ async def get_video_feed(
     offset: int = 0,
     current_user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    """Get video feed with pagination and trending sorting"""
+    """
+    Get video feed with pagination
+    Signed-in users get a personalized "For You" ranking; anonymous users
+    (and ranking fallbacks) get the canonical newest-first feed
+    """
     user_id = current_user["id"] if current_user else None
     
-    # Try to get from cache first
-    if HAS_REDIS_CACHE:
-        cached_feed = await cache.get_video_feed(user_id, limit, offset)
-        if cached_feed:
-            print(f"✅ Cache HIT: feed ({len(cached_feed)} videos)")
-            return cached_feed
+    # Anonymous traffic: serve pre-encoded page from the in-memory snapshot (no I/O)
+    if user_id is None:
+        snapshot_page = feed_snapshot.get(limit, offset)
+        if snapshot_page is not None:
+            return Response(content=snapshot_page, media_type="application/json")
+    
+    # Personalized ranking (pages are slices of the user's cached ranked list)
+    videos = None
+    if user_id and HAS_RANKING:
+        videos = await feed_ranker.rank_feed(user_id, limit, offset)
+    ranked = videos is not None
     
-    # Cache miss - fetch from database
-    print(f"⚠️  Cache MISS: feed - fetching from DB")
-    videos = db.get_videos_feed(limit=limit, offset=offset, user_id=user_id)
+    if not ranked:
+        # Try to get from cache first
+        if HAS_REDIS_CACHE:
+            cached_feed = await cache.get_video_feed(user_id, limit, offset)
+            if cached_feed:
+                print(f"✅ Cache HIT: feed ({len(cached_feed)} videos)")
+                return cached_feed
+        
+        # Cache miss - fetch from database
+        print(f"⚠️  Cache MISS: feed - fetching from DB")
+        videos = db.get_videos_feed(limit=limit, offset=offset, user_id=user_id)
     
     result = []
     for video in videos:
@@ -184,7 +212,7 @@ async def get_video_feed(
         ))
     
     # Cache the result
-    if HAS_REDIS_CACHE and result:
+    if HAS_REDIS_CACHE and result and not ranked:
         await cache.set_video_feed(user_id, limit, offset, [v.dict() for v in result], expire=300)
         print(f"💾 Cached feed: {len(result)} videos (5 min TTL)")
     
@@ -3,16 +3,70 @@ WebSocket Manager for Real-time Features
 Handles connections, broadcasts, and room-based messaging
 """
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, Set, List, Optional
+from typing import Callable, Dict, Set, List, Optional
 import json
 import asyncio
+import functools
+import inspect
 from datetime import datetime
 import uuid
+import os
+import time
+
+from .ws_connection import ClientConnection, Frame, accept_websocket, negotiate_codec, new_delivery_metrics
+from .ws_heartbeat import HeartbeatWheel
+from .live_actor import SessionActor
+from .live_counters import GUEST_ROLES, live_counters
+from .ws_throttle import ACTION_LIMITS, MAX_SLOW_MODE_SECONDS, TokenBucket, slow_mode_limit
+from .ws_broker import ALL_CHANNEL, USERS_CHANNEL, InMemoryBroker, NodeCounts, channel_for, parse_channel
+from .live_events import (
+    ChatBatcher, IceCandidateBatcher, ReactionAggregator, SessionHistory, chat_store, reaction_store,
+    strip_nul, HISTORY_TYPES, MAX_REACTION_LENGTH
+)
+
+# Viewer counts are marked dirty on join/leave and sent at most once per interval
+VIEWER_COUNT_INTERVAL = float(os.getenv("WS_VIEWER_COUNT_INTERVAL", "1.0"))
+
+# Roles that receive individual viewer join/leave events
+STAGE_MANAGER_ROLES = ["host", "cohost"]
+
+# Roles that exchange WebRTC media (the peer set); viewers only receive via stage peers
+PEER_ROLES = ["host", "cohost", "guest"]
+
+# "mesh": every peer signals every other peer; "star": only the host signals with the others
+WEBRTC_TOPOLOGY = os.getenv("LIVE_WEBRTC_TOPOLOGY", "mesh")
+
+
+class LiveParticipant:
+    """
+    One participant of a live session. Slotted, with connected_at as an epoch
+    float, since hot sessions hold one of these per viewer.
+    """
+    __slots__ = ("connection", "role", "username", "connected_at", "audio_enabled", "video_enabled", "buckets")
+
+    def __init__(self, connection: ClientConnection, role: str, username: str):
+        self.connection = connection
+        self.role = role
+        self.username = username
+        self.connected_at = time.time()
+        self.audio_enabled = True
+        self.video_enabled = role != "viewer"  # Viewers don't have video by default
+        self.buckets: Optional[Dict[str, TokenBucket]] = None  # Per-action rate limits, on first use
+
+    def to_dict(self, user_id: str) -> dict:
+        return {
+            "user_id": user_id,
+            "username": self.username,
+            "role": self.role,
+            "audio_enabled": self.audio_enabled,
+            "video_enabled": self.video_enabled
+        }
+
 
 class ConnectionManager:
-    def __init__(self):
-        # Active connections: {user_id: {connection_id: WebSocket}}
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
+    def __init__(self, broker=None):
+        # Active connections: {user_id: {connection_id: ClientConnection}}
+        self.active_connections: Dict[str, Dict[str, ClientConnection]] = {}
         
         # Room subscriptions: {room_name: Set[user_id]}
         self.rooms: Dict[str, Set[str]] = {}
@@ -20,35 +74,198 @@ class ConnectionManager:
         # Video viewers: {video_id: Set[user_id]}
         self.video_viewers: Dict[str, Set[str]] = {}
         
-        # Live session connections: {session_id: {user_id: {websocket, role, username}}}
-        self.live_sessions: Dict[str, Dict[str, dict]] = {}
+        # Reverse indexes so disconnect only touches the user's own memberships
+        self.user_rooms: Dict[str, Set[str]] = {}   # user_id: Set[room_name]
+        self.user_videos: Dict[str, Set[str]] = {}  # user_id: Set[video_id]
+        
+        # Live session participants: {session_id: {user_id: LiveParticipant}}
+        self.live_sessions: Dict[str, Dict[str, LiveParticipant]] = {}
         
         # WebRTC peer connections tracking
         self.webrtc_peers: Dict[str, Set[str]] = {}  # session_id: Set[user_ids]
         
+        # Frames dropped/coalesced for slow clients on /ws/connect sockets
+        self.delivery_metrics = new_delivery_metrics()
+        
+        # Ping/pong deadlines for every socket (/ws/connect and live sessions)
+        self.heartbeats = HeartbeatWheel()
+        
+        # Videos whose local viewer count changed since the last tick, and other nodes' counts
+        self.dirty_videos: Set[str] = set()
+        self.video_counts = NodeCounts()
+        self.tick_callbacks: List[Callable[[], None]] = [self.flush_viewer_counts, self.heartbeats.sweep]
+        self.ticker_task: Optional[asyncio.Task] = None
+        
+        # Pub/sub backbone: broadcasts reach sockets held by other workers/instances
+        self.node_id = uuid.uuid4().hex
+        self.broker = broker or InMemoryBroker()
+        self.channel_handlers: Dict[str, Callable[[str, dict], None]] = {
+            "all": self._deliver_all,
+            "user": self._deliver_user,
+            "users": self._deliver_users,
+            "room": self._deliver_room,
+            "video": self._deliver_video,
+        }
+    
+    # === Broker ===
+    
+    async def start_broker(self, broker=None):
+        """Start delivering broadcasts published by other nodes"""
+        if broker is not None:
+            self.broker = broker
+        try:
+            await self.broker.start(self._on_broker_message)
+        except Exception as e:
+            print(f"⚠️  WebSocket broker failed to start, broadcasts stay on this node: {e}")
+            self.broker = InMemoryBroker()
+            await self.broker.start(self._on_broker_message)
+        
+        # Channels for anything that already has local members
+        for user_id in self.active_connections:
+            self.broker.subscribe(channel_for("user", user_id))
+        for room in self.rooms:
+            self.broker.subscribe(channel_for("room", room))
+        for video_id in self.video_viewers:
+            self.broker.subscribe(channel_for("video", video_id))
+        for session_id in self.live_sessions:
+            self.broker.subscribe(channel_for("session", session_id))
+    
+    async def stop_broker(self):
+        """Stop the broker (local delivery keeps working)"""
+        await self.broker.stop()
+    
+    def _publish(self, channel: str, message: dict, **targeting):
+        """Publish a broadcast for other nodes (this node has already delivered it)"""
+        envelope = {"origin": self.node_id, "message": message}
+        for key, value in targeting.items():
+            if value is not None:
+                envelope[key] = value
+        self.broker.publish(channel, envelope)
+    
+    def _on_broker_message(self, channel: str, envelope: dict):
+        """Deliver a broadcast from another node to our local sockets"""
+        if envelope.get("origin") == self.node_id:
+            return
+        kind, target = parse_channel(channel)
+        handler = self.channel_handlers.get(kind)
+        if handler:
+            handler(target, envelope)
+    
+    def _deliver_all(self, _target: str, envelope: dict):
+        frame = Frame(envelope["message"])
+        exclude_user = envelope.get("exclude_user")
+        for user_id in self.active_connections:
+            if user_id != exclude_user:
+                self._enqueue(user_id, frame)
+    
+    def _deliver_user(self, user_id: str, envelope: dict):
+        self._enqueue(user_id, Frame(envelope["message"]))
+    
+    def _deliver_users(self, _target: str, envelope: dict):
+        frame = Frame(envelope["message"])
+        for user_id in envelope["to_users"]:
+            self._enqueue(user_id, frame)
+    
+    def _deliver_room(self, room: str, envelope: dict):
+        if room in self.rooms:
+            frame = Frame(envelope["message"])
+            exclude_user = envelope.get("exclude_user")
+            for user_id in self.rooms[room]:
+                if user_id != exclude_user:
+                    self._enqueue(user_id, frame)
+    
+    def _deliver_video(self, video_id: str, envelope: dict):
+        if "node_count" in envelope:
+            if video_id in self.video_viewers:
+                self.video_counts.receive(video_id, envelope["origin"], envelope["node_count"])
+            return
+        if video_id in self.video_viewers:
+            frame = Frame(envelope["message"])
+            for user_id in self.video_viewers[video_id]:
+                self._enqueue(user_id, frame)
+    
+    # === Ticker (coalesced viewer counts, heartbeat sweep) ===
+    
+    def start_ticker(self):
+        """Start the periodic flush of coalesced updates"""
+        if self.ticker_task is None:
+            self.ticker_task = asyncio.create_task(self._tick_loop())
+    
+    async def stop_ticker(self):
+        """Stop the periodic flush"""
+        if self.ticker_task:
+            self.ticker_task.cancel()
+            try:
+                await self.ticker_task
+            except asyncio.CancelledError:
+                pass
+            self.ticker_task = None
+    
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(VIEWER_COUNT_INTERVAL)
+            for callback in self.tick_callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"⚠️  WebSocket tick error: {e}")
+    
+    def flush_viewer_counts(self):
+        """
+        Send one viewer_update per video whose cluster-wide count changed since the last tick
+        Our local count is announced to the other nodes watching the video; each
+        node adds up the announcements and delivers the total to its own viewers.
+        """
+        dirty, self.dirty_videos = self.dirty_videos, set()
+        announce, changed = self.video_counts.collect(dirty, self.video_viewers)
+        for video_id in announce:
+            self._publish(channel_for("video", video_id), None,
+                          node_count=len(self.video_viewers.get(video_id, ())))
+        
+        timestamp = datetime.now().isoformat()
+        for video_id in changed:
+            viewers = self.video_viewers.get(video_id)
+            if not viewers:
+                self.video_counts.forget(video_id)
+                continue
+            total = self.video_counts.total(video_id, len(viewers))
+            if video_id in dirty or self.video_counts.sent.get(video_id) != total:
+                self.video_counts.sent[video_id] = total
+                self._deliver_video(video_id, {"message": {
+                    "type": "viewer_update",
+                    "video_id": video_id,
+                    "viewer_count": total,
+                    "timestamp": timestamp
+                }})
+    
+    # === Connections ===
+    
     async def connect(self, websocket: WebSocket, user_id: str, connection_id: str = None):
         """Connect a new WebSocket client"""
-        await websocket.accept()
+        codec = await accept_websocket(websocket)
         
         if connection_id is None:
             connection_id = str(uuid.uuid4())
         
         if user_id not in self.active_connections:
             self.active_connections[user_id] = {}
+            self.broker.subscribe(channel_for("user", user_id))
         
-        self.active_connections[user_id][connection_id] = websocket
+        connection = ClientConnection(
+            websocket, user_id, connection_id,
+            on_close=self._on_connection_closed, metrics=self.delivery_metrics, codec=codec
+        )
+        self.active_connections[user_id][connection_id] = connection
+        self.heartbeats.track(connection)
         
         # Send welcome message
-        await self.send_personal_message(
-            {
-                "type": "connection_established",
-                "message": "Connected to TrendKe WebSocket",
-                "user_id": user_id,
-                "connection_id": connection_id,
-                "timestamp": datetime.now().isoformat()
-            },
-            user_id
-        )
+        connection.send({
+            "type": "connection_established",
+            "message": "Connected to TrendKe WebSocket",
+            "user_id": user_id,
+            "connection_id": connection_id,
+            "timestamp": datetime.now().isoformat()
+        })
         
         print(f"✅ WebSocket connected: user={user_id}, connection={connection_id}")
         return connection_id
@@ -56,114 +273,143 @@ class ConnectionManager:
     def disconnect(self, user_id: str, connection_id: str):
         """Disconnect a WebSocket client"""
         if user_id in self.active_connections:
-            if connection_id in self.active_connections[user_id]:
-                del self.active_connections[user_id][connection_id]
+            connection = self.active_connections[user_id].pop(connection_id, None)
+            if connection:
+                connection.detach()
                 
             # Remove user if no more connections
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
+                self.broker.unsubscribe(channel_for("user", user_id))
                 
-                # Clean up room subscriptions
-                for room_users in self.rooms.values():
-                    room_users.discard(user_id)
+                # Clean up room subscriptions (O(rooms of this user))
+                for room in self.user_rooms.pop(user_id, ()):
+                    if self._discard_member(self.rooms, room, user_id):
+                        self.broker.unsubscribe(channel_for("room", room))
                 
                 # Clean up video viewers
-                for viewers in self.video_viewers.values():
-                    viewers.discard(user_id)
+                for video_id in self.user_videos.pop(user_id, ()):
+                    self.dirty_videos.add(video_id)
+                    if self._discard_member(self.video_viewers, video_id, user_id):
+                        self.broker.unsubscribe(channel_for("video", video_id))
         
         print(f"🔌 WebSocket disconnected: user={user_id}, connection={connection_id}")
     
+    def _on_connection_closed(self, connection: ClientConnection):
+        """Writer gave up on a connection (send failed or queue overflowed)"""
+        if self.active_connections.get(connection.user_id, {}).get(connection.connection_id) is connection:
+            self.disconnect(connection.user_id, connection.connection_id)
+    
+    def _enqueue(self, user_id: str, message: Frame):
+        """Queue a frame on every connection of a user (never blocks)"""
+        connections = self.active_connections.get(user_id)
+        if connections:
+            for connection in connections.values():
+                connection.send(message)
+    
+    def touch(self, user_id: str, connection_id: str):
+        """Record activity from a client (resets its heartbeat deadline)"""
+        connection = self.active_connections.get(user_id, {}).get(connection_id)
+        if connection:
+            connection.touch()
+    
+    def send_to_connection(self, user_id: str, connection_id: str, message: dict):
+        """Queue message on one specific connection (replies to that client)"""
+        connection = self.active_connections.get(user_id, {}).get(connection_id)
+        if connection:
+            connection.send(message)
+    
+    # === Broadcasts (local delivery + one publish for other nodes) ===
+    
     async def send_personal_message(self, message: dict, user_id: str):
-        """Send message to specific user (all their connections)"""
-        if user_id in self.active_connections:
-            disconnected = []
-            for connection_id, websocket in self.active_connections[user_id].items():
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    print(f"⚠️  Failed to send to {user_id}/{connection_id}: {e}")
-                    disconnected.append(connection_id)
-            
-            # Clean up disconnected
-            for connection_id in disconnected:
-                self.disconnect(user_id, connection_id)
+        """Send message to specific user (all their connections, on any node)"""
+        self._enqueue(user_id, Frame(message))
+        self._publish(channel_for("user", user_id), message)
+    
+    def send_to_users(self, user_ids: List[str], message: dict):
+        """
+        Send one message to many users (encoded once). Users connected here get it
+        locally; the rest are listed in a single publish for the other nodes (so a
+        user connected here isn't also reached on their other nodes).
+        """
+        frame = Frame(message)
+        remote = []
+        for user_id in user_ids:
+            if user_id in self.active_connections:
+                self._enqueue(user_id, frame)
+            else:
+                remote.append(user_id)
+        if remote:
+            self._publish(USERS_CHANNEL, message, to_users=remote)
     
     async def broadcast(self, message: dict, exclude_user: Optional[str] = None):
-        """Broadcast message to all connected users"""
-        for user_id in list(self.active_connections.keys()):
-            if user_id != exclude_user:
-                await self.send_personal_message(message, user_id)
+        """Broadcast message to all connected users (encoded once)"""
+        self._deliver_all("", {"message": message, "exclude_user": exclude_user})
+        self._publish(ALL_CHANNEL, message, exclude_user=exclude_user)
     
     async def broadcast_to_room(self, room: str, message: dict, exclude_user: Optional[str] = None):
-        """Broadcast message to all users in a room"""
-        if room in self.rooms:
-            for user_id in self.rooms[room]:
-                if user_id != exclude_user:
-                    await self.send_personal_message(message, user_id)
+        """Broadcast message to all users in a room (encoded once)"""
+        self._deliver_room(room, {"message": message, "exclude_user": exclude_user})
+        self._publish(channel_for("room", room), message, exclude_user=exclude_user)
+    
+    # === Membership ===
+    
+    @staticmethod
+    def _discard_member(index: Dict[str, Set[str]], key: str, member: str) -> bool:
+        """Remove member from index[key], dropping the set once it is empty (returns True if dropped)"""
+        members = index.get(key)
+        if members is not None:
+            members.discard(member)
+            if not members:
+                del index[key]
+                return True
+        return False
     
     def join_room(self, user_id: str, room: str):
         """Add user to a room"""
         if room not in self.rooms:
             self.rooms[room] = set()
+            self.broker.subscribe(channel_for("room", room))
         self.rooms[room].add(user_id)
+        self.user_rooms.setdefault(user_id, set()).add(room)
         print(f"👥 User {user_id} joined room: {room}")
     
     def leave_room(self, user_id: str, room: str):
         """Remove user from a room"""
-        if room in self.rooms:
-            self.rooms[room].discard(user_id)
-            if not self.rooms[room]:
-                del self.rooms[room]
+        if self._discard_member(self.rooms, room, user_id):
+            self.broker.unsubscribe(channel_for("room", room))
+        self._discard_member(self.user_rooms, user_id, room)
         print(f"👋 User {user_id} left room: {room}")
     
     async def join_video(self, user_id: str, video_id: str):
         """User starts watching a video"""
         if video_id not in self.video_viewers:
             self.video_viewers[video_id] = set()
+            self.broker.subscribe(channel_for("video", video_id))
         
         self.video_viewers[video_id].add(user_id)
-        viewer_count = len(self.video_viewers[video_id])
-        
-        # Notify all viewers of updated count
-        await self.broadcast_to_video(
-            video_id,
-            {
-                "type": "viewer_update",
-                "video_id": video_id,
-                "viewer_count": viewer_count,
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+        self.user_videos.setdefault(user_id, set()).add(video_id)
         
-        print(f"📺 User {user_id} watching video {video_id} ({viewer_count} viewers)")
+        # Viewers get the new count on the next tick (one frame per video)
+        self.dirty_videos.add(video_id)
     
     async def leave_video(self, user_id: str, video_id: str):
         """User stops watching a video"""
+        self._discard_member(self.user_videos, user_id, video_id)
         if video_id in self.video_viewers:
             self.video_viewers[video_id].discard(user_id)
             viewer_count = len(self.video_viewers[video_id])
             
+            # Remaining viewers (here and on other nodes) get the new count on the next tick
+            self.dirty_videos.add(video_id)
             if viewer_count == 0:
                 del self.video_viewers[video_id]
-            else:
-                # Notify remaining viewers
-                await self.broadcast_to_video(
-                    video_id,
-                    {
-                        "type": "viewer_update",
-                        "video_id": video_id,
-                        "viewer_count": viewer_count,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                )
-        
-        print(f"📺 User {user_id} stopped watching video {video_id}")
+                self.broker.unsubscribe(channel_for("video", video_id))
     
     async def broadcast_to_video(self, video_id: str, message: dict):
         """Send message to all users watching a video"""
-        if video_id in self.video_viewers:
-            for user_id in self.video_viewers[video_id]:
-                await self.send_personal_message(message, user_id)
+        self._deliver_video(video_id, {"message": message})
+        self._publish(channel_for("video", video_id), message)
     
     def get_online_users(self) -> List[str]:
         """Get list of all connected user IDs"""
@@ -174,8 +420,12 @@ class ConnectionManager:
         return list(self.rooms.get(room, set()))
     
     def get_video_viewers(self, video_id: str) -> int:
-        """Get count of users watching a video"""
-        return len(self.video_viewers.get(video_id, set()))
+        """
+        Get count of users watching a video, on every node
+        Other nodes' counts come from their announcements, which only reach nodes
+        with viewers of the video; elsewhere this is the local count (zero).
+        """
+        return self.video_counts.total(video_id, len(self.video_viewers.get(video_id, ())))
     
     async def send_notification(self, user_id: str, notification_type: str, data: dict):
         """Send notification to specific user"""
@@ -235,25 +485,14 @@ async def notify_new_comment(user_id: str, video_id: str, commenter_username: st
     )
 
 
-async def broadcast_new_video(uploader_id: str, uploader_username: str, video_id: str, video_title: str, thumbnail_url: str):
-    """Broadcast new video upload to all users"""
-    await ws_manager.broadcast(
-        {
-            "type": "new_video",
-            "uploader_id": uploader_id,
-            "uploader_username": uploader_username,
-            "video_id": video_id,
-            "video_title": video_title,
-            "thumbnail_url": thumbnail_url,
-            "timestamp": datetime.now().isoformat()
-        },
-        exclude_user=uploader_id
-    )
+# Clients that show trending join this room ({"action": "join_room", "room": "trending"})
+TRENDING_ROOM = "trending"
 
 
 async def broadcast_trending_update(video_ids: List[str]):
-    """Notify all users of trending videos update"""
-    await ws_manager.broadcast(
+    """Notify users watching trending that it was updated"""
+    await ws_manager.broadcast_to_room(
+        TRENDING_ROOM,
         {
             "type": "trending_update",
             "message": "Trending videos updated!",
@@ -267,28 +506,183 @@ async def broadcast_trending_update(video_ids: List[str]):
 # LIVE STREAMING REAL-TIME FEATURES
 # ============================================================================
 
+def session_command(method):
+    """Run a LiveStreamManager method on its session's actor, in order with the session's other commands"""
+    index = list(inspect.signature(method).parameters).index("session_id")
+    
+    @functools.wraps(method)
+    async def run_on_actor(self, *args, **kwargs):
+        session_id = args[index - 1] if len(args) >= index else kwargs["session_id"]
+        actor = self._actor(session_id)
+        self.pending_calls[session_id] = self.pending_calls.get(session_id, 0) + 1
+        try:
+            return await actor.call(method, self, *args, **kwargs)
+        finally:
+            self.pending_calls[session_id] -= 1
+            if not self.pending_calls[session_id]:
+                del self.pending_calls[session_id]
+            self._release_actor(session_id)
+    return run_on_actor
+
+
 class LiveStreamManager:
     """Enhanced manager for live streaming with WebRTC signaling"""
     
     def __init__(self, connection_manager: ConnectionManager):
         self.manager = connection_manager
+        
+        # Slow-consumer counters per session: {session_id: {dropped, coalesced, ...}}
+        self.session_metrics: Dict[str, Dict[str, int]] = {}
+        
+        # Actions rejected by per-user rate limits: {session_id: {action: count}}
+        self.throttled: Dict[str, Dict[str, int]] = {}
+        
+        # Slow mode: {session_id: seconds between chat messages per viewer}
+        self.slow_mode: Dict[str, float] = {}
+        
+        # Per-session chat batching, reaction counting and ICE candidate batching
+        self.chat_batchers: Dict[str, ChatBatcher] = {}
+        self.reaction_aggregators: Dict[str, ReactionAggregator] = {}
+        self.ice_batchers: Dict[str, IceCandidateBatcher] = {}
+        
+        # WebRTC signals relayed / refused by the topology rules: {session_id: {relayed, rejected}}
+        self.signal_stats: Dict[str, Dict[str, int]] = {}
+        
+        # Participants by role: {session_id: {role: Set[user_id]}}, so role-targeted
+        # sends and stage snapshots don't scan every viewer
+        self.role_index: Dict[str, Dict[str, Set[str]]] = {}
+        
+        # Recent chat per session, replayed to joiners / on resume
+        self.histories: Dict[str, SessionHistory] = {}
+        
+        # One actor per active session; owns the state above for that session
+        self.actors: Dict[str, SessionActor] = {}
+        
+        # Commands awaiting their actor per session (queued or running); the actor stays while any are
+        self.pending_calls: Dict[str, int] = {}
+        
+        # Sockets being closed in the background (kept referenced until done)
+        self.closing: Set[asyncio.Task] = set()
+        
+        # Sessions whose local participant count changed since the last tick, and other nodes' counts
+        self.dirty_sessions: Set[str] = set()
+        self.session_counts = NodeCounts()
+        self.manager.tick_callbacks.append(self.flush_viewer_counts)
+        
+        # Session broadcasts from other nodes
+        self.manager.channel_handlers["session"] = self._deliver_session
+    
+    def _actor(self, session_id: str) -> SessionActor:
+        actor = self.actors.get(session_id)
+        if actor is None:
+            actor = self.actors[session_id] = SessionActor(session_id, lambda: self._release_actor(session_id))
+        return actor
+    
+    def _release_actor(self, session_id: str):
+        """
+        Close the session's actor once the session has no participants and the actor
+        has nothing left to do: no command running or queued and no caller waiting on
+        it. Otherwise a queued join would run on a closed actor while the next command
+        created a second one. Like _actor this never yields, so the check and the pop
+        can't interleave with a new command; an actor that is busy now is released by
+        the last caller or when it goes idle.
+        """
+        actor = self.actors.get(session_id)
+        if (actor and session_id not in self.manager.live_sessions
+                and session_id not in self.pending_calls and actor.idle()):
+            del self.actors[session_id]
+            actor.close()
+    
+    def _submit(self, session_id: str, fn: Callable, *args):
+        """Run a sync mutation in order with the session's commands"""
+        actor = self.actors.get(session_id)
+        if actor is None:
+            fn(*args)  # No commands in flight for this session
+        else:
+            actor.submit(fn, *args)
     
-    async def join_live_session(self, websocket: WebSocket, session_id: str, user_id: str, username: str, role: str = "viewer"):
-        """Join a live streaming session (connection already accepted in route handler)"""
+    def _timers(self, session_id: str) -> Optional[Callable]:
+        """call_later for a session's batchers: the actor's, so flushes run as commands"""
+        actor = self.actors.get(session_id)
+        return actor.call_later if actor else None
+    
+    def _close_later(self, connection: ClientConnection, code: int = 1000, reason: str = ""):
+        """Close a socket in the background (a detached one closes at once, others flush their queue first)"""
+        task = asyncio.create_task(connection.close(code, reason))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+    
+    async def stop_actors(self):
+        """Cancel every session actor (app shutdown)"""
+        actors, self.actors = list(self.actors.values()), {}
+        await asyncio.gather(*(actor.stop() for actor in actors))
+    
+    async def join_live_session(self, websocket: WebSocket, session_id: str, user_id: str, username: str,
+                                role: str = "viewer", resume: Optional[str] = None):
+        """
+        Join a live streaming session (connection already accepted in route handler).
+        The snapshot is current_participants followed by recent chat from the
+        session history: everything buffered, or with a valid resume token only
+        what came after it.
+        Raises SessionFull if a new participant would exceed max_participants.
+        """
+        # Capacity check and viewer/guest/peak counters in one Redis step, before queueing
+        # on the actor so its other commands don't wait on it (a reconnect isn't a new join)
+        guest = role in GUEST_ROLES
+        reserved = user_id not in self.manager.live_sessions.get(session_id, {})
+        if reserved:
+            await live_counters.try_join(session_id, guest)
+        try:
+            return await self._join_live_session(websocket, session_id, user_id, username, role, resume, reserved)
+        except BaseException:
+            if reserved:
+                # Ordered after the join command, which may still have run
+                self._submit(session_id, self._release_join_slot, session_id, user_id, websocket, guest)
+            raise
+    
+    def _release_join_slot(self, session_id: str, user_id: str, websocket: WebSocket, guest: bool):
+        info = self.manager.live_sessions.get(session_id, {}).get(user_id)
+        if not info or info.connection.websocket is not websocket:
+            live_counters.leave(session_id, guest)
+    
+    @session_command
+    async def _join_live_session(self, websocket: WebSocket, session_id: str, user_id: str, username: str,
+                                 role: str, resume: Optional[str], reserved: bool):
+        # The session changed while the join was queued: keep the counters to one slot per user
+        present = user_id in self.manager.live_sessions.get(session_id, {})
+        if reserved and present:
+            live_counters.leave(session_id, role in GUEST_ROLES)
+        elif not reserved and not present:
+            await live_counters.try_join(session_id, role in GUEST_ROLES)
         
         # Initialize session if not exists
         if session_id not in self.manager.live_sessions:
             self.manager.live_sessions[session_id] = {}
+            self.manager.broker.subscribe(channel_for("session", session_id))
+        if session_id not in self.histories:
+            self.histories[session_id] = SessionHistory()
         
-        # Store user info
-        self.manager.live_sessions[session_id][user_id] = {
-            "websocket": websocket,
-            "role": role,
-            "username": username,
-            "connected_at": datetime.now().isoformat(),
-            "audio_enabled": True,
-            "video_enabled": role != "viewer"  # Viewers don't have video by default
-        }
+        # Same user reconnecting: the new socket replaces the old one, which is closed
+        # (its route's leave is ignored, since it names the old socket)
+        previous = self.manager.live_sessions[session_id].get(user_id)
+        if previous:
+            previous.connection.detach()
+            self._close_later(previous.connection, reason="Replaced by a new connection")
+            self._unindex_role(session_id, user_id, previous.role)
+        
+        if session_id not in self.session_metrics:
+            self.session_metrics[session_id] = new_delivery_metrics()
+        
+        connection = ClientConnection(
+            websocket, user_id, session_id,
+            on_close=lambda conn: self._on_connection_closed(session_id, conn),
+            metrics=self.session_metrics[session_id],
+            codec=negotiate_codec(websocket)[0]  # Same negotiation the route accepted with
+        )
+        
+        self.manager.live_sessions[session_id][user_id] = LiveParticipant(connection, role, username)
+        self._index_role(session_id, user_id, role)
+        self.manager.heartbeats.track(connection)
         
         # Add to WebRTC peers if not viewer
         if role != "viewer":
@@ -297,43 +691,67 @@ class LiveStreamManager:
             self.manager.webrtc_peers[session_id].add(user_id)
         
         viewer_count = len(self.manager.live_sessions[session_id])
+        self.dirty_sessions.add(session_id)
         
-        # Notify existing users about new participant
-        await self.broadcast_to_session(session_id, {
+        # Notify about new participant (viewers: host/cohost only)
+        self._announce(session_id, role, {
             "type": "user_joined",
             "user_id": user_id,
             "username": username,
             "role": role,
             "viewer_count": viewer_count,
             "timestamp": datetime.now().isoformat()
-        }, exclude_user=user_id)
+        })
         
-        # Send current participants to new user
-        participants = []
-        for uid, info in self.manager.live_sessions[session_id].items():
-            if uid != user_id:
-                participants.append({
-                    "user_id": uid,
-                    "username": info["username"],
-                    "role": info["role"],
-                    "audio_enabled": info["audio_enabled"],
-                    "video_enabled": info["video_enabled"]
-                })
+        # Send current stage participants to new user (viewers only show up in the count)
+        session = self.manager.live_sessions[session_id]
+        participants = [
+            session[uid].to_dict(uid)
+            for role_name, members in self.role_index[session_id].items() if role_name != "viewer"
+            for uid in members if uid != user_id
+        ]
         
-        await websocket.send_json({
+        history = self.histories[session_id]
+        replay, resumed = history.since(resume)
+        connection.send({
             "type": "current_participants",
             "participants": participants,
             "viewer_count": viewer_count,
+            "history_epoch": history.epoch,  # Resume token: "{history_epoch}.{last seq received}"
+            "resumed": resumed,
+            "replayed": len(replay),
             "timestamp": datetime.now().isoformat()
         })
+        for frame in replay:
+            connection.send(frame)
         
         print(f"✅ User {username} joined live session {session_id} as {role}")
         return viewer_count
     
-    def leave_live_session(self, session_id: str, user_id: str):
-        """Leave a live streaming session"""
+    def leave_live_session(self, session_id: str, user_id: str, websocket: Optional[WebSocket] = None):
+        """
+        Leave a live streaming session (ordered after the session's in-flight command)
+        With a websocket, only if the participant is still connected on it: a
+        socket replaced by a reconnect must not remove the new connection.
+        """
+        self._submit(session_id, self._leave_live_session, session_id, user_id, websocket)
+    
+    def _leave_live_session(self, session_id: str, user_id: str, websocket: Optional[WebSocket] = None,
+                            drain: bool = False):
+        """drain: close the socket after its queued frames are written (kick / session end)"""
         if session_id in self.manager.live_sessions:
-            user_info = self.manager.live_sessions[session_id].pop(user_id, None)
+            user_info = self.manager.live_sessions[session_id].get(user_id)
+            if user_info and websocket is not None and user_info.connection.websocket is not websocket:
+                return  # Superseded socket; the participant lives on through its new one
+            
+            if user_info:
+                del self.manager.live_sessions[session_id][user_id]
+                if drain:
+                    self._close_later(user_info.connection)
+                else:
+                    user_info.connection.detach()
+                self._unindex_role(session_id, user_id, user_info.role)
+                live_counters.leave(session_id, user_info.role in GUEST_ROLES)
             
             # Remove from WebRTC peers
             if session_id in self.manager.webrtc_peers:
@@ -341,96 +759,301 @@ class LiveStreamManager:
             
             if user_info:
                 viewer_count = len(self.manager.live_sessions[session_id])
+                self.dirty_sessions.add(session_id)
                 
-                # Notify remaining users
-                asyncio.create_task(self.broadcast_to_session(session_id, {
+                # Notify remaining users (viewers: host/cohost only)
+                self._announce(session_id, user_info.role, {
                     "type": "user_left",
                     "user_id": user_id,
-                    "username": user_info["username"],
+                    "username": user_info.username,
                     "viewer_count": viewer_count,
                     "timestamp": datetime.now().isoformat()
-                }))
+                })
                 
-                print(f"👋 User {user_info['username']} left live session {session_id}")
+                print(f"👋 User {user_info.username} left live session {session_id}")
             
             # Clean up empty session
             if not self.manager.live_sessions[session_id]:
                 del self.manager.live_sessions[session_id]
+                self.manager.broker.unsubscribe(channel_for("session", session_id))
+                self.session_metrics.pop(session_id, None)
+                self.throttled.pop(session_id, None)
+                self.slow_mode.pop(session_id, None)
+                self.histories.pop(session_id, None)
+                self.signal_stats.pop(session_id, None)
+                for batchers in (self.chat_batchers, self.reaction_aggregators, self.ice_batchers):
+                    batcher = batchers.pop(session_id, None)
+                    if batcher:
+                        batcher.close()  # Participants on other nodes still get the tail
                 if session_id in self.manager.webrtc_peers:
                     del self.manager.webrtc_peers[session_id]
+                self._release_actor(session_id)
     
-    async def broadcast_to_session(self, session_id: str, message: dict, exclude_user: str = None):
-        """Broadcast message to all users in a live session"""
-        if session_id not in self.manager.live_sessions:
+    def _index_role(self, session_id: str, user_id: str, role: str):
+        self.role_index.setdefault(session_id, {}).setdefault(role, set()).add(user_id)
+    
+    def _unindex_role(self, session_id: str, user_id: str, role: str):
+        roles = self.role_index.get(session_id)
+        if roles is not None:
+            self.manager._discard_member(roles, role, user_id)
+            if not roles:
+                del self.role_index[session_id]
+    
+    def _set_role(self, session_id: str, user_id: str, role: str):
+        """Change a participant's role, keeping the role index in step"""
+        participant = self.manager.live_sessions[session_id][user_id]
+        if (participant.role in GUEST_ROLES) != (role in GUEST_ROLES):
+            live_counters.guest_changed(session_id, 1 if role in GUEST_ROLES else -1)
+        self._unindex_role(session_id, user_id, participant.role)
+        participant.role = role
+        self._index_role(session_id, user_id, role)
+    
+    def allow_action(self, session_id: str, user_id: str, action: str) -> bool:
+        """
+        Per-user token bucket check for a rate-limited action (chat, reaction,
+        webrtc_signal); counts rejections per session. Cheap enough to run on
+        every message, before any fan-out.
+        """
+        participant = self.manager.live_sessions.get(session_id, {}).get(user_id)
+        if participant is None:
+            return False
+        
+        limit = ACTION_LIMITS.get(action)
+        if action == "chat" and session_id in self.slow_mode and participant.role not in STAGE_MANAGER_ROLES:
+            limit = slow_mode_limit(self.slow_mode[session_id])
+        if limit is None:
+            return True
+        
+        if participant.buckets is None:
+            participant.buckets = {}
+        bucket = participant.buckets.get(action)
+        if bucket is None or (bucket.rate, bucket.capacity) != limit:
+            bucket = participant.buckets[action] = TokenBucket(*limit)
+        
+        if bucket.allow():
+            return True
+        
+        counts = self.throttled.setdefault(session_id, {})
+        counts[action] = counts.get(action, 0) + 1
+        return False
+    
+    @session_command
+    async def set_slow_mode(self, session_id: str, seconds: float, by_user_id: str):
+        """Host/cohost: limit viewers to one chat message per `seconds` (0 turns it off)"""
+        by_user = self.manager.live_sessions.get(session_id, {}).get(by_user_id)
+        if not by_user or by_user.role not in STAGE_MANAGER_ROLES:
             return
         
-        disconnected = []
-        for user_id, info in self.manager.live_sessions[session_id].items():
-            if user_id == exclude_user:
-                continue
-            
-            try:
-                await info["websocket"].send_json(message)
-            except Exception as e:
-                print(f"⚠️  Failed to send to {user_id} in session {session_id}: {e}")
-                disconnected.append(user_id)
+        seconds = min(max(float(seconds), 0.0), MAX_SLOW_MODE_SECONDS)
+        if seconds:
+            self.slow_mode[session_id] = seconds
+        else:
+            self.slow_mode.pop(session_id, None)
+        
+        await self.broadcast_to_session(session_id, {
+            "type": "slow_mode_changed",
+            "seconds": seconds,
+            "by": by_user.username,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    def _on_connection_closed(self, session_id: str, connection: ClientConnection):
+        """Writer gave up on a participant (send failed or queue overflowed)"""
+        info = self.manager.live_sessions.get(session_id, {}).get(connection.user_id)
+        if info and info.connection is connection:
+            self.leave_live_session(session_id, connection.user_id, connection.websocket)
+    
+    def _deliver_session(self, session_id: str, envelope: dict):
+        """Deliver a session message to local participants (targeting from the envelope)"""
+        participants = self.manager.live_sessions.get(session_id)
+        if not participants:
+            return
+        
+        if "node_count" in envelope:
+            self.session_counts.receive(session_id, envelope["origin"], envelope["node_count"])
+            return
+        
+        to_user = envelope.get("to_user")
+        if to_user is not None:
+            info = participants.get(to_user)
+            if info:
+                info.connection.send(envelope["message"])
+            return
+        
+        roles = envelope.get("roles")
+        exclude_user = envelope.get("exclude_user")
+        history = self.histories.get(session_id)
+        if history is not None and roles is None and envelope["message"].get("type") in HISTORY_TYPES:
+            frame = history.record(envelope["message"])  # Numbered copy, kept for replay
+        else:
+            frame = Frame(envelope["message"])
+        
+        if roles is None:
+            for user_id, info in participants.items():
+                if user_id != exclude_user:
+                    info.connection.send(frame)
+            if "origin" in envelope and envelope["message"].get("type") == "session_ended":
+                # Ended on another node: participants here leave too, once they have the notice
+                self._submit(session_id, self._leave_all, session_id)
+            return
         
-        # Clean up disconnected users
-        for user_id in disconnected:
-            self.leave_live_session(session_id, user_id)
+        # Role-targeted: only the members of those roles, not every viewer
+        index = self.role_index.get(session_id, {})
+        for role in roles:
+            for user_id in index.get(role, ()):
+                if user_id != exclude_user:
+                    participants[user_id].connection.send(frame)
+    
+    def _fan_out(self, session_id: str, message: dict, **targeting):
+        """Deliver to local participants and publish for other nodes (never blocks)"""
+        self._deliver_session(session_id, dict(targeting, message=message))
+        self.manager._publish(channel_for("session", session_id), message, **targeting)
+    
+    def _announce(self, session_id: str, role: str, message: dict):
+        """
+        Join/leave event: stage participants (host, cohost, guest) are announced to
+        everyone since every client renders the stage; viewers only to host/cohost.
+        """
+        if role == "viewer":
+            self._fan_out(session_id, message, roles=STAGE_MANAGER_ROLES)
+        else:
+            self._fan_out(session_id, message, exclude_user=message["user_id"])
+    
+    def flush_viewer_counts(self):
+        """Send one viewer_count frame per session whose cluster-wide count changed"""
+        dirty, self.dirty_sessions = self.dirty_sessions, set()
+        live_sessions = self.manager.live_sessions
+        announce, changed = self.session_counts.collect(dirty, live_sessions)
+        for session_id in announce:
+            self.manager._publish(channel_for("session", session_id), None,
+                                  node_count=len(live_sessions.get(session_id, ())))
+        
+        timestamp = datetime.now().isoformat()
+        for session_id in changed:
+            participants = live_sessions.get(session_id)
+            if not participants:
+                self.session_counts.forget(session_id)
+                continue
+            # Summed the same way as ConnectionManager.flush_viewer_counts
+            total = self.session_counts.total(session_id, len(participants))
+            if session_id in dirty or self.session_counts.sent.get(session_id) != total:
+                self.session_counts.sent[session_id] = total
+                self._deliver_session(session_id, {"message": {
+                    "type": "viewer_count",
+                    "session_id": session_id,
+                    "viewer_count": total,
+                    "timestamp": timestamp
+                }})
+    
+    async def broadcast_to_session(self, session_id: str, message: dict, exclude_user: str = None):
+        """Broadcast message to all users in a live session, on every node (encoded once per node)"""
+        self._fan_out(session_id, message, exclude_user=exclude_user)
+    
+    def touch(self, session_id: str, user_id: str):
+        """Record activity from a participant (resets their heartbeat deadline)"""
+        info = self.manager.live_sessions.get(session_id, {}).get(user_id)
+        if info:
+            info.connection.touch()
     
     async def send_to_user(self, session_id: str, user_id: str, message: dict):
-        """Send message to specific user in session"""
-        if session_id in self.manager.live_sessions and user_id in self.manager.live_sessions[session_id]:
-            try:
-                await self.manager.live_sessions[session_id][user_id]["websocket"].send_json(message)
-            except Exception as e:
-                print(f"⚠️  Failed to send to user {user_id}: {e}")
-                self.leave_live_session(session_id, user_id)
+        """Send message to specific user in session (relayed if they're on another node)"""
+        info = self.manager.live_sessions.get(session_id, {}).get(user_id)
+        if info:
+            info.connection.send(message)
+        else:
+            self.manager._publish(channel_for("session", session_id), message, to_user=user_id)
     
     async def send_to_role(self, session_id: str, role: str, message: dict):
         """Send message to all users with specific role"""
-        if session_id not in self.manager.live_sessions:
-            return
-        
-        for user_id, info in self.manager.live_sessions[session_id].items():
-            if info["role"] == role:
-                await self.send_to_user(session_id, user_id, message)
+        self._fan_out(session_id, message, roles=[role])
     
+    def _get_chat_batcher(self, session_id: str) -> ChatBatcher:
+        batcher = self.chat_batchers.get(session_id)
+        if batcher is None:
+            batcher = ChatBatcher(session_id, lambda batch: self._fan_out(session_id, batch), self._timers(session_id))
+            self.chat_batchers[session_id] = batcher
+        return batcher
+    
+    @session_command
     async def handle_chat_message(self, session_id: str, user_id: str, message: str):
-        """Handle chat message in live session"""
+        """Handle chat message in live session (delivered in the next chat_batch, persisted write-behind)"""
         if session_id not in self.manager.live_sessions or user_id not in self.manager.live_sessions[session_id]:
             return
+        message = strip_nul(message) if isinstance(message, str) else ""
+        if not message:
+            return
         
         user_info = self.manager.live_sessions[session_id][user_id]
+        if not self.allow_action(session_id, user_id, "chat"):
+            user_info.connection.send({
+                "type": "rate_limited",
+                "action": "chat",
+                "retry_after": round(user_info.buckets["chat"].retry_after(), 1),
+                "slow_mode": self.slow_mode.get(session_id, 0),
+                "timestamp": datetime.now().isoformat()
+            })
+            return
         
-        await self.broadcast_to_session(session_id, {
-            "type": "chat_message",
+        row = chat_store.record(session_id, user_id, message)
+        chat = {
+            "id": row["id"],
             "user_id": user_id,
-            "username": user_info["username"],
+            "username": user_info.username,
             "message": message,
             "timestamp": datetime.now().isoformat()
-        })
+        }
         
-        print(f"💬 Chat in {session_id}: {user_info['username']}: {message}")
+        accepted = self._get_chat_batcher(session_id).add(chat, priority=user_info.role in STAGE_MANAGER_ROLES)
+        if not accepted:
+            # Rate-limited for the room, but the author still sees their own message
+            user_info.connection.send({
+                "type": "chat_batch",
+                "session_id": session_id,
+                "messages": [chat],
+                "dropped": 0,
+                "timestamp": chat["timestamp"]
+            })
+    
+    def record_reaction(self, session_id: str, reaction: str, count: int = 1):
+        """
+        Count reactions for the session's next reaction_summary and its per-minute
+        totals (used by the WebSocket action and the REST endpoint)
+        """
+        self._submit(session_id, self._record_reaction, session_id, reaction, count)
+    
+    def _record_reaction(self, session_id: str, reaction: str, count: int):
+        aggregator = self.reaction_aggregators.get(session_id)
+        if aggregator is None:
+            aggregator = ReactionAggregator(
+                session_id, lambda summary: self._emit_reaction_summary(session_id, summary),
+                self._timers(session_id)
+            )
+            self.reaction_aggregators[session_id] = aggregator
+        aggregator.add(reaction, count)
+        reaction_store.record(session_id, reaction, count)
+    
+    def _emit_reaction_summary(self, session_id: str, summary: dict):
+        self._fan_out(session_id, summary)
+        if session_id not in self.manager.live_sessions:
+            # REST reactions on a node without participants: the summary went to
+            # the other nodes, and nothing here cleans the aggregator up later
+            self.reaction_aggregators.pop(session_id, None)
     
+    @session_command
     async def handle_reaction(self, session_id: str, user_id: str, reaction: str):
-        """Handle reaction in live session"""
+        """Handle reaction in live session (aggregated, not broadcast individually)"""
         if session_id not in self.manager.live_sessions or user_id not in self.manager.live_sessions[session_id]:
             return
         
-        user_info = self.manager.live_sessions[session_id][user_id]
+        if not reaction or len(reaction) > MAX_REACTION_LENGTH:
+            return
         
-        await self.broadcast_to_session(session_id, {
-            "type": "reaction",
-            "user_id": user_id,
-            "username": user_info["username"],
-            "reaction": reaction,
-            "timestamp": datetime.now().isoformat()
-        })
+        if not self.allow_action(session_id, user_id, "reaction"):
+            return  # Dropped silently; counted per session
         
-        print(f"💖 Reaction in {session_id}: {user_info['username']} sent {reaction}")
+        self.record_reaction(session_id, reaction)
     
+    @session_command
     async def handle_guest_request(self, session_id: str, user_id: str):
         """Handle guest join request"""
         if session_id not in self.manager.live_sessions or user_id not in self.manager.live_sessions[session_id]:
@@ -439,22 +1062,16 @@ class LiveStreamManager:
         user_info = self.manager.live_sessions[session_id][user_id]
         
         # Send to host and cohosts only
-        await self.send_to_role(session_id, "host", {
+        self._fan_out(session_id, {
             "type": "guest_request",
             "user_id": user_id,
-            "username": user_info["username"],
+            "username": user_info.username,
             "timestamp": datetime.now().isoformat()
-        })
+        }, roles=STAGE_MANAGER_ROLES)
         
-        await self.send_to_role(session_id, "cohost", {
-            "type": "guest_request",
-            "user_id": user_id,
-            "username": user_info["username"],
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        print(f"🙋 Guest request in {session_id}: {user_info['username']}")
+        print(f"🙋 Guest request in {session_id}: {user_info.username}")
     
+    @session_command
     async def handle_guest_response(self, session_id: str, user_id: str, approved: bool, approved_by_id: str):
         """Handle guest request response"""
         if session_id not in self.manager.live_sessions:
@@ -467,8 +1084,8 @@ class LiveStreamManager:
         if approved:
             # Update user role to guest
             if user_id in self.manager.live_sessions[session_id]:
-                self.manager.live_sessions[session_id][user_id]["role"] = "guest"
-                self.manager.live_sessions[session_id][user_id]["video_enabled"] = True
+                self._set_role(session_id, user_id, "guest")
+                self.manager.live_sessions[session_id][user_id].video_enabled = True
                 
                 # Add to WebRTC peers
                 if session_id not in self.manager.webrtc_peers:
@@ -478,7 +1095,7 @@ class LiveStreamManager:
                 # Notify the approved user
                 await self.send_to_user(session_id, user_id, {
                     "type": "guest_approved",
-                    "approved_by": approver_info["username"],
+                    "approved_by": approver_info.username,
                     "timestamp": datetime.now().isoformat()
                 })
                 
@@ -486,7 +1103,7 @@ class LiveStreamManager:
                 await self.broadcast_to_session(session_id, {
                     "type": "guest_joined",
                     "user_id": user_id,
-                    "username": self.manager.live_sessions[session_id][user_id]["username"],
+                    "username": self.manager.live_sessions[session_id][user_id].username,
                     "timestamp": datetime.now().isoformat()
                 })
                 
@@ -495,28 +1112,29 @@ class LiveStreamManager:
             # Notify rejection
             await self.send_to_user(session_id, user_id, {
                 "type": "guest_rejected",
-                "rejected_by": approver_info["username"],
+                "rejected_by": approver_info.username,
                 "timestamp": datetime.now().isoformat()
             })
             
             print(f"❌ Guest rejected in {session_id}: {user_id}")
     
+    @session_command
     async def handle_participant_action(self, session_id: str, target_user_id: str, action: str, by_user_id: str, **kwargs):
         """Handle host actions on participants (mute, kick, promote, etc.)"""
         if session_id not in self.manager.live_sessions:
             return
         
         by_user_info = self.manager.live_sessions[session_id].get(by_user_id)
-        if not by_user_info or by_user_info["role"] not in ["host", "cohost"]:
+        if not by_user_info or by_user_info.role not in ["host", "cohost"]:
             return  # Only host/cohost can perform actions
         
         if action == "mute_audio":
             if target_user_id in self.manager.live_sessions[session_id]:
-                self.manager.live_sessions[session_id][target_user_id]["audio_enabled"] = False
+                self.manager.live_sessions[session_id][target_user_id].audio_enabled = False
                 
                 await self.send_to_user(session_id, target_user_id, {
                     "type": "force_mute_audio",
-                    "by": by_user_info["username"],
+                    "by": by_user_info.username,
                     "timestamp": datetime.now().isoformat()
                 })
                 
@@ -528,11 +1146,11 @@ class LiveStreamManager:
         
         elif action == "mute_video":
             if target_user_id in self.manager.live_sessions[session_id]:
-                self.manager.live_sessions[session_id][target_user_id]["video_enabled"] = False
+                self.manager.live_sessions[session_id][target_user_id].video_enabled = False
                 
                 await self.send_to_user(session_id, target_user_id, {
                     "type": "force_mute_video",
-                    "by": by_user_info["username"],
+                    "by": by_user_info.username,
                     "timestamp": datetime.now().isoformat()
                 })
                 
@@ -546,30 +1164,25 @@ class LiveStreamManager:
             if target_user_id in self.manager.live_sessions[session_id]:
                 await self.send_to_user(session_id, target_user_id, {
                     "type": "kicked",
-                    "by": by_user_info["username"],
+                    "by": by_user_info.username,
                     "reason": kwargs.get("reason", "Removed by host"),
                     "timestamp": datetime.now().isoformat()
                 })
                 
-                # Close their connection
-                try:
-                    await self.manager.live_sessions[session_id][target_user_id]["websocket"].close()
-                except:
-                    pass
-                
-                self.leave_live_session(session_id, target_user_id)
+                # Their connection closes in the background once the notice has been written
+                self._leave_live_session(session_id, target_user_id, drain=True)
                 
-                print(f"👢 User {target_user_id} kicked from {session_id} by {by_user_info['username']}")
+                print(f"👢 User {target_user_id} kicked from {session_id} by {by_user_info.username}")
         
         elif action == "promote":
             new_role = kwargs.get("new_role", "cohost")
             if target_user_id in self.manager.live_sessions[session_id]:
-                self.manager.live_sessions[session_id][target_user_id]["role"] = new_role
+                self._set_role(session_id, target_user_id, new_role)
                 
                 await self.send_to_user(session_id, target_user_id, {
                     "type": "promoted",
                     "new_role": new_role,
-                    "by": by_user_info["username"],
+                    "by": by_user_info.username,
                     "timestamp": datetime.now().isoformat()
                 })
                 
@@ -581,46 +1194,140 @@ class LiveStreamManager:
                 
                 print(f"⬆️ User {target_user_id} promoted to {new_role} in {session_id}")
     
+    def _signal_route(self, session_id: str, from_user_id: str, from_role: str, to_user_id: str) -> Optional[dict]:
+        """
+        Targeting for a WebRTC signal, or None if the topology doesn't allow it.
+        "all" means the sender's peers, never the session's viewers.
+        """
+        participants = self.manager.live_sessions[session_id]
+        if to_user_id == "all":
+            if from_role not in PEER_ROLES:
+                return None  # Viewers have no peers to broadcast to
+            if WEBRTC_TOPOLOGY == "star":
+                roles = [r for r in PEER_ROLES if r != "host"] if from_role == "host" else ["host"]
+            else:
+                roles = PEER_ROLES
+            return {"roles": roles, "exclude_user": from_user_id}
+        
+        if WEBRTC_TOPOLOGY == "star" and from_role != "host":
+            recipient = participants.get(to_user_id)
+            if recipient is not None and recipient.role != "host":
+                return None  # Star: everyone signals with the host only
+        return {"to_user": to_user_id}
+    
+    def _relay_signal(self, session_id: str, route: dict, message: dict):
+        """Deliver a signal to its targets (published only if they may be on another node)"""
+        participants = self.manager.live_sessions.get(session_id)
+        if not participants:
+            return
+        stats = self.signal_stats.setdefault(session_id, {"relayed": 0, "rejected": 0})
+        stats["relayed"] += 1
+        recipient = participants.get(route.get("to_user"))
+        if recipient is not None:
+            recipient.connection.send(message)
+        else:
+            self._fan_out(session_id, message, **route)
+    
+    def _get_ice_batcher(self, session_id: str) -> IceCandidateBatcher:
+        batcher = self.ice_batchers.get(session_id)
+        if batcher is None:
+            def emit(from_user_id: str, to_user_id: str, candidates: List[dict]):
+                sender = self.manager.live_sessions.get(session_id, {}).get(from_user_id)
+                if sender is None:
+                    return  # Left during the window; the peer connection is gone anyway
+                route = self._signal_route(session_id, from_user_id, sender.role, to_user_id)
+                if route is not None:
+                    self._relay_signal(session_id, route, {
+                        "type": "webrtc_signal",
+                        "signal_type": "ice_candidates",
+                        "from_user_id": from_user_id,
+                        "signal_data": {"candidates": candidates},
+                        "timestamp": datetime.now().isoformat()
+                    })
+            batcher = self.ice_batchers[session_id] = IceCandidateBatcher(session_id, emit, self._timers(session_id))
+        return batcher
+    
+    @session_command
+    async def update_media_status(self, session_id: str, user_id: str,
+                                  audio_enabled: Optional[bool], video_enabled: Optional[bool]):
+        """A participant toggled their own audio/video (None leaves that one unchanged)"""
+        participant = self.manager.live_sessions.get(session_id, {}).get(user_id)
+        if not participant:
+            return
+        
+        if audio_enabled is not None:
+            participant.audio_enabled = audio_enabled
+        if video_enabled is not None:
+            participant.video_enabled = video_enabled
+        
+        await self.broadcast_to_session(session_id, {
+            "type": "participant_media_changed",
+            "user_id": user_id,
+            "audio_enabled": audio_enabled,
+            "video_enabled": video_enabled
+        })
+    
+    @session_command
     async def handle_webrtc_signal(self, session_id: str, from_user_id: str, to_user_id: str, signal_type: str, signal_data: dict):
-        """Handle WebRTC signaling (offer, answer, ICE candidates)"""
+        """
+        Relay WebRTC signaling (offer, answer, ice_candidate) to peers only.
+        Trickle ICE candidates are batched per peer pair and sent as one
+        "ice_candidates" signal with signal_data {"candidates": [...]}.
+        """
         if session_id not in self.manager.live_sessions:
             return
         
-        signal_message = {
+        if not self.allow_action(session_id, from_user_id, "webrtc_signal"):
+            return  # Dropped; counted per session
+        
+        sender = self.manager.live_sessions[session_id].get(from_user_id)
+        if sender is None:
+            return
+        
+        route = self._signal_route(session_id, from_user_id, sender.role, to_user_id)
+        if route is None:
+            stats = self.signal_stats.setdefault(session_id, {"relayed": 0, "rejected": 0})
+            stats["rejected"] += 1
+            return
+        
+        if signal_type == "ice_candidate":
+            self._get_ice_batcher(session_id).add(from_user_id, to_user_id, signal_data)
+            return
+        
+        self._relay_signal(session_id, route, {
             "type": "webrtc_signal",
-            "signal_type": signal_type,  # "offer", "answer", "ice_candidate"
+            "signal_type": signal_type,  # "offer", "answer"
             "from_user_id": from_user_id,
             "signal_data": signal_data,
             "timestamp": datetime.now().isoformat()
-        }
-        
-        if to_user_id == "all":
-            # Broadcast to all WebRTC peers (mesh topology)
-            await self.broadcast_to_session(session_id, signal_message, exclude_user=from_user_id)
-        else:
-            # Send to specific user (SFU or P2P)
-            await self.send_to_user(session_id, to_user_id, signal_message)
-        
-        print(f"📡 WebRTC {signal_type} from {from_user_id} to {to_user_id} in {session_id}")
+        })
     
+    def _leave_all(self, session_id: str):
+        """Everyone leaves; connections close in the background once their queues are flushed"""
+        for user_id in list(self.manager.live_sessions.get(session_id, {})):
+            self._leave_live_session(session_id, user_id, drain=True)
+    
+    @session_command
     async def handle_session_ended(self, session_id: str):
-        """End live session and notify all users"""
-        if session_id not in self.manager.live_sessions:
-            return
+        """End live session and notify all users (participants on other nodes leave when the notice reaches them)"""
+        await chat_store.flush(session_id)
+        
+        # Pending chat and reactions go out before the end notice
+        for batchers in (self.chat_batchers, self.reaction_aggregators):
+            if session_id in batchers:
+                batchers[session_id].flush()
+        if session_id in self.ice_batchers:
+            self.ice_batchers[session_id].close()
         
         await self.broadcast_to_session(session_id, {
             "type": "session_ended",
             "message": "The live session has ended",
             "timestamp": datetime.now().isoformat()
         })
+        self._leave_all(session_id)
         
-        # Close all connections
-        for user_id in list(self.manager.live_sessions[session_id].keys()):
-            try:
-                await self.manager.live_sessions[session_id][user_id]["websocket"].close()
-            except:
-                pass
-            self.leave_live_session(session_id, user_id)
+        # Final viewer/guest/peak counts to live_sessions; later leaves and flushes skip the session
+        await live_counters.end_session(session_id)
         
         print(f"🛑 Live session ended: {session_id}")
     
@@ -636,15 +1343,33 @@ class LiveStreamManager:
         participants = []
         for user_id, info in self.manager.live_sessions[session_id].items():
             participants.append({
-                "user_id": user_id,
-                "username": info["username"],
-                "role": info["role"],
-                "audio_enabled": info["audio_enabled"],
-                "video_enabled": info["video_enabled"],
-                "connected_at": info["connected_at"]
+                **info.to_dict(user_id),
+                "connected_at": datetime.fromtimestamp(info.connected_at).isoformat(),
+                "delivery": info.connection.get_stats()
             })
         
         return participants
+    
+    def get_session_delivery_stats(self, session_id: str) -> dict:
+        """Dropped/coalesced frame counters and queue depths for a session"""
+        stats = dict(self.session_metrics.get(session_id) or new_delivery_metrics())
+        depths = [len(info.connection.queue)
+                  for info in self.manager.live_sessions.get(session_id, {}).values()]
+        stats["max_queue_depth"] = max(depths, default=0)
+        stats["clients_backlogged"] = sum(1 for depth in depths if depth > 0)
+        if session_id in self.chat_batchers:
+            stats["chat"] = dict(self.chat_batchers[session_id].stats)
+        if session_id in self.reaction_aggregators:
+            stats["reactions"] = dict(self.reaction_aggregators[session_id].stats)
+        stats["throttled"] = dict(self.throttled.get(session_id, {}))
+        stats["signals"] = dict(self.signal_stats.get(session_id, {}))
+        if session_id in self.ice_batchers:
+            stats["signals"].update(self.ice_batchers[session_id].stats)
+        stats["slow_mode"] = self.slow_mode.get(session_id, 0)
+        if session_id in self.actors:
+            actor = self.actors[session_id]
+            stats["actor"] = {**actor.stats, "queued": actor.inbox.qsize()}
+        return stats
 
 
 # Global live stream manager
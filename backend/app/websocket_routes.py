@@ -3,10 +3,12 @@ WebSocket Routes for Real-time Features
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
 from typing import Optional
-import json
 from datetime import datetime
 
 from .websocket_manager import ws_manager, live_manager
+from .ws_connection import accept_websocket, receive_message
+from .presence import presence_service, presence_room, PRESENCE_MAX_BATCH
+from .live_counters import SessionFull, live_counters
 from .auth import verify_token
 
 router = APIRouter(prefix="/ws", tags=["WebSocket"])
@@ -49,12 +51,18 @@ async def websocket_endpoint(
     Usage:
     ws://localhost:8000/ws/connect?token=YOUR_JWT_TOKEN
     
+    Messages are JSON text; offer the "trendke.msgpack" subprotocol to send and
+    receive msgpack binary frames instead (same message shapes).
+    
     Message Types:
-    - join_room: {"action": "join_room", "room": "room_name"}
+    - join_room: {"action": "join_room", "room": "room_name"}  ("trending" for trending_update)
     - leave_room: {"action": "leave_room", "room": "room_name"}
     - join_video: {"action": "join_video", "video_id": "video_123"}
     - leave_video: {"action": "leave_video", "video_id": "video_123"}
-    - ping: {"action": "ping"}
+    - ping: {"action": "ping"}  (also the presence heartbeat)
+    - pong: {"action": "pong"}  (reply to a server {"type": "ping"}; unanswered pings get the socket reaped)
+    - watch_presence: {"action": "watch_presence", "user_ids": ["user_1", ...]}
+    - unwatch_presence: {"action": "unwatch_presence", "user_ids": ["user_1", ...]}
     """
     
     # Authenticate user
@@ -78,27 +86,47 @@ async def websocket_endpoint(
     
     # Connect WebSocket
     connection_id = await ws_manager.connect(websocket, user_id)
+    presence_service.user_connected(user_id)
     
     try:
         while True:
-            # Receive message
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # Receive message (JSON text or msgpack binary)
+            message = await receive_message(websocket)
+            ws_manager.touch(user_id, connection_id)
             
             action = message.get("action")
             
             # Handle different actions
-            if action == "ping":
-                await websocket.send_json({
+            if action == "pong":
+                pass  # Heartbeat reply; touch() above already recorded it
+            
+            elif action == "ping":
+                presence_service.heartbeat(user_id)
+                ws_manager.send_to_connection(user_id, connection_id, {
                     "type": "pong",
                     "timestamp": datetime.now().isoformat()
                 })
             
+            elif action == "watch_presence":
+                # Get online/offline changes for these users, plus their status now
+                user_ids = [str(uid) for uid in message.get("user_ids", [])[:PRESENCE_MAX_BATCH]]
+                for watched_id in user_ids:
+                    ws_manager.join_room(user_id, presence_room(watched_id))
+                ws_manager.send_to_connection(user_id, connection_id, {
+                    "type": "presence_snapshot",
+                    "presence": await presence_service.is_online(user_ids),
+                    "timestamp": datetime.now().isoformat()
+                })
+            
+            elif action == "unwatch_presence":
+                for watched_id in message.get("user_ids", [])[:PRESENCE_MAX_BATCH]:
+                    ws_manager.leave_room(user_id, presence_room(str(watched_id)))
+            
             elif action == "join_room":
                 room = message.get("room")
                 if room:
                     ws_manager.join_room(user_id, room)
-                    await websocket.send_json({
+                    ws_manager.send_to_connection(user_id, connection_id, {
                         "type": "room_joined",
                         "room": room,
                         "timestamp": datetime.now().isoformat()
@@ -108,7 +136,7 @@ async def websocket_endpoint(
                 room = message.get("room")
                 if room:
                     ws_manager.leave_room(user_id, room)
-                    await websocket.send_json({
+                    ws_manager.send_to_connection(user_id, connection_id, {
                         "type": "room_left",
                         "room": room,
                         "timestamp": datetime.now().isoformat()
@@ -141,7 +169,7 @@ async def websocket_endpoint(
                     )
             
             else:
-                await websocket.send_json({
+                ws_manager.send_to_connection(user_id, connection_id, {
                     "type": "error",
                     "message": f"Unknown action: {action}",
                     "timestamp": datetime.now().isoformat()
@@ -149,11 +177,13 @@ async def websocket_endpoint(
     
     except WebSocketDisconnect:
         ws_manager.disconnect(user_id, connection_id)
+        presence_service.user_disconnected(user_id)
         print(f"🔌 Client disconnected: {user_id}")
     
     except Exception as e:
         print(f"❌ WebSocket error for {user_id}: {e}")
         ws_manager.disconnect(user_id, connection_id)
+        presence_service.user_disconnected(user_id)
 
 
 @router.get("/stats")
@@ -169,12 +199,32 @@ async def get_websocket_stats():
             "videos_being_watched": len(ws_manager.video_viewers),
             "total_connections": sum(len(conns) for conns in ws_manager.active_connections.values())
         },
+        "delivery": ws_manager.delivery_metrics,
+        "heartbeat": ws_manager.heartbeats.get_stats(),
+        "broker": {
+            "type": type(ws_manager.broker).__name__,
+            "node_id": ws_manager.node_id,
+            "channels": len(ws_manager.broker.channels),
+            **ws_manager.broker.stats
+        },
+        "presence": presence_service.stats,
         "online_user_ids": online_users,
         "rooms": {room: len(users) for room, users in ws_manager.rooms.items()},
         "video_viewers": {video: len(users) for video, users in ws_manager.video_viewers.items()}
     }
 
 
+@router.get("/presence")
+async def get_presence(user_ids: str = Query(..., description="Comma-separated user ids")):
+    """Batch online check (any worker/instance), e.g. /ws/presence?user_ids=a,b,c"""
+    ids = [uid.strip() for uid in user_ids.split(",") if uid.strip()]
+    
+    return {
+        "status": "success",
+        "presence": await presence_service.is_online(ids)
+    }
+
+
 @router.get("/room/{room_name}/users")
 async def get_room_users(room_name: str):
     """Get list of users in a room"""
@@ -209,13 +259,22 @@ async def live_stream_websocket(
     websocket: WebSocket,
     session_id: str,
     token: Optional[str] = Query(None),
-    username: Optional[str] = Query(None)
+    username: Optional[str] = Query(None),
+    resume: Optional[str] = Query(None)
 ):
     """
     WebSocket endpoint for live streaming sessions
     
     Usage:
     ws://localhost:8001/ws/live/SESSION_ID?token=JWT_TOKEN&username=USERNAME
+    (offer the "trendke.msgpack" subprotocol for msgpack binary frames)
+    
+    The join snapshot is current_participants followed by recent chat_batch
+    frames. Chat frames carry a "seq"; reconnect with
+    &resume={history_epoch}.{last seq} to get only the frames missed meanwhile.
+    
+    Chat, reactions and WebRTC signals are rate limited per connection; chat
+    over the limit gets a {"type": "rate_limited"} reply, the others are dropped.
     
     Features:
     - Real-time participant updates
@@ -259,9 +318,18 @@ async def live_stream_websocket(
         "signal_data": {...}
     }
     
+    {
+        "action": "set_slow_mode",  // host/cohost; viewers then get one chat message per N seconds
+        "seconds": 10  // 0 turns it off
+    }
+    
     {
         "action": "ping"
     }
+    
+    {
+        "action": "pong"  // reply to a server {"type": "ping"}
+    }
     """
     
     try:
@@ -270,8 +338,8 @@ async def live_stream_websocket(
         print(f"   Username: {username}")
         
         # ACCEPT CONNECTION FIRST
-        await websocket.accept()
-        print(f"✅ WebSocket accepted")
+        codec = await accept_websocket(websocket)
+        print(f"✅ WebSocket accepted ({codec})")
         
         # Authenticate user
         try:
@@ -308,11 +376,15 @@ async def live_stream_websocket(
     # Connect to live session
     try:
         viewer_count = await live_manager.join_live_session(
-            websocket, session_id, user_id, username, role
+            websocket, session_id, user_id, username, role, resume=resume
         )
         
+        presence_service.user_connected(user_id)
         print(f"✅ {username} connected to live session {session_id} ({viewer_count} viewers)")
         
+    except SessionFull:
+        await websocket.close(code=1013, reason="Live session is at maximum capacity")
+        return
     except Exception as e:
         print(f"❌ Failed to join session: {e}")
         await websocket.close(code=1011, reason=str(e))
@@ -320,27 +392,34 @@ async def live_stream_websocket(
     
     try:
         while True:
-            # Receive message
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # Receive message (JSON text or msgpack binary)
+            message = await receive_message(websocket)
+            live_manager.touch(session_id, user_id)
             
             action = message.get("action")
             
-            if action == "ping":
-                await websocket.send_json({
+            if action == "pong":
+                pass  # Heartbeat reply; touch() above already recorded it
+            
+            elif action == "ping":
+                presence_service.heartbeat(user_id)
+                await live_manager.send_to_user(session_id, user_id, {
                     "type": "pong",
                     "timestamp": datetime.now().isoformat()
                 })
             
             elif action == "chat":
                 text = message.get("message", "")
-                if text:
+                if isinstance(text, str) and text:
                     await live_manager.handle_chat_message(session_id, user_id, text)
             
             elif action == "reaction":
                 reaction = message.get("reaction", "❤️")
                 await live_manager.handle_reaction(session_id, user_id, reaction)
             
+            elif action == "set_slow_mode":
+                await live_manager.set_slow_mode(session_id, message.get("seconds", 0), user_id)
+            
             elif action == "request_guest":
                 await live_manager.handle_guest_request(session_id, user_id)
             
@@ -371,38 +450,26 @@ async def live_stream_websocket(
             
             elif action == "update_media_status":
                 # Update user's media status (audio/video enabled)
-                audio_enabled = message.get("audio_enabled")
-                video_enabled = message.get("video_enabled")
-                
-                if session_id in live_manager.manager.live_sessions:
-                    if user_id in live_manager.manager.live_sessions[session_id]:
-                        if audio_enabled is not None:
-                            live_manager.manager.live_sessions[session_id][user_id]["audio_enabled"] = audio_enabled
-                        if video_enabled is not None:
-                            live_manager.manager.live_sessions[session_id][user_id]["video_enabled"] = video_enabled
-                        
-                        # Broadcast status change
-                        await live_manager.broadcast_to_session(session_id, {
-                            "type": "participant_media_changed",
-                            "user_id": user_id,
-                            "audio_enabled": audio_enabled,
-                            "video_enabled": video_enabled
-                        })
+                await live_manager.update_media_status(
+                    session_id, user_id, message.get("audio_enabled"), message.get("video_enabled")
+                )
             
             else:
-                await websocket.send_json({
+                await live_manager.send_to_user(session_id, user_id, {
                     "type": "error",
                     "message": f"Unknown action: {action}",
                     "timestamp": datetime.now().isoformat()
                 })
     
     except WebSocketDisconnect:
-        live_manager.leave_live_session(session_id, user_id)
+        live_manager.leave_live_session(session_id, user_id, websocket)
+        presence_service.user_disconnected(user_id)
         print(f"🔌 {username} disconnected from live session {session_id}")
     
     except Exception as e:
         print(f"❌ WebSocket error for {username} in session {session_id}: {e}")
-        live_manager.leave_live_session(session_id, user_id)
+        live_manager.leave_live_session(session_id, user_id, websocket)
+        presence_service.user_disconnected(user_id)
 
 
 @router.get("/live/{session_id}/stats")
@@ -415,7 +482,9 @@ async def get_live_session_stats(session_id: str):
         "status": "success",
         "session_id": session_id,
         "viewer_count": viewer_count,
-        "participants": participants
+        "participants": participants,
+        "counters": await live_counters.get(session_id),
+        "delivery": live_manager.get_session_delivery_stats(session_id)
     }
 
 
@@ -0,0 +1,296 @@
+"""
+Pub/sub backbone for WebSocket fan-out across workers and instances
+Room, user, video, live-session and global broadcasts are published once to a
+broker channel; every node delivers to its own local sockets. Nodes subscribe
+only to the channels they currently have local members for (plus ws:all and
+ws:users).
+
+Channels:
+- ws:all                 everyone connected anywhere
+- ws:users               a list of users (one envelope with their ids in "to_users")
+- ws:user:{user_id}      all sockets of one user (notifications)
+- ws:room:{room}         room subscribers
+- ws:video:{video_id}    viewers of a video
+- ws:session:{id}        live session participants
+
+The publishing node delivers locally right away and tags the envelope with its
+node id, so it skips its own message when the broker echoes it back.
+
+Viewer counts are cluster-wide: each node announces its local count for a video
+or session on that channel (a "node_count" envelope) and sums everyone's latest
+announcement before sending viewer_update / viewer_count frames (NodeCounts).
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from .ws_connection import encode_json
+
+# "redis" (default when Redis is available) or "memory" (single process)
+WS_BROKER = os.getenv("WS_BROKER", "redis")
+
+# Max pending publishes before new ones are dropped (subscription changes are never dropped)
+BROKER_QUEUE_SIZE = int(os.getenv("WS_BROKER_QUEUE_SIZE", "10000"))
+
+# Nodes re-announce their counts this often; a node silent for 3x this long is dropped
+NODE_COUNT_REFRESH_SECONDS = float(os.getenv("WS_NODE_COUNT_REFRESH_SECONDS", "30"))
+
+ALL_CHANNEL = "ws:all"
+USERS_CHANNEL = "ws:users"
+
+# Every node listens on these
+NODE_CHANNELS = (ALL_CHANNEL, USERS_CHANNEL)
+
+BrokerHandler = Callable[[str, dict], None]
+
+
+def channel_for(kind: str, target: str) -> str:
+    """Channel name for a broadcast target, e.g. channel_for("room", "lobby")"""
+    return f"ws:{kind}:{target}"
+
+
+def parse_channel(channel: str) -> Tuple[str, str]:
+    """Inverse of channel_for: "ws:room:lobby" -> ("room", "lobby"); ws:all -> ("all", "")"""
+    _, _, rest = channel.partition(":")
+    kind, _, target = rest.partition(":")
+    return kind, target
+
+
+class NodeCounts:
+    """
+    Per-target member counts of the other nodes, as announced over the broker
+    A node announces its own count when it changes, when a node it hasn't heard
+    from shows up (so newcomers learn the total) and every NODE_COUNT_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self.remote: Dict[str, Dict[str, Tuple[int, float]]] = {}  # target: {node_id: (count, heard_at)}
+        self.sent: Dict[str, int] = {}  # Total last delivered locally
+        self.changed: Set[str] = set()  # Remote counts changed since the last collect()
+        self.reply: Set[str] = set()  # A new node appeared: announce ours
+        self.next_refresh = 0.0
+
+    def receive(self, target: str, node_id: str, count: int):
+        nodes = self.remote.setdefault(target, {})
+        if node_id not in nodes:
+            self.reply.add(target)
+        if count > 0:
+            nodes[node_id] = (count, time.monotonic())
+        else:
+            nodes.pop(node_id, None)
+            if not nodes:
+                del self.remote[target]
+        self.changed.add(target)
+
+    def total(self, target: str, local: int) -> int:
+        """Cluster-wide count: our local count plus every live node's last announcement"""
+        nodes = self.remote.get(target)
+        if not nodes:
+            return local
+        expired = time.monotonic() - 3 * NODE_COUNT_REFRESH_SECONDS
+        for node_id in [node_id for node_id, (_, heard_at) in nodes.items() if heard_at < expired]:
+            del nodes[node_id]
+        return local + sum(count for count, _ in nodes.values())
+
+    def collect(self, dirty: Set[str], local_targets: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+        """Targets to announce our count for, and targets whose total may have changed"""
+        announce, self.reply = dirty | self.reply, set()
+        changed, self.changed = dirty | self.changed, set()
+        now = time.monotonic()
+        if now >= self.next_refresh:
+            self.next_refresh = now + NODE_COUNT_REFRESH_SECONDS
+            local_targets = set(local_targets)
+            announce |= local_targets
+            changed |= local_targets  # Also expires silent nodes
+        return announce, changed
+
+    def forget(self, target: str):
+        """No local members left: stop tracking the target"""
+        self.remote.pop(target, None)
+        self.sent.pop(target, None)
+
+
+class InMemoryBroker:
+    """
+    Broker for a single process (and for tests). Brokers created with the same
+    hub behave like separate nodes sharing one pub/sub server.
+    """
+
+    def __init__(self, hub: Optional[Dict[str, Set["InMemoryBroker"]]] = None):
+        self.hub = hub if hub is not None else {}
+        self.channels: Set[str] = set()
+        self.handler: Optional[BrokerHandler] = None
+        self.stats = {"published": 0, "received": 0, "dropped": 0}
+
+    async def start(self, handler: BrokerHandler):
+        self.handler = handler
+        for channel in NODE_CHANNELS:
+            self.subscribe(channel)
+
+    async def stop(self):
+        for channel in list(self.channels):
+            self.unsubscribe(channel)
+        self.handler = None
+
+    def subscribe(self, channel: str):
+        if channel not in self.channels:
+            self.channels.add(channel)
+            self.hub.setdefault(channel, set()).add(self)
+
+    def unsubscribe(self, channel: str):
+        if channel in self.channels:
+            self.channels.discard(channel)
+            subscribers = self.hub.get(channel)
+            if subscribers is not None:
+                subscribers.discard(self)
+                if not subscribers:
+                    del self.hub[channel]
+
+    def publish(self, channel: str, envelope: dict):
+        self.stats["published"] += 1
+        loop = asyncio.get_running_loop()
+        for broker in self.hub.get(channel, ()):
+            if broker is not self and broker.handler:
+                loop.call_soon(broker._receive, channel, envelope)
+
+    def _receive(self, channel: str, envelope: dict):
+        if self.handler and channel in self.channels:
+            self.stats["received"] += 1
+            self.handler(channel, envelope)
+
+
+class RedisBroker:
+    """
+    Redis pub/sub broker. Callers never await Redis: publishes go through a
+    bounded queue drained by a publisher task (new ones are dropped when it is
+    full), subscription changes through their own unbounded queue and task, so
+    a burst of publishes can't cost a node its subscriptions.
+    """
+
+    def __init__(self, redis_cache, queue_size: int = BROKER_QUEUE_SIZE):
+        self.cache = redis_cache
+        self.channels: Set[str] = set()
+        self.handler: Optional[BrokerHandler] = None
+        self.pubsub = None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.control: asyncio.Queue = asyncio.Queue()
+        self.publisher_task: Optional[asyncio.Task] = None
+        self.subscriber_task: Optional[asyncio.Task] = None
+        self.reader_task: Optional[asyncio.Task] = None
+        self.stats = {"published": 0, "received": 0, "dropped": 0, "errors": 0}
+
+    async def start(self, handler: BrokerHandler):
+        self.handler = handler
+        self.pubsub = self.cache.pubsub()
+        if self.pubsub is None:
+            raise RuntimeError("Redis is not connected")
+
+        self.channels.update(NODE_CHANNELS)
+        await self.pubsub.subscribe(*NODE_CHANNELS)
+        self.publisher_task = asyncio.create_task(self._publisher())
+        self.subscriber_task = asyncio.create_task(self._subscriber())
+        self.reader_task = asyncio.create_task(self._reader())
+        print("📡 WebSocket broker started (Redis pub/sub)")
+
+    async def stop(self):
+        for task in (self.publisher_task, self.subscriber_task, self.reader_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.publisher_task = self.subscriber_task = self.reader_task = None
+
+        if self.pubsub is not None:
+            try:
+                await self.pubsub.close()
+            except Exception:
+                pass
+            self.pubsub = None
+        self.handler = None
+        print("📡 WebSocket broker stopped")
+
+    def subscribe(self, channel: str):
+        if channel not in self.channels:
+            self.channels.add(channel)
+            self.control.put_nowait(("subscribe", channel))
+
+    def unsubscribe(self, channel: str):
+        if channel in self.channels:
+            self.channels.discard(channel)
+            self.control.put_nowait(("unsubscribe", channel))
+
+    def publish(self, channel: str, envelope: dict):
+        try:
+            self.queue.put_nowait((channel, encode_json(envelope)))
+            self.stats["published"] += 1
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    async def _publisher(self):
+        """Send queued publishes in order"""
+        while True:
+            channel, data = await self.queue.get()
+            try:
+                await self.cache.publish(channel, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️  WebSocket broker publish error: {e}")
+
+    async def _subscriber(self):
+        """Apply queued subscription changes in order"""
+        while True:
+            operation, channel = await self.control.get()
+            try:
+                # Skip changes undone again while queued
+                if operation == "subscribe" and channel in self.channels:
+                    await self.pubsub.subscribe(channel)
+                elif operation == "unsubscribe" and channel not in self.channels:
+                    await self.pubsub.unsubscribe(channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️  WebSocket broker {operation} error: {e}")
+
+    async def _reader(self):
+        """Hand every message on our channels to the handler; resubscribe after errors"""
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    self.stats["received"] += 1
+                    try:
+                        self.handler(message["channel"], json.loads(message["data"]))
+                    except Exception as e:
+                        print(f"⚠️  WebSocket broker delivery error: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️  WebSocket broker connection error: {e}")
+                await asyncio.sleep(1)
+                try:
+                    await self.pubsub.close()
+                    self.pubsub = self.cache.pubsub()
+                    await self.pubsub.subscribe(*self.channels)
+                except Exception as retry_error:
+                    print(f"⚠️  WebSocket broker resubscribe failed: {retry_error}")
+
+
+def create_broker():
+    """Broker for this process: Redis when configured and connected, else in-memory"""
+    if WS_BROKER == "redis":
+        try:
+            from .redis_cache import cache
+            if cache.enabled:
+                return RedisBroker(cache)
+        except ImportError:
+            pass
+    return InMemoryBroker()
@@ -0,0 +1,369 @@
+"""
+Outbound side of a WebSocket connection
+Every accepted socket gets a bounded send queue drained by its own writer task,
+so broadcasting is a non-blocking enqueue per recipient and one slow client can
+no longer hold up delivery to everyone after it in the loop.
+
+Slow consumers are handled by a SlowConsumerPolicy, applied as the queue grows:
+1. state updates with a coalesce key replace the pending frame for that key
+2. low-priority frames (reactions, viewer counts) are dropped past a watermark
+3. a client that stays above the high watermark for the grace period, or fills
+   the queue completely, is disconnected
+
+Wire format: JSON text by default; clients that offer the "trendke.msgpack"
+subprotocol get (and may send) msgpack binary frames instead. Each Frame is
+encoded at most once per codec. permessage-deflate is negotiated by uvicorn
+underneath either codec.
+"""
+from fastapi import WebSocket, WebSocketDisconnect
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple, Union
+import asyncio
+import json
+import os
+import time
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+# Max frames waiting to be written to one client before it is disconnected
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
+# Queue depth past which low-priority frames are dropped for that client
+LOW_PRIORITY_WATERMARK = int(os.getenv("WS_LOW_PRIORITY_WATERMARK", "32"))
+
+# A client above the high watermark for longer than the grace period is disconnected
+HIGH_WATERMARK = int(os.getenv("WS_HIGH_WATERMARK", "128"))
+SLOW_CLIENT_GRACE_SECONDS = float(os.getenv("WS_SLOW_CLIENT_GRACE_SECONDS", "5"))
+
+# Replace queued state updates with newer ones instead of queueing both
+COALESCE_STATE_UPDATES = os.getenv("WS_COALESCE_STATE_UPDATES", "true").lower() == "true"
+
+# How long a graceful close waits for already-queued frames to be written
+CLOSE_DRAIN_SECONDS = float(os.getenv("WS_CLOSE_DRAIN_SECONDS", "2"))
+
+# Wire codecs; msgpack is used when the client offers MSGPACK_SUBPROTOCOL
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"
+MSGPACK_SUBPROTOCOL = "trendke.msgpack"
+
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = 1
+
+# Frames that can be lost under pressure without breaking the client's state
+LOW_PRIORITY_TYPES = {"reaction", "reaction_summary", "viewer_update", "viewer_count"}
+
+# State updates where only the latest value matters: type -> field identifying the state
+COALESCE_FIELDS = {
+    "viewer_update": "video_id",
+    "viewer_count": "session_id",
+    "participant_media_changed": "user_id",
+    "participant_audio_changed": "user_id",
+    "participant_video_changed": "user_id",
+}
+
+
+def encode_json(message: dict) -> str:
+    """Encode a message as compact JSON text (same output as send_json)"""
+    if HAS_ORJSON:
+        return orjson.dumps(message, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def encode_msgpack(message: dict) -> bytes:
+    return msgpack.packb(message, default=str, use_bin_type=True)
+
+
+def negotiate_codec(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """Pick the codec from the client's offered subprotocols: (codec, subprotocol to accept)"""
+    scope = getattr(websocket, "scope", None) or {}
+    if HAS_MSGPACK and MSGPACK_SUBPROTOCOL in scope.get("subprotocols", ()):
+        return CODEC_MSGPACK, MSGPACK_SUBPROTOCOL
+    return CODEC_JSON, None
+
+
+async def accept_websocket(websocket: WebSocket) -> str:
+    """Accept with the negotiated subprotocol; returns the codec to use"""
+    codec, subprotocol = negotiate_codec(websocket)
+    if subprotocol:
+        await websocket.accept(subprotocol=subprotocol)
+    else:
+        await websocket.accept()
+    return codec
+
+
+async def receive_message(websocket: WebSocket) -> dict:
+    """
+    Next client message, whichever codec it was sent with (JSON text or msgpack
+    binary). Raises WebSocketDisconnect when the client goes away.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+
+    data = message.get("bytes")
+    if data is not None:
+        if not HAS_MSGPACK:
+            raise ValueError("Binary frames need msgpack")
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(message.get("text") or "null")
+
+
+class Frame:
+    """
+    An outbound message, encoded at most once no matter how many clients it goes to.
+    Broadcasts build one Frame and queue the same object on every recipient; the
+    first writer to reach it encodes, the rest reuse the cached text/bytes.
+    """
+    __slots__ = ("message", "_text", "_binary", "priority", "coalesce_key")
+
+    def __init__(self, message: dict, priority: Optional[int] = None, coalesce_key: Optional[str] = None):
+        self.message = message
+        self._text: Optional[str] = None
+        self._binary: Optional[bytes] = None
+
+        message_type = message.get("type")
+        if priority is None:
+            priority = PRIORITY_LOW if message_type in LOW_PRIORITY_TYPES else PRIORITY_NORMAL
+        self.priority = priority
+
+        if coalesce_key is None and message_type in COALESCE_FIELDS:
+            coalesce_key = f"{message_type}:{message.get(COALESCE_FIELDS[message_type])}"
+        self.coalesce_key = coalesce_key
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = encode_json(self.message)
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = encode_msgpack(self.message)
+        return self._binary
+
+
+class SlowConsumerPolicy:
+    """Thresholds applied to each client's send queue (defaults from WS_* env vars)"""
+    __slots__ = ("max_queue", "low_priority_watermark", "high_watermark", "grace_seconds", "coalesce")
+
+    def __init__(self, max_queue: int = SEND_QUEUE_SIZE,
+                 low_priority_watermark: int = LOW_PRIORITY_WATERMARK,
+                 high_watermark: int = HIGH_WATERMARK,
+                 grace_seconds: float = SLOW_CLIENT_GRACE_SECONDS,
+                 coalesce: bool = COALESCE_STATE_UPDATES):
+        self.max_queue = max_queue
+        self.low_priority_watermark = low_priority_watermark
+        self.high_watermark = high_watermark
+        self.grace_seconds = grace_seconds
+        self.coalesce = coalesce
+
+
+DEFAULT_POLICY = SlowConsumerPolicy()
+
+
+def new_delivery_metrics() -> Dict[str, int]:
+    """Counters shared by a group of connections (e.g. one live session)"""
+    return {"dropped": 0, "coalesced": 0, "slow_disconnects": 0, "failed_sends": 0, "reaped": 0}
+
+
+class ClientConnection:
+    """One accepted WebSocket with a bounded outbound queue and a dedicated writer"""
+
+    def __init__(self, websocket: WebSocket, user_id: str, connection_id: str,
+                 on_close: Optional[Callable[["ClientConnection"], None]] = None,
+                 policy: Optional[SlowConsumerPolicy] = None,
+                 metrics: Optional[Dict[str, int]] = None,
+                 codec: str = CODEC_JSON):
+        self.websocket = websocket
+        self.codec = codec
+        self.user_id = user_id
+        self.connection_id = connection_id
+        self.on_close = on_close
+        self.policy = policy or DEFAULT_POLICY
+        self.metrics = metrics  # Shared group counters, updated alongside our own
+        # Items are Frames, or coalesce keys whose latest Frame is in _pending
+        self.queue: Deque[Union[Frame, str]] = deque()
+        self._pending: Dict[str, Frame] = {}
+        self.closed = False
+
+        # Heartbeat (see ws_heartbeat.HeartbeatWheel)
+        self.last_seen = time.monotonic()
+        self.pinged_at: Optional[float] = None
+
+        # Backpressure tracking
+        self.frames_sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.drain_rate = 0.0  # frames/s while the queue is non-empty (smoothed)
+        self.over_watermark_since: Optional[float] = None
+        self._rate_started = 0.0
+        self._rate_frames = 0
+
+        self._ready = asyncio.Event()
+        self._close_task: Optional[asyncio.Task] = None
+        self._writer_task = asyncio.create_task(self._writer())
+
+    def touch(self):
+        """The client sent something: it is alive"""
+        self.last_seen = time.monotonic()
+
+    def _count(self, name: str):
+        if self.metrics is not None:
+            self.metrics[name] += 1
+
+    def send(self, message: Union[Frame, dict]) -> bool:
+        """
+        Queue a message for this client (never awaits). Returns False if not queued.
+        Pass a shared Frame when the same message goes to many clients.
+        """
+        if self.closed:
+            return False
+
+        if not isinstance(message, Frame):
+            message = Frame(message)
+
+        policy = self.policy
+        depth = len(self.queue)
+
+        # Newer state for something already queued: replace it in place
+        key = message.coalesce_key
+        if key is not None and policy.coalesce:
+            if key in self._pending:
+                self._pending[key] = message
+                self.coalesced += 1
+                self._count("coalesced")
+                return True
+
+        if depth >= policy.high_watermark:
+            now = time.monotonic()
+            if self.over_watermark_since is None:
+                self.over_watermark_since = now
+            elif now - self.over_watermark_since > policy.grace_seconds:
+                self._count("slow_disconnects")
+                self._fail(f"over {policy.high_watermark} queued frames for {policy.grace_seconds:g}s")
+                return False
+
+        if message.priority == PRIORITY_LOW and depth >= policy.low_priority_watermark:
+            self.dropped += 1
+            self._count("dropped")
+            return False
+
+        if depth >= policy.max_queue:
+            self._count("slow_disconnects")
+            self._fail(f"send queue full ({policy.max_queue} frames)")
+            return False
+
+        if key is not None and policy.coalesce:
+            self._pending[key] = message
+            self.queue.append(key)
+        else:
+            self.queue.append(message)
+        self._ready.set()
+        return True
+
+    async def _writer(self):
+        """Drain the queue to the socket until cancelled or a send fails"""
+        binary = self.codec == CODEC_MSGPACK
+        try:
+            while True:
+                if not self.queue:
+                    if self.closed:
+                        return  # Graceful close: everything queued has been written
+                    self._ready.clear()
+                    await self._ready.wait()
+                    self._rate_started = time.monotonic()
+                    self._rate_frames = self.frames_sent
+                    continue
+
+                item = self.queue.popleft()
+                frame = self._pending.pop(item) if isinstance(item, str) else item
+                if binary:
+                    await self.websocket.send_bytes(frame.binary)
+                else:
+                    await self.websocket.send_text(frame.text)
+                self.frames_sent += 1
+                self._track_drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._count("failed_sends")
+            self._fail(f"send failed: {e}")
+
+    def _track_drain(self):
+        """Update the drain rate and the high-watermark clock after a write"""
+        if len(self.queue) < self.policy.high_watermark:
+            self.over_watermark_since = None
+
+        now = time.monotonic()
+        elapsed = now - self._rate_started
+        if elapsed >= 1.0:
+            rate = (self.frames_sent - self._rate_frames) / elapsed
+            self.drain_rate = rate if not self.drain_rate else 0.7 * self.drain_rate + 0.3 * rate
+            self._rate_started = now
+            self._rate_frames = self.frames_sent
+
+    def get_stats(self) -> dict:
+        """Queue depth and delivery counters for this client"""
+        return {
+            "codec": self.codec,
+            "queue_depth": len(self.queue),
+            "frames_sent": self.frames_sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "drain_rate": round(self.drain_rate, 1)
+        }
+
+    def reap(self, reason: str):
+        """Drop a client that stopped answering heartbeats"""
+        if not self.closed:
+            self._count("reaped")
+            self._fail(reason, close_reason="Heartbeat timeout")
+
+    def _fail(self, reason: str, close_reason: str = "Connection too slow"):
+        """Give up on a client: stop writing, close the socket, notify the owner"""
+        if self.closed:
+            return
+
+        print(f"⚠️  Dropping WebSocket {self.user_id}/{self.connection_id}: {reason}")
+        self.detach()
+        self._close_task = asyncio.create_task(self._close_socket(1011, close_reason))
+        if self.on_close:
+            # Deferred so owners never mutate their maps mid-broadcast
+            asyncio.get_running_loop().call_soon(self.on_close, self)
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def detach(self):
+        """Stop the writer and drop pending frames (socket left as is)"""
+        self.closed = True
+        self.queue.clear()
+        self._pending.clear()
+        if self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Stop accepting frames, flush what is queued (bounded wait), then close the socket"""
+        if not self.closed:
+            self.closed = True
+            self._ready.set()
+            try:
+                await asyncio.wait_for(self._writer_task, CLOSE_DRAIN_SECONDS)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+        self.detach()
+        await self._close_socket(code, reason)
@@ -0,0 +1,106 @@
+"""
+Server-driven WebSocket heartbeats
+A socket that vanishes without a close frame (phone loses signal, laptop sleeps)
+otherwise stays in active_connections / live_sessions until a send happens to
+fail. Every connection instead has a deadline on a timer wheel:
+- any message from the client counts as activity (ClientConnection.touch)
+- after WS_PING_INTERVAL_SECONDS of silence the server sends {"type": "ping"};
+  clients answer with {"action": "pong"} (or any other message)
+- still silent WS_PONG_TIMEOUT_SECONDS later, the connection is reaped
+
+The wheel has one slot per `resolution` seconds and each connection sits in
+exactly one slot. Activity only updates a timestamp; a connection is looked at
+again when its slot comes due, so a sweep costs O(connections due), not
+O(connections).
+"""
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .ws_connection import ClientConnection
+
+PING_INTERVAL_SECONDS = float(os.getenv("WS_PING_INTERVAL_SECONDS", "30"))
+PONG_TIMEOUT_SECONDS = float(os.getenv("WS_PONG_TIMEOUT_SECONDS", "15"))
+
+# Slot width; deadlines are enforced to within this (the sweep runs on the manager tick)
+HEARTBEAT_RESOLUTION_SECONDS = float(os.getenv("WS_HEARTBEAT_RESOLUTION_SECONDS", "1"))
+
+
+class HeartbeatWheel:
+    """Ping/pong deadlines for many connections, swept in O(due)"""
+
+    def __init__(self, ping_interval: float = PING_INTERVAL_SECONDS,
+                 pong_timeout: float = PONG_TIMEOUT_SECONDS,
+                 resolution: float = HEARTBEAT_RESOLUTION_SECONDS):
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.resolution = resolution
+        self.slots: Dict[int, List[ClientConnection]] = {}
+        self.cursor = self._slot(time.monotonic())  # Next slot to sweep
+        self.stats = {"tracked": 0, "pings_sent": 0, "reaped": 0}
+
+    def _slot(self, at: float) -> int:
+        return int(at // self.resolution)
+
+    def _schedule(self, connection: ClientConnection, at: float):
+        # Never behind the cursor, or the slot would not be swept again
+        slot = max(self._slot(at), self.cursor)
+        self.slots.setdefault(slot, []).append(connection)
+
+    def track(self, connection: ClientConnection):
+        """Start enforcing heartbeats on a newly accepted connection"""
+        connection.touch()
+        self.stats["tracked"] += 1
+        self._schedule(connection, connection.last_seen + self.ping_interval)
+
+    def sweep(self, now: Optional[float] = None):
+        """Check every connection whose slot is due (called from the manager tick)"""
+        now = time.monotonic() if now is None else now
+        current = self._slot(now)
+        if current < self.cursor:
+            return
+
+        # After a long gap, walk the occupied slots instead of every empty one
+        if current - self.cursor > len(self.slots):
+            due_slots = sorted(slot for slot in self.slots if slot <= current)
+        else:
+            due_slots = range(self.cursor, current + 1)
+        self.cursor = current + 1
+
+        for slot in due_slots:
+            for connection in self.slots.pop(slot, ()):
+                self._check(connection, now)
+
+    def _check(self, connection: ClientConnection, now: float):
+        if connection.closed:
+            return  # Closed some other way: just forget it
+
+        idle_deadline = connection.last_seen + self.ping_interval
+        if now < idle_deadline:
+            # Heard from it since it was scheduled
+            self._schedule(connection, idle_deadline)
+            return
+
+        if connection.pinged_at is None or connection.pinged_at < connection.last_seen:
+            connection.pinged_at = now
+            connection.send({"type": "ping", "timestamp": datetime.now().isoformat()})
+            self.stats["pings_sent"] += 1
+            self._schedule(connection, now + self.pong_timeout)
+            return
+
+        pong_deadline = connection.pinged_at + self.pong_timeout
+        if now < pong_deadline:
+            self._schedule(connection, pong_deadline)
+            return
+
+        self.stats["reaped"] += 1
+        connection.reap(f"no response for {now - connection.last_seen:.0f}s")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "scheduled": sum(len(connections) for connections in self.slots.values()),
+            "ping_interval": self.ping_interval,
+            "pong_timeout": self.pong_timeout
+        }
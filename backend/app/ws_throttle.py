@@ -0,0 +1,50 @@
+"""
+Per-connection rate limits for live WebSocket actions
+Each participant gets a token bucket per action type (chat, reaction,
+webrtc_signal). Actions over the limit are rejected before any fan-out work,
+so one flooding client costs O(1) per message instead of a session broadcast.
+Sessions can tighten chat with slow mode (one message per N seconds, hosts
+and cohosts exempt).
+"""
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+# (tokens per second, burst) per action
+ACTION_LIMITS: Dict[str, Tuple[float, int]] = {
+    "chat": (float(os.getenv("LIVE_CHAT_RATE", "1")), int(os.getenv("LIVE_CHAT_BURST", "5"))),
+    "reaction": (float(os.getenv("LIVE_REACTION_RATE", "10")), int(os.getenv("LIVE_REACTION_BURST", "20"))),
+    "webrtc_signal": (float(os.getenv("LIVE_SIGNAL_RATE", "50")), int(os.getenv("LIVE_SIGNAL_BURST", "100"))),
+}
+
+MAX_SLOW_MODE_SECONDS = 300
+
+
+class TokenBucket:
+    """Classic token bucket; refilled lazily when checked"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """Take a token if one is available"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the next token"""
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else float(MAX_SLOW_MODE_SECONDS)
+
+
+def slow_mode_limit(seconds: float) -> Tuple[float, int]:
+    """Chat limit for slow mode: one message per `seconds`, no burst"""
+    return 1 / seconds, 1
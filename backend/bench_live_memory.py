@@ -0,0 +1,118 @@
+"""
+Live session memory benchmark: bytes per connected viewer
+Run: python bench_live_memory.py [--viewers 10000 100000]
+
+Joins N viewers (plus a host) to one live session through join_live_session
+and measures, with tracemalloc, what the server holds per viewer: participant
+record, role index entry, ClientConnection with its queue and writer task.
+The mock sockets are created before the baseline, since the server's socket
+objects exist regardless of how participants are stored.
+
+Also compares the participant record alone: the old info dict vs LiveParticipant.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import os
+import time
+import tracemalloc
+
+from app.websocket_manager import ConnectionManager, LiveParticipant, LiveStreamManager
+
+
+class NullWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        pass
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def measure(build) -> int:
+    """Bytes still allocated after build() (its return value is kept alive)"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    del kept
+    return after - before
+
+
+def record_sizes(n: int):
+    """Per-record bytes: dict (previous layout) vs slotted LiveParticipant"""
+    def dicts():
+        return [{
+            "connection": None,
+            "role": "viewer",
+            "username": f"user{i}",
+            "connected_at": "2024-06-01T12:00:00.000000",
+            "audio_enabled": True,
+            "video_enabled": False
+        } for i in range(n)]
+
+    def slotted():
+        return [LiveParticipant(None, "viewer", f"user{i}") for i in range(n)]
+
+    return measure(dicts) / n, measure(slotted) / n
+
+
+async def viewers_memory(n: int) -> dict:
+    live = LiveStreamManager(ConnectionManager())
+    sockets = [NullWebSocket() for _ in range(n + 1)]
+
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        await live.join_live_session(sockets[0], "bench", "host", "host", role="host")
+        for i in range(n):
+            await live.join_live_session(sockets[i + 1], "bench", f"u{i}", f"user{i}")
+            if i % 64 == 0:
+                await asyncio.sleep(0)  # Joins arrive from separate handlers; let writers run
+    join_seconds = time.perf_counter() - start
+
+    await asyncio.sleep(0.1)  # Let writers flush the join snapshots
+    live.flush_viewer_counts()
+    await asyncio.sleep(0.1)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+
+    for participant in live.manager.live_sessions["bench"].values():
+        participant.connection.detach()
+    await asyncio.sleep(0)
+
+    return {
+        "viewers": n,
+        "bytes_per_viewer": (after - before) / n,
+        "total_mb": (after - before) / 1024 / 1024,
+        "join_us": join_seconds / n * 1e6
+    }
+
+
+async def main_async(args):
+    tracemalloc.start()
+
+    old, new = record_sizes(10000)
+    print(f"\nParticipant record: dict {old:.0f} B, LiveParticipant {new:.0f} B ({old / new:.1f}x smaller)")
+
+    print(f"\n{'viewers':>9} {'bytes/viewer':>13} {'total MB':>10} {'join µs/viewer':>15}")
+    print("─" * 50)
+    for n in args.viewers:
+        r = await viewers_memory(n)
+        print(f"{r['viewers']:>9} {r['bytes_per_viewer']:>13.0f} {r['total_mb']:>10.1f} {r['join_us']:>15.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Follower timeline benchmark: push vs pull vs hybrid on a skewed follower graph
+Run: python bench_timeline.py [--users 20000] [--threshold 2000]
+
+Simulates a power-law (Zipf) follower graph where a handful of creators have
+most of the followers, then replays uploads and feed reads against three
+in-memory strategies:
+- push:   fan out every upload to every follower timeline
+- pull:   merge uploads of every followed creator at read time
+- hybrid: push for normal creators, pull for creators above the threshold
+"""
+import argparse
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from app.timeline import merge_timelines
+
+PAGE_SIZE = 20
+TIMELINE_MAX_SIZE = 500
+UPLOADS_MAX_SIZE = 200
+
+
+def build_graph(users: int, avg_follows: int, skew: float, seed: int):
+    """Return {follower: [creators]} and {creator: [followers]} with Zipf popularity"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** skew for rank in range(users)]
+    following = {}
+    followers = defaultdict(list)
+    for user in range(users):
+        k = max(1, int(rng.expovariate(1 / avg_follows)))
+        creators = set(rng.choices(range(users), weights=weights, k=k))
+        creators.discard(user)
+        following[user] = list(creators)
+        for creator in creators:
+            followers[creator].append(user)
+    return following, followers
+
+
+def cap(entries, size):
+    """Keep the newest `size` entries of a newest-first list"""
+    del entries[size:]
+
+
+def run_strategy(name, following, followers, uploads, readers, threshold):
+    timelines = defaultdict(list)   # user -> newest-first [(video_id, score)]
+    recent = defaultdict(list)      # creator -> newest-first [(video_id, score)]
+    writes = 0
+
+    start = time.perf_counter()
+    for video_id, creator, score in uploads:
+        recent[creator].insert(0, (video_id, score))
+        cap(recent[creator], UPLOADS_MAX_SIZE)
+        if name == "pull":
+            continue
+        if name == "hybrid" and len(followers[creator]) >= threshold:
+            continue
+        for follower in followers[creator]:
+            timelines[follower].insert(0, (video_id, score))
+            cap(timelines[follower], TIMELINE_MAX_SIZE)
+            writes += 1
+    write_time = time.perf_counter() - start
+
+    read_latencies = []
+    streams_touched = 0
+    for reader in readers:
+        t0 = time.perf_counter()
+        if name == "push":
+            page = [video_id for video_id, _ in timelines[reader][:PAGE_SIZE]]
+            streams_touched += 1
+        else:
+            pulled = following[reader] if name == "pull" else [
+                c for c in following[reader] if len(followers[c]) >= threshold
+            ]
+            streams = [timelines[reader]] + [recent[c] for c in pulled if recent[c]]
+            page = merge_timelines(streams, PAGE_SIZE)
+            streams_touched += len(streams)
+        read_latencies.append(time.perf_counter() - t0)
+        assert len(page) <= PAGE_SIZE
+
+    return {
+        "strategy": name,
+        "timeline_writes": writes,
+        "write_time": write_time,
+        "streams_per_read": streams_touched / len(readers),
+        "read_p50_us": statistics.median(read_latencies) * 1e6,
+        "read_p99_us": statistics.quantiles(read_latencies, n=100)[98] * 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--avg-follows", type=int, default=150)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of creator popularity")
+    parser.add_argument("--uploads", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--threshold", type=int, default=2000, help="Follower count above which creators are pulled")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"\n🕸️  Building skewed follower graph ({args.users} users, ~{args.avg_follows} follows each)...")
+    following, followers = build_graph(args.users, args.avg_follows, args.skew, args.seed)
+    counts = sorted((len(f) for f in followers.values()), reverse=True)
+    celebrities = sum(1 for c in counts if c >= args.threshold)
+    print(f"   Top creator followers: {counts[:5]}")
+    print(f"   Creators above threshold ({args.threshold}): {celebrities}")
+
+    rng = random.Random(args.seed)
+    # Popular creators upload more often, as in production
+    creators = list(followers.keys())
+    upload_weights = [len(followers[c]) ** 0.5 for c in creators]
+    uploads = [
+        (f"v{i}", creator, float(i))
+        for i, creator in enumerate(rng.choices(creators, weights=upload_weights, k=args.uploads))
+    ]
+    readers = rng.choices(range(args.users), k=args.reads)
+
+    print(f"\n{'strategy':<8} {'writes':>10} {'write s':>9} {'streams/read':>13} {'read p50 µs':>12} {'read p99 µs':>12}")
+    print("─" * 68)
+    for name in ("push", "pull", "hybrid"):
+        r = run_strategy(name, following, followers, uploads, readers, args.threshold)
+        print(f"{r['strategy']:<8} {r['timeline_writes']:>10} {r['write_time']:>9.2f} "
+              f"{r['streams_per_read']:>13.1f} {r['read_p50_us']:>12.1f} {r['read_p99_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
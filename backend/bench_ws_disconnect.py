@@ -0,0 +1,101 @@
+"""
+WebSocket disconnect cleanup benchmark: full room scan vs reverse indexes
+Run: python bench_ws_disconnect.py [--rooms 50000] [--churn 20000]
+
+Fills the ConnectionManager with video rooms and chat rooms, then disconnects
+and reconnects a batch of users (as after a deploy) and measures the cost of
+membership cleanup per disconnect:
+- scan:    the old approach, discarding the user from every room and video
+- indexed: user->rooms / user->videos reverse indexes (current disconnect)
+"""
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import time
+
+from app.websocket_manager import ConnectionManager
+
+
+class StubConnection:
+    """Stands in for a ClientConnection; cleanup only needs detach()"""
+
+    def detach(self):
+        pass
+
+
+def legacy_disconnect(manager: ConnectionManager, user_id: str, connection_id: str):
+    """Pre-index disconnect: O(total rooms + total videos)"""
+    connections = manager.active_connections.get(user_id)
+    if connections is not None:
+        connections.pop(connection_id, None)
+        if not connections:
+            del manager.active_connections[user_id]
+            for room_users in manager.rooms.values():
+                room_users.discard(user_id)
+            for viewers in manager.video_viewers.values():
+                viewers.discard(user_id)
+
+
+def populate(manager: ConnectionManager, rooms: int, users: int, per_user: int, rng: random.Random):
+    """Connect users and spread their memberships over `rooms` video rooms and rooms/10 chat rooms"""
+    chat_rooms = max(1, rooms // 10)
+    for u in range(users):
+        user_id = f"u{u}"
+        manager.active_connections[user_id] = {"c": StubConnection()}
+        for video in rng.sample(range(rooms), per_user):
+            video_id = f"video:{video}"
+            manager.video_viewers.setdefault(video_id, set()).add(user_id)
+            manager.user_videos.setdefault(user_id, set()).add(video_id)
+        room = f"room:{rng.randrange(chat_rooms)}"
+        manager.rooms.setdefault(room, set()).add(user_id)
+        manager.user_rooms.setdefault(user_id, set()).add(room)
+
+
+def run(mode: str, rooms: int, users: int, churn: int, per_user: int, seed: int):
+    manager = ConnectionManager()
+    populate(manager, rooms, users, per_user, random.Random(seed))
+    churned = [f"u{u}" for u in random.Random(seed + 1).sample(range(users), churn)]
+    disconnect = manager.disconnect if mode == "indexed" else (
+        lambda user_id, connection_id: legacy_disconnect(manager, user_id, connection_id)
+    )
+
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id in churned:
+            start = time.perf_counter()
+            disconnect(user_id, "c")
+            timings.append((time.perf_counter() - start) * 1e6)
+
+    timings.sort()
+    leaked = sum(1 for members in manager.video_viewers.values() if not members)
+    return {
+        "mode": mode,
+        "total_s": sum(timings) / 1e6,
+        "p50_us": statistics.median(timings),
+        "p99_us": timings[int(len(timings) * 0.99) - 1],
+        "empty_sets": leaked
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=50000, help="Video rooms (chat rooms = rooms/10)")
+    parser.add_argument("--users", type=int, default=30000)
+    parser.add_argument("--churn", type=int, default=20000, help="Users disconnected in the burst")
+    parser.add_argument("--per-user", type=int, default=3, help="Videos each user is watching")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"\n🔌 Disconnecting {args.churn} of {args.users} users across {args.rooms} video rooms "
+          f"+ {max(1, args.rooms // 10)} chat rooms")
+    print(f"\n{'mode':<8} {'total s':>9} {'p50 µs':>9} {'p99 µs':>9} {'empty sets left':>16}")
+    print("─" * 55)
+    for mode in ("scan", "indexed"):
+        r = run(mode, args.rooms, args.users, args.churn, args.per_user, args.seed)
+        print(f"{r['mode']:<8} {r['total_s']:>9.2f} {r['p50_us']:>9.1f} {r['p99_us']:>9.1f} {r['empty_sets']:>16}")
+
+
+if __name__ == "__main__":
+    main()
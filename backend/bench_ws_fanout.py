@@ -0,0 +1,122 @@
+"""
+WebSocket fan-out microbenchmark: per-recipient encoding vs serialize-once frames
+Run: python bench_ws_fanout.py [--sockets 10000] [--messages 20]
+
+Registers N mock sockets in one live session and broadcasts chat messages:
+- per-recipient: every viewer's message is encoded separately (old send_json path)
+- shared frame:  broadcast_to_session encodes once and queues the same frame
+Reports sender-side enqueue time, time until every socket has written the
+message, and JSON encodes per broadcast.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app import ws_connection
+from app.websocket_manager import ConnectionManager, LiveParticipant, LiveStreamManager
+from app.ws_connection import ClientConnection, Frame
+
+
+class MockWebSocket:
+    """Accepts frames instantly and counts bytes written"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.frames += 1
+        self.bytes += len(text)
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def chat_message(i: int) -> dict:
+    return {
+        "type": "chat_message",
+        "user_id": "3f2b7c4e-0d51-4a8e-9c61-2f8d1b0e7a93",
+        "username": "mugo_emm",
+        "message": f"Message number {i} to everyone watching 🔥🔥",
+        "timestamp": "2024-06-01T12:00:00.000000"
+    }
+
+
+def populate(live: LiveStreamManager, session_id: str, sockets):
+    """Register viewers directly (joining one by one would broadcast N² user_joined frames)"""
+    participants = live.manager.live_sessions.setdefault(session_id, {})
+    for i, socket in enumerate(sockets):
+        participants[f"u{i}"] = LiveParticipant(ClientConnection(socket, f"u{i}", session_id), "viewer", f"user{i}")
+        live._index_role(session_id, f"u{i}", "viewer")
+    return participants
+
+
+async def run(mode: str, n_sockets: int, n_messages: int):
+    live = LiveStreamManager(ConnectionManager())
+    sockets = [MockWebSocket() for _ in range(n_sockets)]
+    participants = populate(live, "bench", sockets)
+    await asyncio.sleep(0)  # Start writer tasks
+
+    encodes = 0
+    real_encode = ws_connection.encode_json
+
+    def counting_encode(message):
+        nonlocal encodes
+        encodes += 1
+        return real_encode(message)
+
+    ws_connection.encode_json = counting_encode
+    enqueue_times, delivery_times = [], []
+    try:
+        for i in range(n_messages):
+            message = chat_message(i)
+            start = time.perf_counter()
+            if mode == "per-recipient":
+                for info in participants.values():
+                    info.connection.send(Frame(dict(message)))
+            else:
+                await live.broadcast_to_session("bench", message)
+            enqueued = time.perf_counter()
+            while any(s.frames <= i for s in sockets):
+                await asyncio.sleep(0)
+            done = time.perf_counter()
+            enqueue_times.append((enqueued - start) * 1000)
+            delivery_times.append((done - start) * 1000)
+    finally:
+        ws_connection.encode_json = real_encode
+
+    for info in participants.values():
+        info.connection.detach()
+
+    return {
+        "mode": mode,
+        "enqueue_ms": statistics.median(enqueue_times),
+        "delivery_ms": statistics.median(delivery_times),
+        "encodes": encodes / n_messages
+    }
+
+
+async def main_async(args):
+    print(f"\n📡 Broadcasting {args.messages} chat messages to {args.sockets} mock sockets "
+          f"(orjson: {ws_connection.HAS_ORJSON})")
+    print(f"\n{'mode':<14} {'enqueue p50 ms':>15} {'delivered p50 ms':>17} {'encodes/msg':>12}")
+    print("─" * 61)
+    for mode in ("per-recipient", "shared-frame"):
+        r = await run(mode, args.sockets, args.messages)
+        print(f"{r['mode']:<14} {r['enqueue_ms']:>15.2f} {r['delivery_ms']:>17.2f} {r['encodes']:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
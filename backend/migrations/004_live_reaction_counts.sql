@@ -0,0 +1,49 @@
+-- Live Reaction Aggregates Migration
+-- Run this SQL in your Supabase SQL Editor
+-- Reactions are stored as per-minute totals per session and type instead of
+-- one live_reactions row per tap. The backend buffers counts in memory and
+-- upserts them in bulk through add_live_reaction_counts.
+
+-- Per-minute reaction totals
+CREATE TABLE IF NOT EXISTS live_reaction_counts (
+  session_id UUID NOT NULL REFERENCES live_sessions(id) ON DELETE CASCADE,
+  minute TIMESTAMP NOT NULL,
+  reaction_type VARCHAR(50) NOT NULL,
+  count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (session_id, minute, reaction_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_live_reaction_counts_minute ON live_reaction_counts(minute DESC);
+
+-- Add a batch of counts: [{"session_id", "minute", "reaction_type", "count"}, ...]
+-- Several workers may write the same minute, so counts are added, not replaced.
+CREATE OR REPLACE FUNCTION add_live_reaction_counts(counts JSONB)
+RETURNS void AS $$
+BEGIN
+  INSERT INTO live_reaction_counts (session_id, minute, reaction_type, count)
+  SELECT
+    (c->>'session_id')::UUID,
+    (c->>'minute')::TIMESTAMP,
+    c->>'reaction_type',
+    (c->>'count')::INTEGER
+  FROM jsonb_array_elements(counts) AS c
+  ON CONFLICT (session_id, minute, reaction_type)
+  DO UPDATE SET count = live_reaction_counts.count + EXCLUDED.count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Enable RLS (backend writes with the service role key)
+ALTER TABLE live_reaction_counts ENABLE ROW LEVEL SECURITY;
+
+-- Allow everyone to read reaction totals
+CREATE POLICY "Everyone can read reaction counts" ON live_reaction_counts
+FOR SELECT USING (true);
+
+-- Total reactions per session (replaces COUNT(*) over live_reactions)
+CREATE OR REPLACE VIEW live_session_reaction_totals AS
+SELECT session_id, reaction_type, SUM(count) AS total
+FROM live_reaction_counts
+GROUP BY session_id, reaction_type;
+
+-- Test the setup (optional)
+SELECT 'Live reaction counts migration completed successfully!' AS status;
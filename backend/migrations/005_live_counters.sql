@@ -0,0 +1,21 @@
+-- Live Viewer Counters Migration
+-- Run this SQL in your Supabase SQL Editor
+-- viewer_count, guest_count and peak_viewers on live_sessions are now kept by
+-- the backend (Redis counters driven by WebSocket joins/leaves) and written
+-- every few seconds and when a session ends. The triggers that maintained
+-- them per row change are no longer needed.
+
+-- Peak is tracked atomically with each join in Redis
+DROP TRIGGER IF EXISTS live_sessions_peak_viewers_trigger ON live_sessions;
+DROP FUNCTION IF EXISTS update_peak_viewers();
+
+-- Guests/cohosts are counted from the WebSocket session roles
+DROP TRIGGER IF EXISTS live_participants_guest_count_trigger ON live_participants;
+DROP FUNCTION IF EXISTS update_guest_count();
+
+-- Columns written by the counter flush
+ALTER TABLE live_sessions ADD COLUMN IF NOT EXISTS guest_count INTEGER DEFAULT 0;
+ALTER TABLE live_sessions ADD COLUMN IF NOT EXISTS peak_viewers INTEGER DEFAULT 0;
+
+-- Test the setup (optional)
+SELECT 'Live counters migration completed successfully!' AS status;
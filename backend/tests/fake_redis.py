@@ -0,0 +1,239 @@
+"""
+In-memory stand-in for the redis.asyncio client used by RedisCache
+Covers the string, hash, sorted set, set, list and bitmap commands the app uses, with
+decode_responses=True semantics. TTLs are recorded but never enforced (tests
+expire keys by deleting them). Lua scripts are not interpreted: tests register
+a Python implementation for each script source they exercise.
+"""
+from typing import Callable, Dict
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        command = getattr(self.redis, "_" + name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data: Dict[str, object] = {}
+        self.ttls: Dict[str, float] = {}
+        self.scripts: Dict[str, Callable] = {}  # script source -> fn(keys, args)
+        self.calls = []  # Command names, in order
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        command = getattr(self, "_" + name)
+
+        async def call(*args, **kwargs):
+            return command(*args, **kwargs)
+        return call
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    def register_script(self, source: str, fn: Callable):
+        self.scripts[source] = fn
+
+    # === Keys ===
+
+    def _ping(self):
+        self.calls.append("ping")
+        return True
+
+    def _exists(self, *keys):
+        self.calls.append("exists")
+        return sum(1 for key in keys if key in self.data)
+
+    def _delete(self, *keys):
+        self.calls.append("delete")
+        removed = 0
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                removed += 1
+            self.ttls.pop(key, None)
+        return removed
+
+    def _expire(self, key, seconds):
+        self.calls.append("expire")
+        if key not in self.data:
+            return False
+        self.ttls[key] = seconds
+        return True
+
+    def _pexpire(self, key, ms):
+        return self._expire(key, ms / 1000)
+
+    # === Strings ===
+
+    def _get(self, key):
+        self.calls.append("get")
+        return self.data.get(key)
+
+    def _set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        self.calls.append("set")
+        if (nx and key in self.data) or (xx and key not in self.data):
+            return None
+        self.data[key] = str(value)
+        if ex is not None or px is not None:
+            self.ttls[key] = ex if ex is not None else px / 1000
+        return True
+
+    # === Hashes ===
+
+    def _hset(self, key, field, value):
+        self.calls.append("hset")
+        fields = self.data.setdefault(key, {})
+        added = int(field not in fields)
+        fields[field] = str(value)
+        return added
+
+    def _hget(self, key, field):
+        self.calls.append("hget")
+        return self.data.get(key, {}).get(field)
+
+    def _hgetall(self, key):
+        self.calls.append("hgetall")
+        return dict(self.data.get(key, {}))
+
+    def _hincrby(self, key, field, amount=1):
+        self.calls.append("hincrby")
+        fields = self.data.setdefault(key, {})
+        fields[field] = str(int(fields.get(field, 0)) + int(amount))
+        return int(fields[field])
+
+    # === Sorted sets ===
+
+    def _zset(self, key) -> Dict[str, float]:
+        return self.data.setdefault(key, {})
+
+    def _sorted(self, key, reverse: bool):
+        members = self.data.get(key, {})
+        return sorted(members.items(), key=lambda item: (item[1], item[0]), reverse=reverse)
+
+    @staticmethod
+    def _slice(items, start, stop):
+        stop = len(items) + stop if stop < 0 else stop
+        start = max(0, len(items) + start if start < 0 else start)
+        return items[start:stop + 1]
+
+    def _zadd(self, key, mapping):
+        self.calls.append("zadd")
+        zset = self._zset(key)
+        added = sum(1 for member in mapping if member not in zset)
+        zset.update({member: float(score) for member, score in mapping.items()})
+        return added
+
+    def _zrange(self, key, start, stop, withscores=False):
+        self.calls.append("zrange")
+        items = self._slice(self._sorted(key, reverse=False), start, stop)
+        return items if withscores else [member for member, _ in items]
+
+    def _zrevrange(self, key, start, stop, withscores=False):
+        self.calls.append("zrevrange")
+        items = self._slice(self._sorted(key, reverse=True), start, stop)
+        return items if withscores else [member for member, _ in items]
+
+    def _zremrangebyrank(self, key, start, stop):
+        self.calls.append("zremrangebyrank")
+        doomed = self._slice(self._sorted(key, reverse=False), start, stop)
+        for member, _ in doomed:
+            del self.data[key][member]
+        if key in self.data and not self.data[key]:
+            del self.data[key]
+        return len(doomed)
+
+    def _zrem(self, key, *members):
+        self.calls.append("zrem")
+        zset = self.data.get(key, {})
+        removed = sum(1 for member in members if zset.pop(member, None) is not None)
+        if key in self.data and not zset:
+            del self.data[key]
+        return removed
+
+    def _zcard(self, key):
+        self.calls.append("zcard")
+        return len(self.data.get(key, {}))
+
+    # === Sets ===
+
+    def _sadd(self, key, *members):
+        self.calls.append("sadd")
+        current = self.data.setdefault(key, set())
+        added = len(set(members) - current)
+        current.update(members)
+        return added
+
+    def _srem(self, key, *members):
+        self.calls.append("srem")
+        current = self.data.get(key, set())
+        removed = len(current & set(members))
+        current.difference_update(members)
+        if key in self.data and not current:
+            del self.data[key]
+        return removed
+
+    def _smembers(self, key):
+        self.calls.append("smembers")
+        return set(self.data.get(key, set()))
+
+    # === Bitmaps (stored as a set of set bit offsets) ===
+
+    def _setbit(self, key, offset, value):
+        self.calls.append("setbit")
+        bits = self.data.setdefault(key, set())
+        old = int(offset in bits)
+        if value:
+            bits.add(offset)
+        else:
+            bits.discard(offset)
+        return old
+
+    def _getbit(self, key, offset):
+        self.calls.append("getbit")
+        return int(offset in self.data.get(key, set()))
+
+    def _bitfield_ro(self, key, encoding, offset, items=None):
+        self.calls.append("bitfield_ro")
+        fields = [(encoding, offset)] + list(items or [])
+        assert all(encoding == "u1" for encoding, _ in fields), "only u1 fields are supported"
+        bits = self.data.get(key, set())
+        return [int(offset in bits) for _, offset in fields]
+
+    # === Lists ===
+
+    def _rpush(self, key, *values):
+        self.calls.append("rpush")
+        items = self.data.setdefault(key, [])
+        items.extend(values)
+        return len(items)
+
+    def _lrange(self, key, start, stop):
+        self.calls.append("lrange")
+        return self._slice(self.data.get(key, []), start, stop)
+
+    # === Scripts / pub-sub ===
+
+    def _eval(self, script, numkeys, *keys_and_args):
+        self.calls.append("eval")
+        keys, args = list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:])
+        return self.scripts[script](keys, args)
+
+    def _publish(self, channel, message):
+        self.calls.append("publish")
+        return 0
@@ -0,0 +1,26 @@
+"""
+Stand-in for a Starlette WebSocket on the server side
+Records every JSON frame sent to it (decoded) and whether it was closed. A
+blocked socket holds every send until its gate is set, like a stalled client.
+"""
+import asyncio
+import json
+
+
+class FakeWebSocket:
+    def __init__(self, blocked: bool = False):
+        self.sent = []
+        self.closed = False
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await self.gate.wait()
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=""):
+        self.closed = True
@@ -0,0 +1,49 @@
+"""
+Tests for the in-memory public feed snapshot
+"""
+import json
+
+from app import feed_snapshot as fs
+
+
+def _rows(n):
+    return [
+        {
+            "id": f"v{i}",
+            "user_id": "u1",
+            "title": f"Video {i}",
+            "video_url": f"https://cdn.example.com/{i}.mp4",
+            "created_at": "2024-01-01T00:00:00",
+            "users": {"username": "creator", "avatar_url": None}
+        }
+        for i in range(n)
+    ]
+
+
+def test_snapshot_serves_pre_encoded_pages():
+    """Standard pages are served as JSON bytes in feed order"""
+    snap = fs.FeedSnapshot()
+    snap.snapshot = fs.build_snapshot(_rows(5), page_size=2)
+
+    page = json.loads(snap.get(2, 2))
+    assert [v["id"] for v in page] == ["v2", "v3"]
+    assert page[0]["username"] == "creator"
+
+
+def test_snapshot_joins_other_page_sizes():
+    """Non-standard windows inside the snapshot are joined from encoded videos"""
+    snap = fs.FeedSnapshot()
+    snap.snapshot = fs.build_snapshot(_rows(5), page_size=2)
+
+    assert [v["id"] for v in json.loads(snap.get(3, 1))] == ["v1", "v2", "v3"]
+    assert snap.get(10, 0) is None  # Not fully covered by the snapshot
+
+
+def test_stale_snapshot_is_not_served(monkeypatch):
+    """Requests fall through to the normal path once max staleness is exceeded"""
+    snap = fs.FeedSnapshot()
+    snap.snapshot = fs.build_snapshot(_rows(2), page_size=2)
+    assert snap.get(2, 0) is not None
+
+    monkeypatch.setattr(fs, "SNAPSHOT_MAX_STALENESS", -1)
+    assert snap.get(2, 0) is None
@@ -0,0 +1,300 @@
+"""
+Tests for live viewer/guest counters (local fallback and a fake Redis)
+"""
+import asyncio
+
+import pytest
+
+from app import live_counters as counters_module
+from app.live_counters import LiveCounters, SessionFull
+from app.redis_cache import RedisCache, cache
+from app.websocket_manager import ConnectionManager, LiveStreamManager
+from tests.fake_redis import FakeRedis
+from tests.fake_websocket import FakeWebSocket
+
+
+class FakeSessionsTable:
+    """Stands in for supabase.table("live_sessions").update(...).eq("id", ...)"""
+
+    def __init__(self):
+        self.updates = []
+
+    def table(self, name):
+        assert name == "live_sessions"
+        return self
+
+    def update(self, values):
+        self.values = values
+        return self
+
+    def eq(self, column, value):
+        self.updates.append((value, self.values))
+        return self
+
+    def execute(self):
+        pass
+
+
+def test_joins_are_capped_and_counts_follow_the_session(monkeypatch):
+    """Capacity is enforced on join; leaves and promotions adjust counts; peak is kept"""
+    counters = LiveCounters()
+    database = FakeSessionsTable()
+    monkeypatch.setattr(counters_module, "HAS_REDIS_CACHE", False)
+    monkeypatch.setattr(counters_module, "supabase", database)
+    monkeypatch.setattr("app.websocket_manager.live_counters", counters)
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        await counters.set_capacity("s1", 3)
+        await live.join_live_session(FakeWebSocket(), "s1", "host", "host", role="host")
+        await live.join_live_session(FakeWebSocket(), "s1", "a", "alice")
+        await live.join_live_session(FakeWebSocket(), "s1", "b", "bob")
+        with pytest.raises(SessionFull):
+            await live.join_live_session(FakeWebSocket(), "s1", "c", "carol")
+        assert "c" not in live.manager.live_sessions["s1"]
+
+        await live.join_live_session(FakeWebSocket(), "s1", "a", "alice")  # Reconnect: not a new join
+        await live.handle_participant_action("s1", "a", "promote", "host", new_role="cohost")
+        live.leave_live_session("s1", "b")
+        assert await counters.get("s1") == {"viewers": 2, "guests": 1, "peak": 3, "capacity": 3}
+        with pytest.raises(SessionFull):
+            await counters.check_capacity("s1", 2)
+
+        await counters.flush()
+        await live.handle_session_ended("s1")
+        assert database.updates[-1] == ("s1", {"viewer_count": 0, "guest_count": 0, "peak_viewers": 3})
+        assert "s1" not in counters.local
+
+    asyncio.run(scenario())
+
+
+def test_join_reserves_its_slot_before_queueing_on_the_actor(monkeypatch):
+    """A slow counter round-trip doesn't hold up the session's other commands; failed joins give the slot back"""
+    counters = LiveCounters()
+    monkeypatch.setattr(counters_module, "HAS_REDIS_CACHE", False)
+    monkeypatch.setattr("app.websocket_manager.live_counters", counters)
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        await live.join_live_session(FakeWebSocket(), "s1", "host", "host", role="host")
+
+        gate = asyncio.Event()
+        real_try_join = counters.try_join
+
+        async def slow_try_join(session_id, guest=False):
+            await gate.wait()
+            return await real_try_join(session_id, guest)
+        monkeypatch.setattr(counters, "try_join", slow_try_join)
+
+        joining = asyncio.create_task(live.join_live_session(FakeWebSocket(), "s1", "a", "alice"))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(live.set_slow_mode("s1", 5, "host"), 0.1)  # Not queued behind the join
+        assert live.slow_mode["s1"] == 5
+
+        gate.set()
+        assert await joining == 2
+        assert (await counters.get("s1"))["viewers"] == 2
+
+        async def failing_join(*args):
+            raise RuntimeError("join failed")
+        monkeypatch.setattr(live, "_join_live_session", failing_join)
+        with pytest.raises(RuntimeError):
+            await live.join_live_session(FakeWebSocket(), "s1", "b", "bob")
+        assert (await counters.get("s1"))["viewers"] == 2
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+
+    def reconcile(keys, prefix):
+        viewers = guests = 0
+        for node in list(redis.data.get(keys[2], set())):
+            counts = redis.data.get(prefix + node)
+            if counts:
+                viewers += int(counts.get("viewers", 0))
+                guests += int(counts.get("guests", 0))
+            else:
+                redis._srem(keys[2], node)
+        current = redis.data.get(keys[0], {})
+        stale = int(current.get("viewers", 0)) - viewers
+        if stale > 0 or int(current.get("guests", 0)) > guests:
+            redis._hset(keys[0], "viewers", viewers)
+            redis._hset(keys[0], "guests", guests)
+        return max(stale, 0)
+
+    def join(keys, args):
+        if keys[3] in redis.data:
+            return -2
+        counts = redis.data.get(keys[0], {})
+        capacity, viewers = int(counts.get("capacity", 0)), int(counts.get("viewers", 0))
+        if capacity and viewers >= capacity:
+            viewers -= reconcile(keys, args[3])
+            if viewers >= capacity:
+                return -1
+        viewers = redis._hincrby(keys[0], "viewers", 1)
+        redis._hincrby(keys[1], "viewers", 1)
+        if args[0] == "1":
+            redis._hincrby(keys[0], "guests", 1)
+            redis._hincrby(keys[1], "guests", 1)
+        if viewers > int(redis.data[keys[0]].get("peak", 0)):
+            redis._hset(keys[0], "peak", viewers)
+        redis._sadd(keys[2], args[4])
+        return viewers
+
+    def adjust(keys, args):
+        if keys[3] in redis.data:
+            return -2
+        n = redis._hincrby(keys[0], args[0], args[1])
+        if n < 0:
+            redis._hset(keys[0], args[0], 0)
+            n = 0
+        if redis._hincrby(keys[1], args[0], args[1]) < 0:
+            redis._hset(keys[1], args[0], 0)
+        redis._sadd(keys[2], args[4])
+        return n
+
+    def refresh(keys, args):
+        if keys[3] in redis.data:
+            return 0
+        redis._expire(keys[1], args[0])
+        return reconcile(keys, args[1])
+
+    redis.register_script(RedisCache._LIVE_JOIN_SCRIPT, join)
+    redis.register_script(RedisCache._LIVE_ADJUST_SCRIPT, adjust)
+    redis.register_script(RedisCache._LIVE_RECONCILE_SCRIPT, refresh)
+    monkeypatch.setattr(cache, "redis", redis)
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(counters_module, "HAS_REDIS_CACHE", True)
+    return redis
+
+
+def test_rest_capacity_check_only_reads(redis):
+    """Capacity is written when the session starts, not on every REST join"""
+    async def scenario():
+        counters = LiveCounters()
+        await counters.set_capacity("s1", 2)
+        await counters.try_join("s1")
+        redis.calls.clear()
+        for _ in range(3):
+            assert await counters.check_capacity("s1", 2) == 1
+        assert "hset" not in redis.calls
+
+        await counters.check_capacity("old", 5)  # Started before capacity was recorded: written once
+        await counters.check_capacity("old", 5)
+        assert redis.calls.count("hset") == 1
+
+    asyncio.run(scenario())
+
+
+def test_changes_are_never_dropped_and_end_session_drains_with_the_worker(redis, monkeypatch):
+    """A full queue applies changes directly; the final write sees every leave"""
+    database = FakeSessionsTable()
+    monkeypatch.setattr(counters_module, "supabase", database)
+
+    async def scenario():
+        counters = LiveCounters()
+        counters.events = asyncio.Queue(maxsize=1)
+        for _ in range(4):
+            await counters.try_join("s1")
+        for _ in range(3):
+            counters.leave("s1")
+        assert counters.stats["overflowed"] == 2
+        await asyncio.gather(*counters.overflow)
+        assert (await counters.get("s1"))["viewers"] == 2  # The queued leave is still pending
+
+        counters.start()
+        counters.leave("s1")
+        await counters.end_session("s1")
+        assert database.updates[-1] == ("s1", {"viewer_count": 0, "guest_count": 0, "peak_viewers": 4})
+        assert "live:counts:s1" not in redis.data and "live:ended:s1" in redis.data
+
+        await counters.stop()
+        assert "live:counts:s1" not in redis.data  # Nothing applied after the end
+
+    asyncio.run(scenario())
+
+
+def test_late_leaves_after_the_end_keep_the_final_counts(redis, monkeypatch):
+    """Leaves and flushes for an ended session (here or on another node) don't recreate its counters"""
+    database = FakeSessionsTable()
+    monkeypatch.setattr(counters_module, "supabase", database)
+
+    async def scenario():
+        node_a, node_b = LiveCounters(), LiveCounters()
+        for _ in range(3):
+            await node_a.try_join("s1")
+        await node_b.try_join("s1", guest=True)
+
+        await node_a.end_session("s1")
+        assert database.updates[-1] == ("s1", {"viewer_count": 4, "guest_count": 1, "peak_viewers": 4})
+
+        node_a.leave("s1")  # Tombstoned here: not even queued
+        node_b.leave("s1", guest=True)
+        await node_b._apply_pending()
+        await node_b.flush()
+        assert "live:counts:s1" not in redis.data
+        assert len(database.updates) == 1
+        assert await node_b.try_join("s1") == 0
+
+    asyncio.run(scenario())
+
+
+def test_viewers_of_a_crashed_node_are_reconciled_away(redis, monkeypatch):
+    """A node that stops refreshing its share no longer holds seats; a full session recounts before refusing"""
+    monkeypatch.setattr(counters_module, "supabase", FakeSessionsTable())
+
+    async def scenario():
+        crashed, survivor = LiveCounters(), LiveCounters()
+        await survivor.set_capacity("s1", 3)
+        await crashed.try_join("s1")
+        await crashed.try_join("s1", guest=True)
+        await survivor.try_join("s1")
+
+        del redis.data[f"live:counts:s1:node:{crashed.node_id}"]  # Expired: the node stopped refreshing it
+        assert await survivor.try_join("s1") == 2
+        assert (await survivor.get("s1"))["guests"] == 0
+        assert redis.data["live:counts:s1:nodes"] == {survivor.node_id}
+
+        await crashed.try_join("s2")
+        await survivor.try_join("s2")
+        del redis.data[f"live:counts:s2:node:{crashed.node_id}"]
+        await survivor.reconcile()
+        assert (await survivor.get("s2"))["viewers"] == 1
+        assert survivor.stats["reconciled"] == 1
+        assert "s2" in survivor.dirty
+
+    asyncio.run(scenario())
+
+
+def test_ending_on_one_node_disconnects_participants_everywhere(monkeypatch):
+    """The end notice makes other nodes' participants leave; the ended session's counts are written once"""
+    from app.ws_broker import InMemoryBroker
+    counters = LiveCounters()
+    database = FakeSessionsTable()
+    monkeypatch.setattr(counters_module, "HAS_REDIS_CACHE", False)
+    monkeypatch.setattr(counters_module, "supabase", database)
+    monkeypatch.setattr("app.websocket_manager.live_counters", counters)
+
+    async def scenario():
+        hub = {}
+        nodes = []
+        for _ in range(2):
+            manager = ConnectionManager(InMemoryBroker(hub))
+            await manager.start_broker()
+            nodes.append(LiveStreamManager(manager))
+        live_a, live_b = nodes
+        viewer = FakeWebSocket()
+        await live_b.join_live_session(viewer, "s1", "v", "viewer")
+
+        await live_a.handle_session_ended("s1")  # No participants on this node
+        await asyncio.sleep(0.01)
+
+        assert viewer.sent[-1]["type"] == "session_ended"
+        assert "s1" not in live_b.manager.live_sessions
+        assert database.updates == [("s1", {"viewer_count": 1, "guest_count": 0, "peak_viewers": 1})]
+        assert await counters.get("s1") == {"viewers": 0, "guests": 0, "peak": 0, "capacity": 0}
+
+    asyncio.run(scenario())
@@ -0,0 +1,48 @@
+"""
+Tests for the presence service (local fallback, no Redis)
+"""
+import asyncio
+
+from app import presence
+from app.presence import PresenceService, presence_room, current_bucket, PRESENCE_BUCKET_SECONDS
+from app.websocket_manager import ConnectionManager
+from tests.fake_websocket import FakeWebSocket
+
+
+def test_buckets_follow_the_heartbeat_window():
+    assert current_bucket(0) == current_bucket(PRESENCE_BUCKET_SECONDS - 1)
+    assert current_bucket(PRESENCE_BUCKET_SECONDS) == current_bucket(0) + 1
+
+
+def test_watchers_hear_only_first_connect_and_last_disconnect(monkeypatch):
+    """Two tabs for one user: one online and one offline event; heartbeats are throttled"""
+    async def scenario():
+        manager = ConnectionManager()
+        await manager.start_broker()
+        monkeypatch.setattr(presence, "ws_manager", manager)
+        monkeypatch.setattr(presence, "HAS_REDIS_CACHE", False)
+        service = PresenceService()
+
+        watcher = FakeWebSocket()
+        await manager.connect(watcher, "fan")
+        manager.join_room("fan", presence_room("creator"))
+
+        service.user_connected("creator")
+        service.user_connected("creator")
+        for event in [service.events.get_nowait() for _ in range(2)]:
+            await service._apply(*event)
+        assert await service.is_online(["creator", "nobody"]) == {"creator": True, "nobody": False}
+
+        service.heartbeat("creator")  # Same bucket as the connect: nothing to write
+        assert not service.pending_heartbeats
+
+        for _ in range(2):
+            service.user_disconnected("creator")
+            await service._apply(*service.events.get_nowait())
+        await asyncio.sleep(0.01)
+
+        updates = [m for m in watcher.sent if m["type"] == "presence"]
+        assert [m["online"] for m in updates] == [True, False]
+        assert await service.is_online(["creator"]) == {"creator": False}
+
+    asyncio.run(scenario())
@@ -0,0 +1,137 @@
+"""
+Tests for "For You" feed ranking stages
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from app import ranking
+from app.ranking import (
+    FeedRanker, bloom_positions, diversify, score_candidates, SEEN_FILTER_BITS, SEEN_FILTER_HASHES
+)
+from app.redis_cache import cache
+from tests.fake_redis import FakeRedis
+
+
+def _video(video_id, user_id, hours_old=1, likes=0, sources=("fresh",)):
+    created = datetime.now(timezone.utc) - timedelta(hours=hours_old)
+    return {
+        "id": video_id,
+        "user_id": user_id,
+        "created_at": created.isoformat(),
+        "likes_count": likes,
+        "_sources": set(sources)
+    }
+
+
+def test_bloom_positions_are_stable_and_in_range():
+    """Same id always maps to the same bits, all inside the filter"""
+    bits = bloom_positions("video-123")
+    assert bits == bloom_positions("video-123")
+    assert len(bits) == SEEN_FILTER_HASHES
+    assert all(0 <= b < SEEN_FILTER_BITS for b in bits)
+    assert bits != bloom_positions("video-124")
+
+
+def test_score_prefers_engagement_recency_and_follows():
+    """More likes, newer uploads and followed creators score higher"""
+    now = time.time()
+    popular, quiet = score_candidates([_video("a", "u1", likes=100), _video("b", "u2", likes=0)], now)
+    assert popular > quiet
+
+    fresh, stale = score_candidates([_video("a", "u1", hours_old=1), _video("b", "u2", hours_old=72)], now)
+    assert fresh > stale
+
+    followed, other = score_candidates([
+        _video("a", "u1", sources=("following",)),
+        _video("b", "u2", sources=("fresh",))
+    ], now)
+    assert followed > other
+
+
+def test_diversify_spreads_creators():
+    """A creator with the top scores doesn't take over the whole page"""
+    candidates = [_video(f"a{i}", "prolific") for i in range(5)] + [_video("b", "other")]
+    scores = [10.0, 9.5, 9.0, 8.5, 8.0, 6.0]
+    page = diversify(candidates, scores, 3)
+    assert [v["id"] for v in page] == ["a0", "b", "a1"]
+
+
+def test_diversify_respects_limit():
+    """Never returns more than the page size"""
+    candidates = [_video(str(i), f"u{i}") for i in range(10)]
+    assert len(diversify(candidates, [float(i) for i in range(10)], 4)) == 4
+
+
+def test_ranked_feed_pages_are_stable_slices_of_one_list(monkeypatch):
+    """Offsets slice the cached list (same page twice); served videos skip the next list"""
+    redis = FakeRedis()
+    monkeypatch.setattr(cache, "redis", redis)
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(ranking, "RANKED_FEED_SIZE", 6)
+
+    candidates = [_video(f"v{i}", f"u{i}", hours_old=i) for i in range(10)]
+    runs = []
+
+    async def generate_candidates(self, user_id):
+        runs.append(user_id)
+        return [dict(c, _sources=set(c["_sources"])) for c in candidates]
+
+    monkeypatch.setattr(FeedRanker, "generate_candidates", generate_candidates)
+
+    async def scenario():
+        ranker = FeedRanker()
+        first = [v["id"] for v in await ranker.rank_feed("alice", 3, 0)]
+        second = [v["id"] for v in await ranker.rank_feed("alice", 3, 3)]
+        assert [v["id"] for v in await ranker.rank_feed("alice", 3, 0)] == first
+        assert len(set(first + second)) == 6
+        assert await ranker.rank_feed("alice", 3, 6) is None  # Past the list: canonical feed
+        assert runs == ["alice"]
+        assert redis.calls.count("getbit") == 0
+        assert redis.calls.count("bitfield_ro") == len(candidates)  # One read per candidate
+
+        # Next list (after the cached one expires) leaves out everything served
+        await cache.delete("ranked:alice")
+        fresh = [v["id"] for v in await ranker.rank_feed("alice", 10, 0)]
+        assert sorted(fresh) == sorted({c["id"] for c in candidates} - set(first + second))
+
+    asyncio.run(scenario())
+
+
+def test_over_budget_ranking_finishes_in_the_background(monkeypatch):
+    """A slow run falls back to the canonical feed once, then its cached list serves the next request"""
+    redis = FakeRedis()
+    monkeypatch.setattr(cache, "redis", redis)
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(ranking, "RANKING_BUDGET_MS", 10)
+
+    candidates = [_video(f"v{i}", f"u{i}", hours_old=i) for i in range(5)]
+    runs = []
+    release = None
+
+    async def generate_candidates(self, user_id):
+        runs.append(user_id)
+        await release.wait()
+        return [dict(c, _sources=set(c["_sources"])) for c in candidates]
+
+    monkeypatch.setattr(FeedRanker, "generate_candidates", generate_candidates)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        ranker = FeedRanker()
+        assert await ranker.rank_feed("alice", 3) is None
+        assert await ranker.rank_feed("alice", 3) is None  # Still running: not started again
+        assert runs == ["alice"]
+        assert ranker.stats["over_budget"] == 2
+
+        release.set()
+        await asyncio.gather(*ranker.runs.values())
+        assert not ranker.runs
+
+        page = await ranker.rank_feed("alice", 3)
+        assert [v["id"] for v in page] == ["v0", "v1", "v2"]
+        assert runs == ["alice"]
+        assert ranker.stats["ranked"] == 1
+
+    asyncio.run(scenario())
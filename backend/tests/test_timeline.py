@@ -0,0 +1,267 @@
+"""
+Tests for follower timelines (helpers, and TimelineService on a fake Redis)
+"""
+import asyncio
+
+import pytest
+
+from app import timeline
+from app.redis_cache import cache
+from app.timeline import TimelineService, merge_timelines, video_score
+from tests.fake_redis import FakeRedis
+
+
+def test_merge_timelines_orders_newest_first():
+    """Streams are merged by score, newest first"""
+    pushed = [("a", 10.0), ("c", 6.0), ("e", 2.0)]
+    celebrity = [("b", 8.0), ("d", 4.0)]
+    assert merge_timelines([pushed, celebrity], 10) == ["a", "b", "c", "d", "e"]
+
+
+def test_merge_timelines_respects_limit():
+    """Merge stops once the page is full"""
+    streams = [[("a", 3.0), ("b", 2.0)], [("c", 2.5), ("d", 1.0)]]
+    assert merge_timelines(streams, 2) == ["a", "c"]
+
+
+def test_merge_timelines_deduplicates():
+    """A video pushed before its creator crossed the threshold appears once"""
+    pushed = [("a", 5.0), ("b", 4.0)]
+    celebrity = [("a", 5.0), ("c", 3.0)]
+    assert merge_timelines([pushed, celebrity], 10) == ["a", "b", "c"]
+
+
+def test_merge_timelines_empty():
+    """No streams means an empty page"""
+    assert merge_timelines([], 20) == []
+
+
+def test_video_score_parses_iso_timestamps():
+    """Supabase timestamps (with or without offset) become comparable scores"""
+    assert video_score("2024-01-01T00:00:01+00:00") > video_score("2024-01-01T00:00:00+00:00")
+    assert video_score("2024-01-01T00:00:00Z") == video_score("2024-01-01T00:00:00+00:00")
+
+
+def at(minute: int) -> str:
+    return f"2024-01-01T00:{minute:02d}:00+00:00"
+
+
+class FakeGraph:
+    """Follows and videos behind TimelineService's database helpers"""
+
+    def __init__(self, follows, videos):
+        self.follows = follows  # [(follower_id, following_id)]
+        self.videos = videos  # [{"id", "user_id", "created_at"}]
+        self.pages = []  # `after` cursor of every follower page fetched
+
+    def followers_count(self, user_id):
+        return sum(1 for _, following_id in self.follows if following_id == user_id)
+
+    def follower_page(self, user_id, after, limit):
+        self.pages.append(after)
+        followers = sorted(
+            follower_id for follower_id, following_id in self.follows
+            if following_id == user_id and (after is None or follower_id > after)
+        )
+        return followers[:limit]
+
+    def following(self, user_id):
+        return [
+            (following_id, self.followers_count(following_id))
+            for follower_id, following_id in self.follows if follower_id == user_id
+        ]
+
+    def recent_uploads(self, user_ids, limit):
+        videos = [v for v in self.videos if v["user_id"] in user_ids]
+        return sorted(videos, key=lambda v: v["created_at"], reverse=True)[:limit]
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """Fake Redis behind the global cache and a small follow graph:
+    alice follows bob (3 followers) and star (4 followers, the celebrity threshold)"""
+    monkeypatch.setattr(cache, "redis", FakeRedis())
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(timeline, "CELEBRITY_FOLLOWER_THRESHOLD", 4)
+    monkeypatch.setattr(timeline, "FANOUT_BATCH_SIZE", 2)
+
+    graph = FakeGraph(
+        follows=[("alice", "bob"), ("f1", "bob"), ("f3", "bob"),
+                 ("alice", "star"), ("f1", "star"), ("f2", "star"), ("f4", "star")],
+        videos=[
+            {"id": "bob-1", "user_id": "bob", "created_at": at(1)},
+            {"id": "star-1", "user_id": "star", "created_at": at(2)},
+            {"id": "bob-2", "user_id": "bob", "created_at": at(3)},
+            {"id": "carol-1", "user_id": "carol", "created_at": at(4)},
+        ]
+    )
+    monkeypatch.setattr(TimelineService, "_fetch_followers_count", staticmethod(graph.followers_count))
+    monkeypatch.setattr(TimelineService, "_fetch_follower_page", staticmethod(graph.follower_page))
+    monkeypatch.setattr(TimelineService, "_fetch_following", staticmethod(graph.following))
+    monkeypatch.setattr(TimelineService, "_fetch_recent_uploads", staticmethod(graph.recent_uploads))
+    return graph
+
+
+def test_cold_timeline_is_rebuilt_once_and_paged(graph):
+    """The first read builds the timeline (celebrities pulled, others pushed); later reads page it"""
+    async def scenario():
+        service = TimelineService()
+        assert await service.get_timeline_page("alice", 2, 0) == ["bob-2", "star-1"]
+        assert await service.get_timeline_page("alice", 2, 2) == ["bob-1"]
+
+        assert service.stats["timelines_rebuilt"] == 1
+        assert cache.redis.data["timeline:pull:alice"] == {"-", "star"}
+        assert set(cache.redis.data["timeline:alice"]) == {"bob-1", "bob-2"}
+
+    asyncio.run(scenario())
+
+
+def test_rebuild_without_follows_is_cached(graph):
+    """A user following nobody gets an empty timeline that is not rebuilt on every read"""
+    async def scenario():
+        service = TimelineService()
+        assert await service.get_timeline_page("loner", 20, 0) == []
+        assert await service.get_timeline_page("loner", 20, 0) == []
+
+        assert service.stats["timelines_rebuilt"] == 1
+        assert await cache.timeline_exists("loner")
+
+        # The first push creates the timeline key, with a TTL like the rebuilt ones
+        graph.follows.append(("loner", "carol"))
+        await service.on_follow("loner", "carol")
+        assert set(cache.redis.data["timeline:loner"]) == {"carol-1"}
+        assert cache.redis.ttls["timeline:loner"] == cache.redis.ttls["timeline:pull:loner"]
+
+    asyncio.run(scenario())
+
+
+def test_fan_out_pushes_to_built_timelines_in_keyset_pages(graph):
+    """Followers are paged by id; only timelines that exist are written"""
+    async def scenario():
+        service = TimelineService()
+        await service.rebuild("alice")
+        await service.rebuild("f3")
+
+        graph.videos.append({"id": "bob-3", "user_id": "bob", "created_at": at(5)})
+        await service.fan_out(graph.videos[-1])
+
+        assert graph.pages == [None, "f1"]
+        assert service.stats["timelines_written"] == 2
+        assert service.stats["uploads_fanned_out"] == 1
+        assert not await cache.timeline_exists("f1")  # Never read: stays cold
+        assert (await service.get_timeline_page("f3", 1, 0)) == ["bob-3"]
+        assert (await service.get_timeline_page("alice", 1, 0)) == ["bob-3"]
+
+    asyncio.run(scenario())
+
+
+def test_fan_out_skips_creators_above_the_celebrity_threshold(graph):
+    """A celebrity upload is not pushed anywhere; readers pull it"""
+    async def scenario():
+        service = TimelineService()
+        await service.rebuild("alice")
+
+        await cache.mark_pulled_creator("star")  # Pulled since before alice's rebuild
+        graph.videos.append({"id": "star-2", "user_id": "star", "created_at": at(6)})
+        await service.fan_out(graph.videos[-1])
+
+        assert graph.pages == []
+        assert service.stats["uploads_pulled"] == 1
+        assert "star-2" not in cache.redis.data["timeline:alice"]
+        assert (await service.get_timeline_page("alice", 1, 0)) == ["star-2"]
+
+    asyncio.run(scenario())
+
+
+def test_creator_crossing_the_threshold_is_pulled_by_built_timelines(graph):
+    """Timelines built while a creator was pushed start pulling them once they cross the threshold"""
+    async def scenario():
+        service = TimelineService()
+        await service.rebuild("alice")
+        await service.rebuild("f3")
+        assert "bob" not in cache.redis.data["timeline:pull:alice"]
+
+        graph.follows.append(("f5", "bob"))  # 4 followers: now above the threshold
+        graph.videos.append({"id": "bob-3", "user_id": "bob", "created_at": at(5)})
+        await service.fan_out(graph.videos[-1])
+
+        assert service.stats["pull_sources_added"] == 2
+        assert "bob-3" not in cache.redis.data["timeline:alice"]
+        assert await service.get_timeline_page("alice", 1, 0) == ["bob-3"]
+        assert await service.get_timeline_page("f3", 1, 0) == ["bob-3"]
+
+        # Later uploads don't page the followers again
+        pages = len(graph.pages)
+        graph.videos.append({"id": "bob-4", "user_id": "bob", "created_at": at(6)})
+        await service.fan_out(graph.videos[-1])
+        assert len(graph.pages) == pages
+        assert await service.get_timeline_page("alice", 2, 0) == ["bob-4", "bob-3"]
+
+    asyncio.run(scenario())
+
+
+def test_follow_and_unfollow_update_built_timelines(graph):
+    """Follows backfill (or add a pull source), unfollows trim; cold timelines are left alone"""
+    async def scenario():
+        service = TimelineService()
+        await service.rebuild("f1")
+        graph.follows.append(("f1", "carol"))
+        await service.on_follow("f1", "carol")
+        assert await service.get_timeline_page("f1", 10, 0) == ["carol-1", "bob-2", "star-1", "bob-1"]
+
+        await service.on_unfollow("f1", "bob")
+        await service.on_unfollow("f1", "star")
+        graph.follows.remove(("f1", "bob"))
+        graph.follows.remove(("f1", "star"))
+        assert await service.get_timeline_page("f1", 10, 0) == ["carol-1"]
+        assert cache.redis.data["timeline:pull:f1"] == {"-"}
+
+        graph.follows.append(("f2", "carol"))
+        await service.on_follow("f2", "carol")
+        assert not await cache.timeline_exists("f2")
+
+        # Following a celebrity adds a pull source instead of copying uploads
+        await service.rebuild("f3")
+        graph.follows.append(("f3", "star"))
+        await service.on_follow("f3", "star")
+        assert cache.redis.data["timeline:pull:f3"] == {"-", "star"}
+        assert set(cache.redis.data["timeline:f3"]) == {"bob-1", "bob-2"}
+
+    asyncio.run(scenario())
+
+
+def test_celebrity_uploads_are_appended_only_to_a_cached_list(graph):
+    """An upload never creates a partial uploads list; a cold one is loaded whole on read"""
+    async def scenario():
+        service = TimelineService()
+        graph.videos.append({"id": "star-2", "user_id": "star", "created_at": at(6)})
+        await service.fan_out(graph.videos[-1])
+        assert not await cache.exists("uploads:star")
+
+        assert await service.get_timeline_page("alice", 10, 0) == ["star-2", "bob-2", "star-1", "bob-1"]
+
+        graph.videos.append({"id": "star-3", "user_id": "star", "created_at": at(7)})
+        await service.fan_out(graph.videos[-1])
+        assert await service.get_timeline_page("alice", 2, 0) == ["star-3", "star-2"]
+
+    asyncio.run(scenario())
+
+
+def test_creator_without_uploads_is_cached(graph, monkeypatch):
+    """An empty uploads list is stored, so pulling that creator stops hitting the database"""
+    async def scenario():
+        service = TimelineService()
+        graph.follows += [("alice", "quiet"), ("f1", "quiet"), ("f2", "quiet"), ("f3", "quiet")]
+        fetches = []
+        fetch = graph.recent_uploads
+        monkeypatch.setattr(TimelineService, "_fetch_recent_uploads", staticmethod(
+            lambda user_ids, limit: fetches.append(list(user_ids)) or fetch(user_ids, limit)
+        ))
+
+        await service.get_timeline_page("alice", 10, 0)
+        await service.get_timeline_page("alice", 10, 0)
+
+        assert fetches.count(["quiet"]) == 1
+        assert await cache.get_recent_uploads(["quiet"], 10) == {"quiet": []}
+
+    asyncio.run(scenario())
@@ -0,0 +1,105 @@
+"""
+Tests for trending leader election (lock on a fake Redis)
+"""
+import asyncio
+
+import pytest
+
+from app.redis_cache import RedisCache, cache
+from app.trending_scheduler import LEADER_LOCK_KEY, LEADER_LOCK_TTL, TrendingScheduler
+from tests.fake_redis import FakeRedis
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+
+    def renew(keys, args):
+        if redis.data.get(keys[0]) != args[0]:
+            return 0
+        redis.ttls[keys[0]] = int(args[1]) / 1000
+        return 1
+
+    def release(keys, args):
+        return redis._delete(keys[0]) if redis.data.get(keys[0]) == args[0] else 0
+
+    redis.register_script(RedisCache._RENEW_LOCK_SCRIPT, renew)
+    redis.register_script(RedisCache._RELEASE_LOCK_SCRIPT, release)
+    monkeypatch.setattr(cache, "redis", redis)
+    monkeypatch.setattr(cache, "enabled", True)
+    return redis
+
+
+def test_one_process_acquires_and_renews_leadership(redis):
+    """The first scheduler takes the lock; the second stays a follower; renewals extend the TTL"""
+    async def scenario():
+        leader, follower = TrendingScheduler(), TrendingScheduler()
+        assert await leader.ensure_leadership()
+        assert not await follower.ensure_leadership()
+        assert redis.data[LEADER_LOCK_KEY] == leader.instance_id
+        assert redis.ttls[LEADER_LOCK_KEY] == LEADER_LOCK_TTL
+
+        redis.ttls[LEADER_LOCK_KEY] = 1  # Close to expiring
+        assert await leader.ensure_leadership()
+        assert redis.ttls[LEADER_LOCK_KEY] == LEADER_LOCK_TTL
+        assert redis.calls.count("eval") == 1  # Renewed, not re-acquired
+        assert not await follower.ensure_leadership()
+
+    asyncio.run(scenario())
+
+
+def test_standby_takes_over_when_the_lock_expires(redis):
+    """A leader whose lock expired (and was taken) steps down; the standby leads"""
+    async def scenario():
+        leader, standby = TrendingScheduler(), TrendingScheduler()
+        assert await leader.ensure_leadership()
+
+        redis._delete(LEADER_LOCK_KEY)  # Leader stalled past the TTL
+        assert await standby.ensure_leadership()
+        assert not await leader.ensure_leadership()
+        assert not leader.is_leader
+        assert redis.data[LEADER_LOCK_KEY] == standby.instance_id
+
+    asyncio.run(scenario())
+
+
+def test_stop_hands_over_leadership(redis):
+    """Stopping the leader releases the lock; stopping a follower leaves it alone"""
+    async def scenario():
+        leader, follower = TrendingScheduler(), TrendingScheduler()
+        await leader.ensure_leadership()
+        await follower.ensure_leadership()
+
+        await follower.stop()
+        assert redis.data[LEADER_LOCK_KEY] == leader.instance_id
+
+        await leader.stop()
+        assert LEADER_LOCK_KEY not in redis.data
+        assert await follower.ensure_leadership()
+
+    asyncio.run(scenario())
+
+
+def test_transient_renew_error_keeps_leadership(redis, monkeypatch):
+    """A Redis error while renewing is not a lost lock: the leader keeps it and renews on the next tick"""
+    async def scenario():
+        leader, follower = TrendingScheduler(), TrendingScheduler()
+        assert await leader.ensure_leadership()
+
+        real_eval = redis._eval
+
+        def failing_eval(*args):
+            raise ConnectionError("Redis timeout")
+        monkeypatch.setattr(redis, "_eval", failing_eval)
+        assert await leader.ensure_leadership()  # Lock still within its TTL
+        assert not await follower.ensure_leadership()
+
+        # Past our own view of the TTL, but the stored token is still ours: renewed, not lost
+        leader.lock_expires_at = 0.0
+        assert not await leader.ensure_leadership()  # Redis still failing: can't tell, step down
+        monkeypatch.setattr(redis, "_eval", real_eval)
+        assert await leader.ensure_leadership()
+        assert redis.data[LEADER_LOCK_KEY] == leader.instance_id
+        assert redis.ttls[LEADER_LOCK_KEY] == LEADER_LOCK_TTL
+
+    asyncio.run(scenario())
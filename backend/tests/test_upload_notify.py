@@ -0,0 +1,47 @@
+"""
+Tests for new-upload notifications (local presence, no Redis)
+"""
+import asyncio
+
+from app import presence, upload_notify
+from app.presence import PresenceService
+from app.timeline import TimelineService
+from app.upload_notify import UploadNotifier
+from app.websocket_manager import ConnectionManager
+from tests.fake_websocket import FakeWebSocket
+
+
+def test_only_online_followers_hear_about_an_upload(monkeypatch):
+    """Followers are paged and intersected with presence; other sockets get nothing"""
+    async def scenario():
+        manager = ConnectionManager()
+        await manager.start_broker()
+        service = PresenceService()
+        monkeypatch.setattr(presence, "HAS_REDIS_CACHE", False)
+        monkeypatch.setattr(upload_notify, "ws_manager", manager)
+        monkeypatch.setattr(upload_notify, "presence_service", service)
+        monkeypatch.setattr(upload_notify, "FOLLOWER_PAGE_SIZE", 2)
+
+        followers = ["f1", "f2", "f3", "f4", "f5"]
+        monkeypatch.setattr(TimelineService, "_fetch_follower_page",
+                            staticmethod(lambda user_id, after, limit: [
+                                f for f in followers if after is None or f > after][:limit]))
+
+        sockets = {}
+        for user_id in ["f2", "f5", "stranger"]:
+            sockets[user_id] = FakeWebSocket()
+            await manager.connect(sockets[user_id], user_id)
+            service.user_connected(user_id)
+
+        notifier = UploadNotifier()
+        notifier.start()
+        notifier.enqueue_upload({"id": "v1", "user_id": "creator", "title": "Hello"}, "creator_name")
+        await asyncio.wait_for(notifier.queue.join(), 1)
+        await asyncio.sleep(0.01)
+        await notifier.stop()
+
+        for user_id, expected in (("f2", 1), ("f5", 1), ("stranger", 0)):
+            assert [m["type"] for m in sockets[user_id].sent].count("new_video") == expected
+        assert notifier.stats == {"uploads": 1, "followers_checked": 5, "notified": 2, "dropped": 0}
+
+    asyncio.run(scenario())
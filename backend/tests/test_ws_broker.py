@@ -0,0 +1,155 @@
+"""
+Tests for cross-node WebSocket delivery through the broker
+"""
+import asyncio
+
+from app.websocket_manager import ConnectionManager, LiveStreamManager
+from app.ws_broker import InMemoryBroker, RedisBroker, channel_for, parse_channel
+from tests.fake_websocket import FakeWebSocket
+
+
+def _types(socket):
+    return [m["type"] for m in socket.sent]
+
+
+async def _two_nodes():
+    hub = {}
+    nodes = []
+    for _ in range(2):
+        manager = ConnectionManager(InMemoryBroker(hub))
+        await manager.start_broker()
+        nodes.append((manager, LiveStreamManager(manager)))
+    return hub, nodes
+
+
+def test_channel_names_round_trip():
+    assert parse_channel(channel_for("room", "lobby:1")) == ("room", "lobby:1")
+    assert parse_channel("ws:all") == ("all", "")
+
+
+def test_notification_reaches_user_on_other_node():
+    """A like notification published on node A is delivered to the user's socket on node B"""
+    async def scenario():
+        _, [(node_a, _), (node_b, _)] = await _two_nodes()
+        socket = FakeWebSocket()
+        await node_b.connect(socket, "creator")
+
+        await node_a.send_notification("creator", "new_like", {"video_id": "v1"})
+        await asyncio.sleep(0.01)
+
+        assert _types(socket)[-1] == "notification"
+        assert socket.sent[-1]["data"] == {"video_id": "v1"}
+
+    asyncio.run(scenario())
+
+
+def test_send_to_users_publishes_one_envelope_for_remote_users():
+    """Local users are delivered directly; the others share a single publish"""
+    async def scenario():
+        _, [(node_a, _), (node_b, _)] = await _two_nodes()
+        sockets = {user_id: FakeWebSocket() for user_id in ("a1", "b1", "b2")}
+        await node_a.connect(sockets["a1"], "a1")
+        await node_b.connect(sockets["b1"], "b1")
+        await node_b.connect(sockets["b2"], "b2")
+        published = node_a.broker.stats["published"]
+
+        node_a.send_to_users(["a1", "b1", "b2", "offline"], {"type": "new_video", "video_id": "v1"})
+        await asyncio.sleep(0.01)
+
+        assert node_a.broker.stats["published"] == published + 1
+        for socket in sockets.values():
+            assert _types(socket).count("new_video") == 1
+
+    asyncio.run(scenario())
+
+
+class FakePubSub:
+    def __init__(self):
+        self.channels = set()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+
+def test_full_publish_queue_does_not_drop_subscriptions():
+    """Publishes past the queue size are dropped; subscription changes still go through"""
+    async def scenario():
+        broker = RedisBroker(redis_cache=None, queue_size=2)
+        broker.pubsub = FakePubSub()
+        for i in range(5):
+            broker.publish(channel_for("user", f"u{i}"), {"message": i})
+        broker.subscribe(channel_for("room", "lobby"))
+        broker.subscribe(channel_for("room", "gone"))
+        broker.unsubscribe(channel_for("room", "gone"))
+        assert broker.stats["dropped"] == 3
+
+        subscriber = asyncio.create_task(broker._subscriber())
+        await asyncio.sleep(0.01)
+        subscriber.cancel()
+        assert broker.pubsub.channels == {channel_for("room", "lobby")}
+
+    asyncio.run(scenario())
+
+
+def test_session_chat_spans_nodes_and_subscriptions_follow_members():
+    """Live chat reaches viewers on both nodes; nodes only subscribe while they have members"""
+    async def scenario():
+        hub, [(_, live_a), (node_b, live_b)] = await _two_nodes()
+        viewer_a, viewer_b = FakeWebSocket(), FakeWebSocket()
+        await live_a.join_live_session(viewer_a, "s1", "a", "alice")
+        await live_b.join_live_session(viewer_b, "s1", "b", "bob")
+        assert len(hub[channel_for("session", "s1")]) == 2
+        await asyncio.sleep(0.01)
+
+        await live_a.handle_chat_message("s1", "a", "hello")
+        await asyncio.sleep(0.2)  # Chat batch window
+        assert _types(viewer_a)[-1] == "chat_batch"
+        assert _types(viewer_b)[-1] == "chat_batch"
+        assert _types(viewer_b).count("chat_batch") == 1  # No echo of our own publish
+        assert viewer_b.sent[-1]["messages"][0]["message"] == "hello"
+
+        live_b.leave_live_session("s1", "b")
+        assert node_b.broker not in hub[channel_for("session", "s1")]
+
+    asyncio.run(scenario())
+
+
+def test_viewer_counts_are_cluster_wide():
+    """Each node announces its local count; viewers everywhere see the sum"""
+    async def scenario():
+        _, [(node_a, live_a), (node_b, live_b)] = await _two_nodes()
+        sockets = {user_id: FakeWebSocket() for user_id in ("a1", "b1", "b2")}
+        for user_id, socket in sockets.items():
+            node = node_a if user_id.startswith("a") else node_b
+            await node.connect(socket, user_id)
+            await node.join_video(user_id, "v1")
+        await live_a.join_live_session(FakeWebSocket(), "s1", "host", "host")
+        viewer = FakeWebSocket()
+        await live_b.join_live_session(viewer, "s1", "v", "viewer")
+
+        async def tick():
+            for _ in range(2):  # Announce, then sum what the other node announced
+                for flush in (node_a.flush_viewer_counts, node_b.flush_viewer_counts,
+                              live_a.flush_viewer_counts, live_b.flush_viewer_counts):
+                    flush()
+                await asyncio.sleep(0.01)
+
+        def last_count(socket, kind):
+            return [m["viewer_count"] for m in socket.sent if m["type"] == kind][-1]
+
+        await tick()
+        assert [last_count(s, "viewer_update") for s in sockets.values()] == [3, 3, 3]
+        assert node_a.get_video_viewers("v1") == node_b.get_video_viewers("v1") == 3
+        assert last_count(viewer, "viewer_count") == 2
+
+        await node_b.leave_video("b2", "v1")
+        live_a.leave_live_session("s1", "host")
+        await tick()
+        assert last_count(sockets["a1"], "viewer_update") == 2
+        assert last_count(sockets["b1"], "viewer_update") == 2
+        assert last_count(viewer, "viewer_count") == 1
+
+    asyncio.run(scenario())
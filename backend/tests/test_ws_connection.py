@@ -0,0 +1,806 @@
+"""
+Tests for queued WebSocket fan-out
+"""
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from app import ws_connection, ws_throttle
+from app.live_counters import LiveCounters
+from app.websocket_manager import ConnectionManager, LiveStreamManager
+from app.ws_heartbeat import HeartbeatWheel
+from tests.fake_websocket import FakeWebSocket
+
+
+def test_slow_client_does_not_delay_others():
+    """A stalled viewer doesn't hold up delivery to the rest of the session"""
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        await live.join_live_session(slow, "s1", "slow", "slow")
+        await live.join_live_session(fast, "s1", "fast", "fast")
+
+        await live.broadcast_to_session("s1", {"type": "chat_message", "message": "hi"})
+        await asyncio.sleep(0)
+
+        assert [m["type"] for m in fast.sent][-1] == "chat_message"
+        assert slow.sent == []
+
+        slow.gate.set()
+        await asyncio.sleep(0.01)
+        assert [m["type"] for m in slow.sent] == ["current_participants", "chat_message"]
+
+    asyncio.run(scenario())
+
+
+def test_overflowing_client_is_dropped(monkeypatch):
+    """A client whose queue fills up is disconnected instead of growing memory"""
+    monkeypatch.setattr(ws_connection, "DEFAULT_POLICY", ws_connection.SlowConsumerPolicy(
+        max_queue=3, low_priority_watermark=3, high_watermark=3, grace_seconds=60
+    ))
+
+    async def scenario():
+        manager = ConnectionManager()
+        socket = FakeWebSocket(blocked=True)
+        await manager.connect(socket, "u1")
+
+        for i in range(5):
+            await manager.send_personal_message({"type": "notification", "n": i}, "u1")
+        await asyncio.sleep(0.01)
+
+        assert "u1" not in manager.active_connections
+        assert socket.closed
+
+    asyncio.run(scenario())
+
+
+def test_kick_flushes_notice_before_closing():
+    """Graceful close writes queued frames before closing the socket"""
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host, viewer = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+        await live.join_live_session(viewer, "s1", "viewer", "viewer")
+
+        await live.handle_participant_action("s1", "viewer", "kick", "host")
+        assert "viewer" not in live.manager.live_sessions["s1"]
+
+        await asyncio.gather(*live.closing)
+        assert viewer.sent[-1]["type"] == "kicked"
+        assert viewer.closed
+
+    asyncio.run(scenario())
+
+
+def test_closing_sockets_do_not_hold_up_the_session(monkeypatch):
+    """Kicking a stuck client and ending the session return without waiting for the drain"""
+    monkeypatch.setattr(ws_connection, "CLOSE_DRAIN_SECONDS", 0.5)
+    monkeypatch.setattr(LiveCounters, "_write_counts", staticmethod(lambda session_id, counts: None))
+    monkeypatch.setattr("app.live_counters.HAS_REDIS_CACHE", False)
+    monkeypatch.setattr("app.websocket_manager.live_counters", LiveCounters())
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host, stuck, other = FakeWebSocket(), FakeWebSocket(blocked=True), FakeWebSocket(blocked=True)
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+        await live.join_live_session(stuck, "s1", "stuck", "stuck")
+        await live.join_live_session(other, "s1", "other", "other")
+
+        start = time.monotonic()
+        await live.handle_participant_action("s1", "stuck", "kick", "host")
+        await live.handle_session_ended("s1")
+        assert time.monotonic() - start < 0.25
+        assert "s1" not in live.manager.live_sessions and not live.actors
+
+        await asyncio.gather(*live.closing)  # Each drain gives up after CLOSE_DRAIN_SECONDS
+        assert stuck.closed and other.closed and host.closed
+        assert not live.closing
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_encodes_once(monkeypatch):
+    """One JSON encode per broadcast, however many viewers receive it"""
+    calls = []
+    real_encode = ws_connection.encode_json
+    monkeypatch.setattr(ws_connection, "encode_json", lambda m: calls.append(m) or real_encode(m))
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        sockets = [FakeWebSocket() for _ in range(20)]
+        for i, socket in enumerate(sockets):
+            await live.join_live_session(socket, "s1", f"u{i}", f"user{i}")
+        await asyncio.sleep(0.01)
+        calls.clear()
+
+        await live.broadcast_to_session("s1", {"type": "chat_message", "message": "héllo"})
+        await asyncio.sleep(0.01)
+
+        assert len(calls) == 1
+        assert all(s.sent[-1] == {"type": "chat_message", "message": "héllo"} for s in sockets)
+
+    asyncio.run(scenario())
+
+
+class MsgpackWebSocket(FakeWebSocket):
+    """Client that offered the msgpack subprotocol"""
+
+    def __init__(self, incoming=()):
+        super().__init__()
+        self.scope = {"subprotocols": [ws_connection.MSGPACK_SUBPROTOCOL]}
+        self.subprotocol = None
+        self.incoming = list(incoming)
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_bytes(self, data):
+        self.sent.append(ws_connection.msgpack.unpackb(data, raw=False))
+
+    async def receive(self):
+        if self.incoming:
+            return {"type": "websocket.receive", **self.incoming.pop(0)}
+        return {"type": "websocket.disconnect", "code": 1000}
+
+
+def test_msgpack_and_json_clients_share_one_broadcast(monkeypatch):
+    """Each codec encodes a broadcast once; both kinds of client get the same message"""
+    calls = []
+    real_encode = ws_connection.encode_msgpack
+    monkeypatch.setattr(ws_connection, "encode_msgpack", lambda m: calls.append(m) or real_encode(m))
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        json_socket = FakeWebSocket()
+        binary_socket = MsgpackWebSocket([
+            {"bytes": real_encode({"action": "ping"})},
+            {"text": '{"action": "chat"}'},
+        ])
+        assert await ws_connection.accept_websocket(binary_socket) == ws_connection.CODEC_MSGPACK
+        assert binary_socket.subprotocol == ws_connection.MSGPACK_SUBPROTOCOL
+
+        await live.join_live_session(json_socket, "s1", "j", "json")
+        await live.join_live_session(binary_socket, "s1", "b", "binary")
+        await live.join_live_session(MsgpackWebSocket(), "s1", "b2", "binary2")
+        await asyncio.sleep(0.01)
+        calls.clear()
+
+        await live.broadcast_to_session("s1", {"type": "chat_message", "message": "habari"})
+        await asyncio.sleep(0.01)
+
+        assert json_socket.sent[-1] == binary_socket.sent[-1] == {"type": "chat_message", "message": "habari"}
+        assert len(calls) == 1
+
+        assert await ws_connection.receive_message(binary_socket) == {"action": "ping"}
+        assert await ws_connection.receive_message(binary_socket) == {"action": "chat"}
+        try:
+            await ws_connection.receive_message(binary_socket)
+            assert False, "expected a disconnect"
+        except ws_connection.WebSocketDisconnect:
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_low_priority_frames_dropped_and_state_coalesced():
+    """Backlogged clients lose reactions first and only get the latest viewer count"""
+    policy = ws_connection.SlowConsumerPolicy(max_queue=50, low_priority_watermark=2,
+                                              high_watermark=40, grace_seconds=60)
+    metrics = ws_connection.new_delivery_metrics()
+
+    async def scenario():
+        socket = FakeWebSocket(blocked=True)
+        conn = ws_connection.ClientConnection(socket, "u1", "c1", policy=policy, metrics=metrics)
+
+        for i in range(3):
+            conn.send({"type": "viewer_update", "video_id": "v1", "viewer_count": i})
+        conn.send({"type": "chat_message", "message": "a"})
+        conn.send({"type": "reaction", "reaction": "🔥"})   # depth 2 -> dropped
+        conn.send({"type": "chat_message", "message": "b"})  # normal frames still queue
+
+        socket.gate.set()
+        await asyncio.sleep(0.01)
+        assert socket.sent == [
+            {"type": "viewer_update", "video_id": "v1", "viewer_count": 2},
+            {"type": "chat_message", "message": "a"},
+            {"type": "chat_message", "message": "b"},
+        ]
+        conn.detach()
+
+    asyncio.run(scenario())
+    assert metrics["coalesced"] == 2
+    assert metrics["dropped"] == 1
+
+
+def test_client_over_high_watermark_too_long_is_disconnected():
+    """Staying above the high watermark past the grace period gets the client dropped"""
+    policy = ws_connection.SlowConsumerPolicy(max_queue=100, low_priority_watermark=100,
+                                              high_watermark=2, grace_seconds=0.01)
+    metrics = ws_connection.new_delivery_metrics()
+    closed = []
+
+    async def scenario():
+        socket = FakeWebSocket(blocked=True)
+        conn = ws_connection.ClientConnection(socket, "u1", "c1", on_close=closed.append,
+                                              policy=policy, metrics=metrics)
+        for i in range(3):
+            assert conn.send({"type": "chat_message", "n": i})
+        await asyncio.sleep(0.02)
+        assert not conn.send({"type": "chat_message", "n": 3})
+        await asyncio.sleep(0.01)
+        assert socket.closed
+
+    asyncio.run(scenario())
+    assert metrics["slow_disconnects"] == 1
+    assert len(closed) == 1
+
+
+def test_disconnect_cleans_only_own_memberships():
+    """Reverse indexes remove the user from their rooms and drop empty sets"""
+    async def scenario():
+        manager = ConnectionManager()
+        conn_a = await manager.connect(FakeWebSocket(), "a")
+        await manager.connect(FakeWebSocket(), "b")
+        manager.join_room("a", "lobby")
+        manager.join_room("b", "lobby")
+        await manager.join_video("a", "v1")
+        await manager.join_video("b", "v2")
+
+        manager.disconnect("a", conn_a)
+
+        assert manager.rooms == {"lobby": {"b"}}
+        assert manager.video_viewers == {"v2": {"b"}}
+        assert "a" not in manager.user_rooms and "a" not in manager.user_videos
+
+    asyncio.run(scenario())
+
+
+def test_silent_clients_are_pinged_then_reaped():
+    """Idle sockets get a server ping; only the ones that never answer are removed"""
+    async def scenario():
+        manager = ConnectionManager()
+        manager.heartbeats = HeartbeatWheel(ping_interval=10, pong_timeout=5, resolution=1)
+        live = LiveStreamManager(manager)
+        alive, dead = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(alive, "s1", "alive", "alive")
+        await live.join_live_session(dead, "s1", "dead", "dead")
+        start = manager.live_sessions["s1"]["dead"].connection.last_seen
+
+        manager.heartbeats.sweep(start + 11)
+        await asyncio.sleep(0.01)
+        assert alive.sent[-1]["type"] == "ping" and dead.sent[-1]["type"] == "ping"
+
+        manager.live_sessions["s1"]["alive"].connection.last_seen = start + 12  # Answered
+        manager.heartbeats.sweep(start + 17)
+        await asyncio.sleep(0.01)
+
+        assert list(manager.live_sessions["s1"]) == ["alive"]
+        assert dead.closed and not alive.closed
+        assert live.session_metrics["s1"]["reaped"] == 1
+        assert manager.heartbeats.stats["reaped"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_viewer_counts_are_coalesced_per_tick():
+    """Many joins produce one count frame per video/session on the next tick"""
+    async def scenario():
+        manager = ConnectionManager()
+        live = LiveStreamManager(manager)
+        sockets = {}
+        for user_id in ("host", "v1", "v2", "v3"):
+            sockets[user_id] = FakeWebSocket()
+            await manager.connect(sockets[user_id], user_id)
+            await manager.join_video(user_id, "video1")
+        await live.join_live_session(FakeWebSocket(), "s1", "host", "host", role="host")
+        viewer = FakeWebSocket()
+        await live.join_live_session(viewer, "s1", "v1", "v1")
+        await live.join_live_session(FakeWebSocket(), "s1", "v2", "v2")
+        await asyncio.sleep(0.01)
+        assert not any(m["type"] == "viewer_update" for m in sockets["v1"].sent)
+        assert [m["type"] for m in viewer.sent] == ["current_participants"]  # No viewer join events
+
+        manager.flush_viewer_counts()
+        live.flush_viewer_counts()
+        manager.flush_viewer_counts()  # Nothing dirty: no new frames
+        await asyncio.sleep(0.01)
+
+        updates = [m for m in sockets["v1"].sent if m["type"] == "viewer_update"]
+        assert [u["viewer_count"] for u in updates] == [4]
+        assert viewer.sent[-1] == {**viewer.sent[-1], "type": "viewer_count", "viewer_count": 3}
+
+    asyncio.run(scenario())
+
+
+def test_chat_is_delivered_in_batches(monkeypatch):
+    """Chat bursts become a few chat_batch frames; over-cap messages are dropped but echoed to the author"""
+    from app import live_events
+    monkeypatch.setattr(live_events, "CHAT_BATCH_MAX_MESSAGES", 10)
+    monkeypatch.setattr(live_events, "CHAT_MAX_PER_SECOND", 25)
+    monkeypatch.setattr(live_events, "CHAT_OVERFLOW_SAMPLE_RATE", 0)
+    monkeypatch.setitem(ws_throttle.ACTION_LIMITS, "chat", (1000, 1000))  # One sender; the session cap is under test
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        author, viewer = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(author, "s1", "a", "alice")
+        await live.join_live_session(viewer, "s1", "b", "bob")
+
+        for i in range(30):
+            await live.handle_chat_message("s1", "a", f"msg {i}")
+        await asyncio.sleep(live_events.CHAT_BATCH_WINDOW_MS / 1000 + 0.05)
+
+        batches = [m for m in viewer.sent if m["type"] == "chat_batch"]
+        assert [len(b["messages"]) for b in batches] == [10, 10, 5]
+        assert batches[-1]["dropped"] == 5
+        assert sum(len(m["messages"]) for m in author.sent if m["type"] == "chat_batch") == 30
+
+    asyncio.run(scenario())
+
+
+def test_reactions_are_summarised(monkeypatch):
+    """Reaction taps become one reaction_summary with counts per type and per-minute totals"""
+    from app import live_events
+    store = live_events.ReactionStore()
+    monkeypatch.setattr("app.websocket_manager.reaction_store", store)
+    monkeypatch.setitem(ws_throttle.ACTION_LIMITS, "reaction", (1000, 1000))
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        viewer = FakeWebSocket()
+        await live.join_live_session(viewer, "s1", "a", "alice")
+
+        for reaction in ["❤️"] * 40 + ["🔥"] * 3:
+            await live.handle_reaction("s1", "a", reaction)
+        await asyncio.sleep(live_events.REACTION_SUMMARY_INTERVAL_MS / 1000 + 0.05)
+
+        summaries = [m for m in viewer.sent if m["type"] == "reaction_summary"]
+        assert len(summaries) == 1
+        assert summaries[0]["counts"] == {"❤️": 40, "🔥": 3}
+        assert summaries[0]["total"] == 43
+
+    asyncio.run(scenario())
+    assert sorted(count for counts in store.pending.values() for count in counts.values()) == [3, 40]
+
+
+def test_rest_reactions_without_local_participants_leave_nothing_behind(monkeypatch):
+    """A REST reaction on a node with no participants is summarised for other nodes, then forgotten"""
+    from app import live_events
+    monkeypatch.setattr("app.websocket_manager.reaction_store", live_events.ReactionStore())
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        live.record_reaction("s1", "🔥")
+        assert "s1" in live.reaction_aggregators
+        await asyncio.sleep(live_events.REACTION_SUMMARY_INTERVAL_MS / 1000 + 0.05)
+        assert live.reaction_aggregators == {}
+        assert live.actors == {}
+
+    asyncio.run(scenario())
+
+
+class FakeReactionRpc:
+    """Stands in for supabase.rpc("add_live_reaction_counts"); fails for one session"""
+
+    def __init__(self, failing_session):
+        self.failing_session = failing_session
+        self.calls = []
+
+    def rpc(self, name, params):
+        assert name == "add_live_reaction_counts"
+        self.params = params
+        return self
+
+    def execute(self):
+        sessions = {row["session_id"] for row in self.params["counts"]}
+        self.calls.append(sessions)
+        if self.failing_session in sessions:
+            raise Exception('insert or update on table "live_reaction_counts" violates foreign key constraint')
+
+
+def test_reaction_totals_flush_per_session_and_give_up_on_bad_ones(monkeypatch):
+    """A failing or malformed session doesn't hold back the others' totals"""
+    from app import live_events
+    good, deleted = str(uuid.uuid4()), str(uuid.uuid4())
+    database = FakeReactionRpc(deleted)
+    monkeypatch.setattr(live_events, "supabase", database)
+    monkeypatch.setattr(live_events, "REACTION_MAX_FLUSH_ATTEMPTS", 2)
+    store = live_events.ReactionStore()
+
+    async def scenario():
+        for session_id in (good, deleted, "not-a-uuid"):
+            store.record(session_id, "❤️", 2)
+        await store.flush()
+        assert database.calls == [{good}, {deleted}]
+        assert list(store.pending) == [deleted]
+
+        store.record(good, "🔥")
+        await store.flush()
+        assert database.calls[-2:] == [{deleted}, {good}]
+        assert store.pending == {} and store.pending_rows == 0
+        assert store.stats["rows_written"] == 2
+        assert store.stats["rows_dropped"] == 2  # Malformed session, then the deleted one
+
+    asyncio.run(scenario())
+
+
+class FakeChatTable:
+    """Stands in for supabase.table("live_chat_messages"); fails the first insert"""
+
+    def __init__(self):
+        self.inserts = []
+        self.fail_next = True
+
+    def table(self, name):
+        assert name == "live_chat_messages"
+        return self
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("database unavailable")
+        self.inserts.append(self.rows)
+
+
+def test_chat_is_persisted_in_bulk_and_retried(monkeypatch):
+    """Chat rows are inserted per session in one call; a failed insert is retried in order"""
+    from app import live_events
+    store = live_events.ChatStore()
+    database = FakeChatTable()
+    monkeypatch.setattr("app.websocket_manager.chat_store", store)
+    monkeypatch.setattr(live_events, "supabase", database)
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        viewer = FakeWebSocket()
+        await live.join_live_session(viewer, "s1", "a", "alice")
+
+        await live.handle_chat_message("s1", "a", "first")
+        await store.flush()  # Fails: rows are kept
+        await live.handle_chat_message("s1", "a", "second")
+        await live.handle_session_ended("s1")  # Flushes the session
+
+        assert len(database.inserts) == 1
+        assert [row["message"] for row in database.inserts[0]] == ["first", "second"]
+        sent_ids = [m["id"] for batch in viewer.sent if batch["type"] == "chat_batch" for m in batch["messages"]]
+        assert sent_ids == [row["id"] for row in database.inserts[0]]
+        assert store.pending_rows == 0
+
+    asyncio.run(scenario())
+
+
+class FlakyChatTable(FakeChatTable):
+    """Fails every insert with the queued errors, then succeeds"""
+
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+
+    def execute(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.inserts.append(self.rows)
+
+
+def test_chat_retries_transient_failures_with_backoff_and_drops_permanent_ones(monkeypatch):
+    """An outage only delays chat (backing off); a foreign key violation drops the session's rows"""
+    from postgrest.exceptions import APIError
+    from app import live_events
+    outage = [RuntimeError("connection refused")] * 8
+    database = FlakyChatTable(outage + [APIError({"code": "23503", "message": "violates foreign key"})])
+    monkeypatch.setattr(live_events, "supabase", database)
+    monkeypatch.setattr(live_events, "CHAT_PERSIST_SECONDS", 1)
+    monkeypatch.setattr(live_events, "CHAT_RETRY_MAX_SECONDS", 8)
+    store = live_events.ChatStore()
+
+    async def scenario():
+        store.record("s1", "a", "during the outage")
+        delays = []
+        for _ in outage:
+            store.retry_at["s1"] = 0  # Pretend the backoff elapsed
+            await store.flush()
+            delays.append(round(store.retry_at["s1"] - time.monotonic()))
+            await store.flush()  # Still backing off: not attempted
+        assert delays == [1, 2, 4, 8, 8, 8, 8, 8]
+        assert store.pending_rows == 1 and database.inserts == []
+
+        await store.flush("s1")  # Named sessions are flushed regardless (session end)
+        assert store.pending == {} and store.stats["rows_dropped"] == 1
+        assert store.retry_at == {} and store.failed_attempts == {}
+
+        store.record("s1", "a", "after")
+        await store.flush()
+        assert [row["message"] for row in database.inserts[0]] == ["after"]
+
+    asyncio.run(scenario())
+
+
+class PickyChatTable(FakeChatTable):
+    """Rejects any insert holding a row from `bad_user` (as a foreign key violation would)"""
+
+    def __init__(self, bad_user):
+        super().__init__()
+        self.bad_user = bad_user
+        self.attempts = 0
+
+    def execute(self):
+        from postgrest.exceptions import APIError
+        self.attempts += 1
+        if any(row["user_id"] == self.bad_user for row in self.rows):
+            raise APIError({"code": "23503", "message": "violates foreign key"})
+        self.inserts.append(self.rows)
+
+
+def test_a_poison_row_only_drops_itself(monkeypatch):
+    """A permanent error is narrowed down to the bad row; NULs and non-strings never reach the insert"""
+    from app import live_events
+    database = PickyChatTable(bad_user="deleted")
+    monkeypatch.setattr(live_events, "supabase", database)
+    store = live_events.ChatStore()
+
+    async def scenario():
+        for i in range(8):
+            store.record("s1", "deleted" if i == 5 else "a", f"message {i}\x00")
+        await store.flush()
+
+        written = [row["message"] for rows in database.inserts for row in rows]
+        assert written == [f"message {i}" for i in range(8) if i != 5]
+        assert store.stats["rows_dropped"] == 1 and store.pending == {}
+        assert database.attempts == 7  # The batch, then halves down to the bad row
+
+        with pytest.raises(ValueError):
+            store.record("s1", "a", {"not": "text"})
+
+    asyncio.run(scenario())
+
+
+def test_joiners_get_recent_chat_and_resume_gets_only_missed(monkeypatch):
+    """Late joiners get buffered chat; a resume token replays only what came after it"""
+    from app import live_events
+    monkeypatch.setattr("app.websocket_manager.chat_store", live_events.ChatStore())
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host = FakeWebSocket()
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+
+        for text in ["one", "two", "three"]:
+            await live.handle_chat_message("s1", "host", text)
+            live.chat_batchers["s1"].flush()
+        await asyncio.sleep(0.01)
+
+        late = FakeWebSocket()
+        await live.join_live_session(late, "s1", "late", "late")
+        await asyncio.sleep(0.01)
+        snapshot = late.sent[0]
+        assert snapshot["type"] == "current_participants" and snapshot["replayed"] == 3
+        assert [m["messages"][0]["message"] for m in late.sent[1:]] == ["one", "two", "three"]
+
+        token = f"{snapshot['history_epoch']}.{late.sent[2]['seq']}"  # Saw up to "two"
+        again = FakeWebSocket()
+        await live.join_live_session(again, "s1", "late", "late", resume=token)
+        await asyncio.sleep(0.01)
+        assert again.sent[0]["resumed"] is True
+        assert [m["messages"][0]["message"] for m in again.sent[1:]] == ["three"]
+
+        stale = FakeWebSocket()
+        await live.join_live_session(stale, "s1", "late", "late", resume="other.1")
+        await asyncio.sleep(0.01)
+        assert stale.sent[0]["resumed"] is False and stale.sent[0]["replayed"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_reconnect_closes_the_old_socket_and_its_leave_is_ignored(monkeypatch):
+    """The superseded socket is closed; its late disconnect doesn't remove the resumed participant"""
+    from app import live_events
+    monkeypatch.setattr("app.websocket_manager.chat_store", live_events.ChatStore())
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        await live.join_live_session(FakeWebSocket(), "s1", "host", "host", role="host")
+        old, new = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(old, "s1", "guest", "guest", role="guest")
+        await live.join_live_session(new, "s1", "guest", "guest", role="guest")
+        await asyncio.sleep(0.01)
+        assert old.closed and not new.closed
+
+        live.leave_live_session("s1", "guest", old)  # The old route finally notices
+        assert live.manager.live_sessions["s1"]["guest"].connection.websocket is new
+        assert live.role_index["s1"]["guest"] == {"guest"}
+        assert "guest" in live.manager.webrtc_peers["s1"]
+
+        live.leave_live_session("s1", "guest", new)
+        assert "guest" not in live.manager.live_sessions["s1"]
+
+    asyncio.run(scenario())
+
+
+def test_role_targeted_sends_follow_role_changes():
+    """send_to_role reaches only that role's members, tracking promotions and leaves"""
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host, viewer = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+        await live.join_live_session(viewer, "s1", "v", "viewer")
+        await asyncio.sleep(0.01)
+
+        await live.send_to_role("s1", "cohost", {"type": "note"})
+        await live.handle_participant_action("s1", "v", "promote", "host", new_role="cohost")
+        await live.send_to_role("s1", "cohost", {"type": "note"})
+        await asyncio.sleep(0.01)
+
+        assert [m["type"] for m in viewer.sent].count("note") == 1
+        assert "note" not in [m["type"] for m in host.sent]
+        assert live.role_index["s1"] == {"host": {"host"}, "cohost": {"v"}}
+
+        live.leave_live_session("s1", "v")
+        live.leave_live_session("s1", "host")
+        assert "s1" not in live.role_index
+
+    asyncio.run(scenario())
+
+
+def test_flooding_client_is_throttled_before_fan_out(monkeypatch):
+    """Per-user buckets stop a flood at the sender; slow mode tightens chat for viewers only"""
+    from app import live_events
+    monkeypatch.setattr("app.websocket_manager.chat_store", live_events.ChatStore())
+    monkeypatch.setitem(ws_throttle.ACTION_LIMITS, "chat", (0.001, 3))
+    monkeypatch.setitem(ws_throttle.ACTION_LIMITS, "reaction", (0.001, 2))
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host, spammer = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+        await live.join_live_session(spammer, "s1", "spam", "spammer")
+
+        for i in range(10):
+            await live.handle_chat_message("s1", "spam", f"spam {i}")
+            await live.handle_reaction("s1", "spam", "fire")
+        live.chat_batchers["s1"].flush()
+        await asyncio.sleep(0.01)
+
+        delivered = [m for batch in host.sent if batch["type"] == "chat_batch" for m in batch["messages"]]
+        assert len(delivered) == 3
+        assert live.reaction_aggregators["s1"].stats["received"] == 2
+        assert [m["type"] for m in spammer.sent].count("rate_limited") == 7
+        assert live.get_session_delivery_stats("s1")["throttled"] == {"chat": 7, "reaction": 8}
+
+        monkeypatch.setitem(ws_throttle.ACTION_LIMITS, "chat", (1000, 1000))
+        await live.set_slow_mode("s1", 30, "host")
+        for i in range(3):
+            await live.handle_chat_message("s1", "spam", "slow")
+            await live.handle_chat_message("s1", "host", "host talks")
+        assert live.get_session_delivery_stats("s1")["throttled"]["chat"] == 9
+        assert live.get_session_delivery_stats("s1")["slow_mode"] == 30
+
+    asyncio.run(scenario())
+
+
+def test_webrtc_signals_reach_peers_only_with_batched_candidates(monkeypatch):
+    """Broadcast signals skip viewers, star mode routes via the host, ICE candidates arrive per pair in one signal"""
+    from app import websocket_manager
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host, guest, cohost, viewer = FakeWebSocket(), FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+        await live.join_live_session(guest, "s1", "g", "guest", role="guest")
+        await live.join_live_session(cohost, "s1", "c", "cohost", role="cohost")
+        await live.join_live_session(viewer, "s1", "v", "viewer")
+
+        await live.handle_webrtc_signal("s1", "host", "all", "offer", {"sdp": "x"})
+        await live.handle_webrtc_signal("s1", "v", "all", "offer", {"sdp": "y"})
+        for i in range(5):
+            await live.handle_webrtc_signal("s1", "host", "g", "ice_candidate", {"candidate": i})
+        await asyncio.sleep(0.1)
+
+        def signals(ws):
+            return [m for m in ws.sent if m["type"] == "webrtc_signal"]
+
+        assert [s["signal_type"] for s in signals(guest)] == ["offer", "ice_candidates"]
+        assert [c["candidate"] for c in signals(guest)[1]["signal_data"]["candidates"]] == list(range(5))
+        assert len(signals(cohost)) == 1
+        assert signals(viewer) == []
+
+        monkeypatch.setattr(websocket_manager, "WEBRTC_TOPOLOGY", "star")
+        await live.handle_webrtc_signal("s1", "g", "c", "offer", {"sdp": "z"})
+        await live.handle_webrtc_signal("s1", "g", "all", "offer", {"sdp": "z"})
+        await asyncio.sleep(0.01)
+        assert len(signals(cohost)) == 1
+        assert len(signals(host)) == 1
+        stats = live.get_session_delivery_stats("s1")["signals"]
+        assert stats["rejected"] == 2 and stats["batches"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_session_commands_run_in_order_on_the_session_actor(monkeypatch):
+    """Commands arriving while the session is ending wait their turn; the actor goes away with the session"""
+    from app import live_events
+    store = live_events.ChatStore()
+
+    async def slow_flush(session_id=None):
+        await asyncio.sleep(0.05)
+    store.flush = slow_flush
+    monkeypatch.setattr("app.websocket_manager.chat_store", store)
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host, viewer = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+        await live.join_live_session(viewer, "s1", "v", "viewer")
+        actor = live.actors["s1"]
+
+        ending = asyncio.create_task(live.handle_session_ended("s1"))
+        await asyncio.sleep(0.01)
+        live.leave_live_session("s1", "v")  # Queued behind the end
+        assert "v" in live.manager.live_sessions["s1"]
+        await live.handle_chat_message("s1", "v", "too late")
+        await ending
+
+        assert "s1" not in live.manager.live_sessions and "s1" not in live.actors
+        assert "chat_batch" not in [m["type"] for m in host.sent]
+        assert host.sent[-1]["type"] == "session_ended"
+        await asyncio.sleep(0)
+        assert actor.task.done()
+
+    asyncio.run(scenario())
+
+
+def test_join_queued_behind_the_session_end_keeps_the_actor(monkeypatch):
+    """The actor isn't closed while a command is still queued on it, so there is never a second one"""
+    from app import live_events
+    store = live_events.ChatStore()
+
+    async def slow_flush(session_id=None):
+        await asyncio.sleep(0.05)
+    store.flush = slow_flush
+    monkeypatch.setattr("app.websocket_manager.chat_store", store)
+
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        await live.join_live_session(FakeWebSocket(), "s1", "host", "host", role="host")
+        actor = live.actors["s1"]
+
+        ending = asyncio.create_task(live.handle_session_ended("s1"))
+        await asyncio.sleep(0.01)
+        late = FakeWebSocket()
+        joining = asyncio.create_task(live.join_live_session(late, "s1", "late", "late"))
+        await ending
+        assert live.actors["s1"] is actor and not actor.closed
+        await joining
+
+        assert "late" in live.manager.live_sessions["s1"]
+        assert live.actors["s1"] is actor and not actor.closed
+        live.leave_live_session("s1", "late")
+        await asyncio.sleep(0)
+        assert "s1" not in live.actors and actor.closed and not live.pending_calls
+
+    asyncio.run(scenario())
+
+
+def test_media_status_change_runs_on_the_session_actor():
+    """A participant's own audio/video toggle updates their state and is announced to the session"""
+    async def scenario():
+        live = LiveStreamManager(ConnectionManager())
+        host, guest = FakeWebSocket(), FakeWebSocket()
+        await live.join_live_session(host, "s1", "host", "host", role="host")
+        await live.join_live_session(guest, "s1", "g", "guest", role="guest")
+
+        await live.update_media_status("s1", "g", False, None)
+        await asyncio.sleep(0)
+
+        participant = live.manager.live_sessions["s1"]["g"]
+        assert participant.audio_enabled is False and participant.video_enabled is True
+        assert host.sent[-1] == {"type": "participant_media_changed", "user_id": "g",
+                                 "audio_enabled": False, "video_enabled": None}
+        assert live.actors["s1"].stats["commands"] >= 1
+
+    asyncio.run(scenario())
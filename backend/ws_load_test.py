@@ -0,0 +1,285 @@
+"""
+WebSocket Load Generator & Capacity Benchmark for TrendKe
+Run: python ws_load_test.py [--connect 1000] [--viewers 5000] [--duration 10]
+
+Runs in-process against the FastAPI app: every client is an ASGI WebSocket
+(scope/receive/send driven directly), so no server or network is needed and
+the numbers are the app's own cost. Clients authenticate with real JWTs.
+
+- N clients on /ws/connect, M on /ws/live/{session_id}
+- chat, reactions and targeted WebRTC signals at the configured rates, plus
+  server broadcasts to /ws/connect clients
+- reports fan-out latency percentiles (send → receive, sampled clients),
+  server memory per connection (tracemalloc over the connect phase) and
+  frames dropped/coalesced by the slow-consumer policy
+
+Only the WebSocket machinery is started (broker, ticker); database writers are
+not, so persisted chat stays buffered in memory as it would with a slow DB.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import random
+import time
+import tracemalloc
+from typing import List, Optional
+from urllib.parse import urlencode
+
+from app.main import app
+from app.auth import create_access_token
+from app.websocket_manager import ws_manager, live_manager
+from app.ws_connection import MSGPACK_SUBPROTOCOL, HAS_MSGPACK
+
+if HAS_MSGPACK:
+    import msgpack
+
+
+class LoadClient:
+    """One ASGI WebSocket client driving the app directly"""
+
+    def __init__(self, path: str, query: dict, sample: bool, use_msgpack: bool = False):
+        self.sample = sample  # Decode everything and record latencies (expensive at scale)
+        self.subprotocols = [MSGPACK_SUBPROTOCOL] if use_msgpack else []
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "http_version": "1.1",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": urlencode(query).encode(),
+            "headers": [(b"host", b"loadtest")] + (
+                [(b"sec-websocket-protocol", ", ".join(self.subprotocols).encode())] if self.subprotocols else []
+            ),
+            "subprotocols": self.subprotocols,
+            "client": ("127.0.0.1", 0),
+            "server": ("loadtest", 80),
+        }
+        self.inbound: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.frames = 0
+        self.latencies: List[float] = []
+
+    async def start(self):
+        self.inbound.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.create_task(app(self.scope, self.inbound.get, self._on_send))
+        await self.accepted.wait()
+
+    async def _on_send(self, event: dict):
+        kind = event["type"]
+        if kind == "websocket.accept":
+            self.accepted.set()
+        elif kind == "websocket.close":
+            self.closed = True
+            self.accepted.set()
+        elif kind == "websocket.send":
+            self.frames += 1
+            self._on_frame(event.get("text"), event.get("bytes"))
+
+    def _on_frame(self, text: Optional[str], data: Optional[bytes]):
+        if not self.sample and ('"ping"' not in text if text is not None else b"ping" not in data):
+            return  # Counted only; most clients skip decoding
+        message = json.loads(text) if text is not None else msgpack.unpackb(data)
+        kind = message.get("type")
+        if kind == "ping":
+            self.send({"action": "pong"})
+        elif kind == "chat_batch":
+            now = time.perf_counter()
+            for chat in message["messages"]:
+                if chat["message"].startswith("lt:"):
+                    self.latencies.append(now - float(chat["message"][3:]))
+        elif kind == "load_test":
+            self.latencies.append(time.perf_counter() - message["sent"])
+
+    def send(self, message: dict):
+        if self.subprotocols:
+            self.inbound.put_nowait({"type": "websocket.receive", "bytes": msgpack.packb(message)})
+        else:
+            self.inbound.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def close(self):
+        self.inbound.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        if self.task:
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(self.task, 5)
+
+
+async def start_all(clients: List[LoadClient], chunk: int = 64):
+    for i in range(0, len(clients), chunk):
+        await asyncio.gather(*(client.start() for client in clients[i:i + chunk]))
+
+
+async def at_rate(rate: float, until: float, action):
+    """Call action() `rate` times per second until the deadline"""
+    if rate <= 0:
+        return
+    interval = 1 / rate
+    next_at = time.perf_counter()
+    while next_at < until:
+        action()
+        next_at += interval
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    session_id = "load-test-session"
+    sample_every = max(1, (args.connect + args.viewers) // max(args.sample, 1))
+
+    def token(user_id: str) -> str:
+        return create_access_token({"sub": user_id})
+
+    connect_clients = [
+        LoadClient("/ws/connect", {"token": token(f"load-c{i}")}, i % sample_every == 0, args.msgpack)
+        for i in range(args.connect)
+    ]
+    live_clients = [
+        LoadClient(f"/ws/live/{session_id}", {"token": token(f"load-v{i}"), "username": f"viewer{i}"},
+                   i % sample_every == 0, args.msgpack)
+        for i in range(args.viewers)
+    ]
+
+    await ws_manager.start_broker()
+    ws_manager.start_ticker()
+
+    # Connect phase (server memory measured here only; tracemalloc slows everything down)
+    tracemalloc.start()
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    await start_all(connect_clients)
+    await start_all(live_clients)
+    connect_seconds = time.perf_counter() - start
+    await asyncio.sleep(0.2)
+    gc.collect()
+    server_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    rejected = sum(1 for client in connect_clients + live_clients if client.closed)
+    until = time.perf_counter() + args.duration
+    sent = {"chat": 0, "reaction": 0, "signal": 0, "broadcast": 0}
+
+    def chat():
+        random.choice(live_clients).send({"action": "chat", "message": f"lt:{time.perf_counter()}"})
+        sent["chat"] += 1
+
+    def reaction():
+        random.choice(live_clients).send({"action": "reaction", "reaction": random.choice(["❤️", "🔥", "😂"])})
+        sent["reaction"] += 1
+
+    def signal():
+        # Stage-sized peer set: the first few viewers signal each other directly
+        peers = live_clients[:max(2, args.peers)]
+        sender, target = random.sample(range(len(peers)), 2)
+        peers[sender].send({
+            "action": "webrtc_signal",
+            "to_user_id": f"load-v{target}",
+            "signal_type": "ice_candidate",
+            "signal_data": {"candidate": "candidate:1 1 udp 2122260223 10.0.0.1 54321 typ host", "sdpMid": "0"}
+        })
+        sent["signal"] += 1
+
+    def broadcast():
+        asyncio.ensure_future(ws_manager.broadcast({"type": "load_test", "sent": time.perf_counter()}))
+        sent["broadcast"] += 1
+
+    drivers = []
+    if live_clients:
+        drivers += [at_rate(args.chat_rate, until, chat), at_rate(args.reaction_rate, until, reaction)]
+        if len(live_clients) >= 2:
+            drivers.append(at_rate(args.signal_rate, until, signal))
+    if connect_clients:
+        drivers.append(at_rate(args.broadcast_rate, until, broadcast))
+    await asyncio.gather(*drivers)
+    await asyncio.sleep(0.5)  # Let the last batches drain
+
+    live_latencies = [lat for client in live_clients for lat in client.latencies]
+    connect_latencies = [lat for client in connect_clients for lat in client.latencies]
+    session_stats = live_manager.get_session_delivery_stats(session_id)
+    frames = sum(client.frames for client in connect_clients + live_clients)
+
+    await asyncio.gather(*(client.close() for client in connect_clients + live_clients))
+    await live_manager.stop_actors()
+    await ws_manager.stop_ticker()
+    await ws_manager.stop_broker()
+
+    return {
+        "connections": len(connect_clients) + len(live_clients),
+        "rejected": rejected,
+        "connect_seconds": connect_seconds,
+        "bytes_per_connection": server_bytes / max(1, len(connect_clients) + len(live_clients)),
+        "sent": sent,
+        "frames": frames,
+        "live_latencies": live_latencies,
+        "connect_latencies": connect_latencies,
+        "session": session_stats,
+        "delivery": dict(ws_manager.delivery_metrics)
+    }
+
+
+def report(args, r: dict):
+    print(f"\n{'='*60}")
+    print(f"🚀 {r['connections']} connections ({args.connect} /ws/connect, {args.viewers} live), "
+          f"{args.duration:.0f}s, codec: {'msgpack' if args.msgpack else 'json'}")
+    print(f"{'='*60}")
+    print(f"Connect:  {r['connect_seconds']:.2f}s total, {r['rejected']} rejected")
+    print(f"Memory:   {r['bytes_per_connection'] / 1024:.1f} KB server-side per connection")
+    print(f"Sent:     {r['sent']['chat']} chat, {r['sent']['reaction']} reactions, "
+          f"{r['sent']['signal']} signals, {r['sent']['broadcast']} broadcasts")
+    print(f"Frames:   {r['frames']} delivered to clients")
+
+    print(f"\n{'fan-out latency ms':<22} {'samples':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    print("─" * 67)
+    for name, values in (("live chat", r["live_latencies"]), ("/ws/connect broadcast", r["connect_latencies"])):
+        ms = [v * 1000 for v in values]
+        print(f"{name:<22} {len(ms):>9} {percentile(ms, 50):>8.1f} {percentile(ms, 95):>8.1f} "
+              f"{percentile(ms, 99):>8.1f} {max(ms, default=0):>8.1f}")
+
+    session = r["session"]
+    print("\nDropped / limited:")
+    print(f"  live frames dropped {session.get('dropped', 0)}, coalesced {session.get('coalesced', 0)}, "
+          f"slow clients disconnected {session.get('slow_disconnects', 0)}")
+    print(f"  chat dropped by room cap {session.get('chat', {}).get('dropped', 0)}, "
+          f"throttled {session.get('throttled', {})}")
+    print(f"  /ws/connect frames dropped {r['delivery'].get('dropped', 0)}, "
+          f"coalesced {r['delivery'].get('coalesced', 0)}")
+    if args.chat_rate and r["live_latencies"]:
+        print("\n(chat latency includes the chat batch window)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connect", type=int, default=1000, help="clients on /ws/connect")
+    parser.add_argument("--viewers", type=int, default=5000, help="clients in one live session")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    parser.add_argument("--chat-rate", type=float, default=20, help="chat messages per second (session total)")
+    parser.add_argument("--reaction-rate", type=float, default=100, help="reactions per second")
+    parser.add_argument("--signal-rate", type=float, default=50, help="WebRTC signals per second")
+    parser.add_argument("--peers", type=int, default=4, help="live clients exchanging signals")
+    parser.add_argument("--broadcast-rate", type=float, default=2, help="server broadcasts per second to /ws/connect")
+    parser.add_argument("--sample", type=int, default=200, help="clients that decode frames and record latency")
+    parser.add_argument("--msgpack", action="store_true", help="offer the msgpack subprotocol")
+    args = parser.parse_args()
+
+    if args.msgpack and not HAS_MSGPACK:
+        parser.error("msgpack is not installed")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = asyncio.run(run(args))
+    report(args, result)
+
+
+if __name__ == "__main__":
+    main()
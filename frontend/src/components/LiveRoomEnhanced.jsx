@@ -55,19 +55,30 @@ const LiveRoomEnhanced = () => {
   // Only create WebSocket URL when we have session data
   const [wsUrl, setWsUrl] = useState(null);
 
-  // Update WebSocket URL when session loads
+  // Resume token ("{history_epoch}.{last seq}") so a reconnect only replays missed chat
+  const historyEpochRef = useRef(null);
+  const lastSeqRef = useRef(0);
+
+  // Update WebSocket URL when session loads (not on other session changes such as a promotion)
+  const hostUsername = session?.host_username;
   useEffect(() => {
-    if (sessionId && token && (user.username || session?.host_username)) {
-      const username = user.username || session?.host_username || 'Guest';
+    if (sessionId && token && (user.username || hostUsername)) {
+      const username = user.username || hostUsername || 'Guest';
       const url = `${WS_BASE}/ws/live/${sessionId}?token=${token}&username=${encodeURIComponent(username)}`;
       console.log('🔍 WebSocket URL ready:', url.replace(token, '***'));
       setWsUrl(url);
     } else {
       console.warn('⚠️ Missing data for WebSocket - sessionId:', sessionId, 'token:', !!token, 'username:', user.username);
     }
-  }, [sessionId, token, session, user.username]);
+  }, [sessionId, token, hostUsername, user.username]);
+
+  // Every (re)connect sends the resume token, so a reconnect only replays missed chat
+  const getWsUrl = () => {
+    const resume = historyEpochRef.current ? `&resume=${historyEpochRef.current}.${lastSeqRef.current}` : '';
+    return `${wsUrl}${resume}`;
+  };
 
-  const { isConnected, send: sendWS } = useWebSocket(wsUrl, handleWebSocketMessage);
+  const { isConnected, send: sendWS } = useWebSocket(wsUrl, handleWebSocketMessage, { getUrl: getWsUrl });
 
   useEffect(() => {
     fetchSessionDetails();
@@ -87,9 +98,13 @@ const LiveRoomEnhanced = () => {
 
     switch (data.type) {
       case 'current_participants':
-        // Initial participant list
+        // Initial participant list (recent chat follows as replayed chat_batch frames)
         handleCurrentParticipants(data.participants);
         setViewerCount(data.viewer_count);
+        if (historyEpochRef.current !== data.history_epoch) {
+          historyEpochRef.current = data.history_epoch;
+          lastSeqRef.current = 0;
+        }
         break;
 
       case 'user_joined':
@@ -102,14 +117,37 @@ const LiveRoomEnhanced = () => {
         setViewerCount(data.viewer_count);
         break;
 
+      case 'viewer_count':
+        // Coalesced count, sent at most once per second
+        setViewerCount(data.viewer_count);
+        break;
+
       case 'chat_message':
         handleChatMessage(data);
         break;
 
+      case 'chat_batch':
+        handleChatBatch(data);
+        break;
+
       case 'reaction':
         handleReaction(data);
         break;
 
+      case 'reaction_summary':
+        handleReactionSummary(data);
+        break;
+
+      case 'rate_limited':
+        toast.error(data.slow_mode
+          ? `Slow mode is on: you can send a message every ${data.slow_mode}s`
+          : `You're sending messages too fast, try again in ${Math.ceil(data.retry_after)}s`);
+        break;
+
+      case 'slow_mode_changed':
+        toast(data.seconds ? `Slow mode on (${data.seconds}s) by ${data.by}` : `Slow mode off`);
+        break;
+
       case 'guest_request':
         handleGuestRequest(data);
         break;
@@ -266,6 +304,44 @@ const LiveRoomEnhanced = () => {
     }, 100);
   }
 
+  function handleChatBatch(data) {
+    if (data.seq) {
+      lastSeqRef.current = Math.max(lastSeqRef.current, data.seq);
+    }
+
+    // One state update per batch instead of one per message; replays can repeat messages
+    setChatMessages(prev => {
+      const seen = new Set(prev.map(m => m.id));
+      const incoming = data.messages
+        .filter(m => !m.id || !seen.has(m.id))
+        .map(m => ({
+          id: m.id || Date.now() + Math.random(),
+          user_id: m.user_id,
+          username: m.username,
+          message: m.message,
+          timestamp: m.timestamp
+        }));
+      return incoming.length ? [...prev, ...incoming] : prev;
+    });
+
+    setTimeout(() => {
+      const chatContainer = document.querySelector('.chat-messages');
+      if (chatContainer) {
+        chatContainer.scrollTop = chatContainer.scrollHeight;
+      }
+    }, 100);
+  }
+
+  function handleReactionSummary(data) {
+    // Counts since the last summary; animate a few of each, not one per tap
+    const names = { heart: '❤️', like: '👍', fire: '🔥', clap: '👏', wow: '😮', sad: '😢' };
+    Object.entries(data.counts || {}).forEach(([reaction, count]) => {
+      for (let i = 0; i < Math.min(count, 5); i++) {
+        setTimeout(() => handleReaction({ reaction: names[reaction] || reaction }), i * 120);
+      }
+    });
+  }
+
   function handleReaction(data) {
     console.log('💖 Reaction:', data.reaction, 'from', data.username);
     
@@ -344,6 +420,10 @@ const LiveRoomEnhanced = () => {
       case 'ice_candidate':
         webrtcManagerRef.current.handleIceCandidate(from_user_id, signal_data);
         break;
+      
+      case 'ice_candidates':
+        webrtcManagerRef.current.handleIceCandidates(from_user_id, signal_data.candidates);
+        break;
     }
   }
 
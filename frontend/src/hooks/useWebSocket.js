@@ -1,20 +1,35 @@
 /**
- * Simple WebSocket Hook - Fresh Implementation
- * No complex reconnection logic, just clean connection management
+ * WebSocket Hook
+ * Connects while `url` is set and reconnects with backoff when the connection
+ * drops. Pass `getUrl` to build the URL for each attempt (e.g. to add a resume
+ * token); `url` then only decides whether to connect.
  */
 
 import { useEffect, useRef, useState } from 'react';
 
-export const useWebSocket = (url, onMessage) => {
+// Keeps the server-side presence fresh (server buckets are 30s)
+const HEARTBEAT_INTERVAL_MS = 25000;
+
+// Reconnect delays double from the first up to the max
+const RECONNECT_BASE_MS = 1000;
+const RECONNECT_MAX_MS = 30000;
+
+// Closes a reconnect can't fix: normal close (kicked, session ended, replaced by
+// a newer connection), authentication failure, session full
+const NO_RECONNECT_CODES = new Set([1000, 1008, 1013]);
+
+export const useWebSocket = (url, onMessage, { getUrl } = {}) => {
   const [isConnected, setIsConnected] = useState(false);
   const wsRef = useRef(null);
   const onMessageRef = useRef(onMessage);
-  const connectionAttemptedRef = useRef(false);
+  const getUrlRef = useRef(getUrl);
+  const heartbeatRef = useRef(null);
 
-  // Keep callback ref updated without triggering reconnects
+  // Keep callback refs updated without triggering reconnects
   useEffect(() => {
     onMessageRef.current = onMessage;
-  }, [onMessage]);
+    getUrlRef.current = getUrl;
+  }, [onMessage, getUrl]);
 
   useEffect(() => {
     if (!url) {
@@ -22,27 +37,60 @@ export const useWebSocket = (url, onMessage) => {
       return;
     }
 
-    // Prevent duplicate connections
-    if (connectionAttemptedRef.current && wsRef.current) {
-      console.log('⚠️ Connection already exists, skipping');
-      return;
-    }
+    let stopped = false;
+    let attempts = 0;
+    let reconnectTimer = null;
+
+    const stopHeartbeat = () => {
+      if (heartbeatRef.current) {
+        clearInterval(heartbeatRef.current);
+        heartbeatRef.current = null;
+      }
+    };
+
+    const scheduleReconnect = () => {
+      const delay = Math.min(RECONNECT_MAX_MS, RECONNECT_BASE_MS * 2 ** attempts);
+      attempts += 1;
+      console.log(`🔁 Reconnecting WebSocket in ${delay}ms (attempt ${attempts})`);
+      reconnectTimer = setTimeout(connect, delay);
+    };
 
-    connectionAttemptedRef.current = true;
-    console.log('🔌 Attempting WebSocket connection to:', url.replace(/token=[^&]+/, 'token=***'));
+    function connect() {
+      reconnectTimer = null;
+      const target = (getUrlRef.current && getUrlRef.current()) || url;
+      console.log('🔌 Attempting WebSocket connection to:', target.replace(/token=[^&]+/, 'token=***'));
 
-    try {
-      const ws = new WebSocket(url);
+      let ws;
+      try {
+        ws = new WebSocket(target);
+      } catch (error) {
+        console.error('❌ Failed to create WebSocket:', error);
+        scheduleReconnect();
+        return;
+      }
       wsRef.current = ws;
 
       ws.onopen = () => {
         console.log('✅ WebSocket CONNECTED!');
+        attempts = 0;
         setIsConnected(true);
+
+        stopHeartbeat();
+        heartbeatRef.current = setInterval(() => {
+          if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({ action: 'ping' }));
+          }
+        }, HEARTBEAT_INTERVAL_MS);
       };
 
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
+          if (data.type === 'ping') {
+            // Server heartbeat: unanswered pings get the socket closed
+            ws.send(JSON.stringify({ action: 'pong' }));
+            return;
+          }
           if (data.type !== 'pong' && onMessageRef.current) {
             onMessageRef.current(data);
           }
@@ -57,21 +105,28 @@ export const useWebSocket = (url, onMessage) => {
 
       ws.onclose = (event) => {
         console.log('🔌 WebSocket CLOSED - Code:', event.code, 'Reason:', event.reason || 'No reason provided');
+        stopHeartbeat();
         setIsConnected(false);
-        wsRef.current = null;
-        connectionAttemptedRef.current = false;
+        if (wsRef.current === ws) {
+          wsRef.current = null;
+        }
+        if (!stopped && !NO_RECONNECT_CODES.has(event.code)) {
+          scheduleReconnect();
+        }
       };
-    } catch (error) {
-      console.error('❌ Failed to create WebSocket:', error);
-      connectionAttemptedRef.current = false;
     }
 
-    // Cleanup on unmount
+    connect();
+
+    // Cleanup on unmount or URL change
     return () => {
       console.log('🧹 Cleaning up WebSocket...');
-      connectionAttemptedRef.current = false;
-      if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      stopped = true;
+      clearTimeout(reconnectTimer);
+      stopHeartbeat();
+      if (wsRef.current) {
         wsRef.current.close();
+        wsRef.current = null;
       }
     };
   }, [url]); // ONLY url as dependency!
@@ -245,6 +245,16 @@ class WebRTCManager {
     }
   }
 
+  /**
+   * Handle a batch of ICE candidates (the server groups trickle candidates per peer)
+   */
+  async handleIceCandidates(userId, candidates) {
+    for (const candidateData of candidates || []) {
+      await this.handleIceCandidate(userId, candidateData);
+    }
+    return true;
+  }
+
   /**
    * Remove peer connection for user who left
    */